@@ -1,8 +1,36 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from .routes import router
+from .clients import close_clients, start_clients
+from .config import FAST_START
+from .executor import pricing_executor
+from .metrics import MetricsMiddleware
+from .retrain import retrainer
+from .routes import JSONOut, router
+from .warmup import warmup
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_clients()
+    pricing_executor.start()
+    task = warmup.start()
+    if not FAST_START:
+        await task
+    retrainer.start()
+    try:
+        yield
+    finally:
+        await retrainer.stop()
+        await warmup.stop()
+        pricing_executor.shutdown()
+        await close_clients()
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="Reliant AI", version="0.2.0")
+    app = FastAPI(
+        title="Reliant AI", version="0.2.0", lifespan=lifespan, default_response_class=JSONOut
+    )
+    app.add_middleware(MetricsMiddleware)
     app.include_router(router, prefix="")
     return app
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .kernel import PricingKernel
+
+# Bump when the payload layout below changes.
+ARTIFACT_FORMAT = 1
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(spec: Dict[str, Any]) -> str:
+    """Stable hash of everything that determines the trained artifact."""
+    import numpy
+    import sklearn
+
+    doc = {
+        "format": ARTIFACT_FORMAT,
+        "spec": spec,
+        "sklearn": sklearn.__version__,
+        "numpy": numpy.__version__,
+    }
+    return hashlib.sha256(json.dumps(doc, sort_keys=True).encode()).hexdigest()
+
+
+def _meta_path(path: Path) -> Path:
+    return path.with_name(path.name + ".json")
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def save(path: Path, payload: Dict[str, Any], spec: Dict[str, Any], **info: Any) -> Dict[str, Any]:
+    """
+    Pickle ``payload`` to ``path`` with a JSON sidecar holding its fingerprint,
+    checksum and ``info`` (e.g. the model ``version``).
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    blob = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+    meta = {
+        "format": ARTIFACT_FORMAT,
+        "fingerprint": fingerprint(spec),
+        "sha256": hashlib.sha256(blob).hexdigest(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "spec": spec,
+        **info,
+    }
+    # Payload first: a reader only trusts it once the matching sidecar lands.
+    _atomic_write(path, blob)
+    _atomic_write(_meta_path(path), json.dumps(meta, indent=2).encode())
+    return meta
+
+
+def read_meta(path: Path) -> Optional[Dict[str, Any]]:
+    """The artifact's sidecar, or None if it is missing or unreadable."""
+    try:
+        return json.loads(_meta_path(path).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def load(path: Path, spec: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the stored payload, or None if it is missing, stale or corrupt."""
+    try:
+        meta = json.loads(_meta_path(path).read_text())
+        blob = path.read_bytes()
+    except (OSError, ValueError):
+        return None
+    if meta.get("fingerprint") != fingerprint(spec):
+        logger.info("Model artifact %s is stale; retraining.", path)
+        return None
+    if hashlib.sha256(blob).hexdigest() != meta.get("sha256"):
+        logger.warning("Model artifact %s failed its checksum; retraining.", path)
+        return None
+    try:
+        return pickle.loads(blob)
+    except Exception as e:
+        logger.warning("Model artifact %s could not be unpickled (%s); retraining.", path, e)
+        return None
+
+
+def load_or_build(
+    path: Path | str,
+    spec: Dict[str, Any],
+    build: Callable[[], Tuple[Any, PricingKernel]],
+    force: bool = False,
+    version: Optional[Callable[[PricingKernel], str]] = None,
+) -> Tuple[Any, PricingKernel]:
+    """
+    Load ``(model, kernel)`` from ``path``; call ``build()`` and persist the
+    result when the artifact is missing, stale, corrupt, or ``force`` is set.
+    ``version(kernel)``, if given, is recorded in the sidecar of a new build.
+    """
+    path = Path(path)
+    payload = None if force else load(path, spec)
+    if payload is not None:
+        return payload["model"], PricingKernel.from_state(payload["kernel"])
+
+    model, kernel = build()
+    try:
+        info = {"version": version(kernel)} if version is not None else {}
+        save(path, {"model": model, "kernel": kernel.to_state()}, spec, **info)
+    except OSError as e:  # read-only image etc.; still serve the fresh model
+        logger.warning("Could not write model artifact %s: %s", path, e)
+    return model, kernel
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Build step: ``python -m app.artifact [--force]`` from ``ai_service/``."""
+    parser = argparse.ArgumentParser(description="Train and persist the pricing model.")
+    parser.add_argument("--force", action="store_true", help="retrain even if up to date")
+    args = parser.parse_args(argv)
+
+    from .config import MODEL_ARTIFACT_PATH
+    from .pricing import TRAINING_SPEC, build, kernel_version
+
+    load_or_build(MODEL_ARTIFACT_PATH, TRAINING_SPEC, build, force=args.force, version=kernel_version)
+    print(_meta_path(Path(MODEL_ARTIFACT_PATH)).read_text())
+
+
+if __name__ == "__main__":
+    main()
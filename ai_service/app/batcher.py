@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from .config import PRICING_BATCH_MAX_ITEMS, PRICING_BATCH_WINDOW_MS
+
+# Histogram upper bounds: items per model call, and ms spent waiting for a flush.
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, float("inf"))
+QUEUE_DELAY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, float("inf"))
+
+_Pending = Tuple[Sequence[Any], "asyncio.Future[List[float]]", float]
+
+
+class _Histogram:
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * len(self.bounds)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, v: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, v)] += 1
+        self.total += v
+        self.n += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "buckets": {str(b): c for b, c in zip(self.bounds, self.counts)},
+            "count": self.n,
+            "mean": self.total / self.n if self.n else 0.0,
+        }
+
+
+class MicroBatcher:
+    """
+    Merge pricing work from concurrent requests into one model call.
+
+    Submissions are held for up to ``window_s`` (or until ``max_items`` rows
+    are waiting), then ``run`` is called once with every row and each caller
+    gets back its own slice, in order. A failure in ``run`` is raised to every
+    caller in that batch.
+    """
+
+    def __init__(
+        self,
+        run: Callable[[List[Any]], Awaitable[Sequence[float]]],
+        window_s: float = PRICING_BATCH_WINDOW_MS / 1000.0,
+        max_items: int = PRICING_BATCH_MAX_ITEMS,
+    ):
+        self.run = run
+        self.window_s = window_s
+        self.max_items = max_items
+        self.batch_sizes = _Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_delay_ms = _Histogram(QUEUE_DELAY_BUCKETS_MS)
+        self._queue: List[_Pending] = []
+        self._queued_items = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, rows: Sequence[Any]) -> List[float]:
+        if not rows:
+            return []
+        loop = asyncio.get_running_loop()
+        fut: "asyncio.Future[List[float]]" = loop.create_future()
+        self._queue.append((rows, fut, time.monotonic()))
+        self._queued_items += len(rows)
+        if self._queued_items >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_s, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._queue, self._queued_items = self._queue, [], 0
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[_Pending]) -> None:
+        now = time.monotonic()
+        flat: List[Any] = []
+        for rows, _, queued_at in batch:
+            flat.extend(rows)
+            self.queue_delay_ms.observe((now - queued_at) * 1000.0)
+        self.batch_sizes.observe(len(flat))
+        try:
+            out = list(await self.run(flat))
+        except Exception as e:
+            for _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        start = 0
+        for rows, fut, _ in batch:
+            if not fut.done():  # caller may have gone away
+                fut.set_result(out[start:start + len(rows)])
+            start += len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window_s * 1000.0,
+            "max_items": self.max_items,
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_delay_ms": self.queue_delay_ms.snapshot(),
+        }
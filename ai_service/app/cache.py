@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Protocol, Sequence, Tuple
+
+from .config import (
+    SUMMARY_CACHE_BACKEND,
+    SUMMARY_CACHE_MAX_BYTES,
+    SUMMARY_CACHE_MAX_ENTRIES,
+    SUMMARY_CACHE_PATH,
+    SUMMARY_CACHE_TTL_S,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def summary_key(system: str, user: str, models: Sequence[str]) -> str:
+    """Content address of a summary: the exact prompts plus the models that may answer."""
+    doc = json.dumps([system, user, list(models)], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(doc.encode()).hexdigest()
+
+
+class CacheBackend(Protocol):
+    def get(self, key: str) -> Optional[Tuple[str, float]]: ...
+    def set(self, key: str, value: str, expires_at: float) -> None: ...
+    def delete(self, key: str) -> None: ...
+    def __len__(self) -> int: ...
+
+
+class MemoryBackend:
+    """In-process LRU bounded by entry count and total payload bytes."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._data: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(key: str, value: str) -> int:
+        return len(key) + len(value.encode())
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        size = self._size(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.nbytes -= self._size(key, old[0])
+            self._data[key] = (value, expires_at)
+            self.nbytes += size
+            while len(self._data) > self.max_entries or self.nbytes > self.max_bytes:
+                k, (v, _) = self._data.popitem(last=False)
+                self.nbytes -= self._size(k, v)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.nbytes -= self._size(key, old[0])
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """
+    File-backed LRU shared by every worker process on the host, bounded by
+    entry count and total payload bytes. Reads never write: recency updates
+    are buffered and flushed in one transaction at most every
+    ``touch_interval_s`` (or with the next write). Calls block on the file
+    lock, so async code goes through :meth:`SummaryCache.aget`/``aset``.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int, max_bytes: int = SUMMARY_CACHE_MAX_BYTES,
+                 touch_interval_s: float = 30.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.touch_interval_s = touch_interval_s
+        self._touched: Dict[str, float] = {}
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=1.0, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS summary_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, used_at REAL NOT NULL, nbytes INTEGER NOT NULL DEFAULT 0)"
+        )
+        cols = {row[1] for row in self._db.execute("PRAGMA table_info(summary_cache)")}
+        if "nbytes" not in cols:  # file created before the byte cap
+            self._db.execute("ALTER TABLE summary_cache ADD COLUMN nbytes INTEGER NOT NULL DEFAULT 0")
+            self._db.execute("UPDATE summary_cache SET nbytes = length(key) + length(CAST(value AS BLOB))")
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_summary_used ON summary_cache(used_at)")
+
+    def _flush_touches(self) -> None:
+        if self._touched:
+            touched, self._touched = self._touched, {}
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    "UPDATE summary_cache SET used_at = ? WHERE key = ?",
+                    [(t, k) for k, t in touched.items()],
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        self._flushed_at = time.monotonic()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM summary_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._touched[key] = time.time()
+                if time.monotonic() - self._flushed_at >= self.touch_interval_s:
+                    self._flush_touches()
+            return row
+
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        size = len(key) + len(value.encode())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._touched.pop(key, None)
+            self._flush_touches()
+            self._db.execute("BEGIN")
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO summary_cache VALUES (?, ?, ?, ?, ?)",
+                    (key, value, expires_at, time.time(), size),
+                )
+                # Keep the most recently used rows within both caps.
+                self._db.execute(
+                    "DELETE FROM summary_cache WHERE key IN (SELECT key FROM ("
+                    "SELECT key, ROW_NUMBER() OVER w AS n, SUM(nbytes) OVER w AS total "
+                    "FROM summary_cache WINDOW w AS (ORDER BY used_at DESC)"
+                    ") WHERE n > ? OR total > ?)",
+                    (self.max_entries, self.max_bytes),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._touched.pop(key, None)
+            self._db.execute("DELETE FROM summary_cache WHERE key = ?", (key,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM summary_cache").fetchone()[0]
+
+
+class SummaryCache:
+    """TTL cache of LLM summaries over a pluggable backend, with hit/miss counters."""
+
+    def __init__(self, backend: CacheBackend, ttl_s: float):
+        self.backend = backend
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        entry = None
+        try:
+            entry = self.backend.get(key)
+            if entry is not None and entry[1] < time.time():
+                self.backend.delete(key)
+                entry = None
+        except sqlite3.Error as e:
+            logger.warning("Summary cache read failed: %s", e)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key: str, value: str) -> None:
+        try:
+            self.backend.set(key, value, time.time() + self.ttl_s)
+        except sqlite3.Error as e:
+            logger.warning("Summary cache write failed: %s", e)
+
+    # Event-loop entry points: blocking backends run on a worker thread.
+    async def aget(self, key: str) -> Optional[str]:
+        if getattr(self.backend, "blocking", False):
+            return await asyncio.to_thread(self.get, key)
+        return self.get(key)
+
+    async def aset(self, key: str, value: str) -> None:
+        if getattr(self.backend, "blocking", False):
+            await asyncio.to_thread(self.set, key, value)
+        else:
+            self.set(key, value)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self.backend),
+        }
+
+
+def make_summary_cache() -> Optional[SummaryCache]:
+    """Build the cache selected by SUMMARY_CACHE_BACKEND (memory | sqlite | off)."""
+    if SUMMARY_CACHE_BACKEND == "off":
+        return None
+    if SUMMARY_CACHE_BACKEND == "sqlite":
+        backend: CacheBackend = SQLiteBackend(
+            SUMMARY_CACHE_PATH, SUMMARY_CACHE_MAX_ENTRIES, SUMMARY_CACHE_MAX_BYTES
+        )
+    else:
+        backend = MemoryBackend(SUMMARY_CACHE_MAX_ENTRIES, SUMMARY_CACHE_MAX_BYTES)
+    return SummaryCache(backend, SUMMARY_CACHE_TTL_S)
+
+
+summary_cache = make_summary_cache()
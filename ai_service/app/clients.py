@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import importlib.util
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+
+from .config import HTTP_TIMEOUT, LLM_HTTP2, LLM_KEEPALIVE_EXPIRY, PROVIDER_POOL_LIMITS
+
+logger = logging.getLogger(__name__)
+
+# One long-lived client per LLM provider, opened/closed by the app lifespan.
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def provider_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        HTTP_TIMEOUT,
+        connect=min(5.0, HTTP_TIMEOUT),
+        read=HTTP_TIMEOUT,
+        write=HTTP_TIMEOUT,
+    )
+
+
+def _http2_enabled() -> bool:
+    if LLM_HTTP2 and importlib.util.find_spec("h2") is None:
+        logger.warning("LLM_HTTP2 is set but the 'h2' package is missing; using HTTP/1.1.")
+        return False
+    return LLM_HTTP2
+
+
+def _make_client(provider: str, http2: bool) -> httpx.AsyncClient:
+    max_conn, max_keepalive = PROVIDER_POOL_LIMITS[provider]
+    limits = httpx.Limits(
+        max_connections=max_conn,
+        max_keepalive_connections=max_keepalive,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(timeout=provider_timeout(), limits=limits, http2=http2)
+
+
+async def start_clients() -> None:
+    """Open a pooled keep-alive client per provider (idempotent)."""
+    http2 = _http2_enabled()
+    for provider in PROVIDER_POOL_LIMITS:
+        if provider not in _clients:
+            _clients[provider] = _make_client(provider, http2)
+
+
+async def close_clients() -> None:
+    clients = list(_clients.values())
+    _clients.clear()
+    for c in clients:
+        await c.aclose()
+
+
+def get_client(provider: str) -> Optional[httpx.AsyncClient]:
+    """Pooled client for ``provider``, or None outside the app lifespan."""
+    return _clients.get(provider)
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """Open/idle connections per provider pool (read from httpx's transport)."""
+    out = {}
+    for provider, client in _clients.items():
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        conns = list(getattr(pool, "connections", ()))
+        idle = sum(1 for c in conns if c.is_idle())
+        out[provider] = {
+            "open": len(conns),
+            "idle": idle,
+            "active": len(conns) - idle,
+            "max": PROVIDER_POOL_LIMITS[provider][0],
+        }
+    return out
+
+
+async def post(provider: str, url: str, **kwargs) -> httpx.Response:
+    """POST through the provider's pooled client, or a one-off client if none is running."""
+    client = get_client(provider)
+    if client is not None:
+        return await client.post(url, **kwargs)
+    async with httpx.AsyncClient(timeout=provider_timeout()) as c:
+        return await c.post(url, **kwargs)
+
+
+@asynccontextmanager
+async def stream(provider: str, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+    """Streaming request through the provider's pooled client (or a one-off client)."""
+    client = get_client(provider)
+    if client is not None:
+        async with client.stream(method, url, **kwargs) as r:
+            yield r
+        return
+    async with httpx.AsyncClient(timeout=provider_timeout()) as c:
+        async with c.stream(method, url, **kwargs) as r:
+            yield r
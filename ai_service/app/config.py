@@ -1,4 +1,5 @@
 import os
+from pathlib import Path
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
@@ -7,7 +8,133 @@ HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
 OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "openai/gpt-oss-20b:free")
 HF_MODEL = os.getenv("HF_MODEL", "mistralai/Mistral-7B-Instruct-v0.2")
 
+# Provider endpoints (override to point at a proxy or a local stub)
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+HF_BASE_URL = os.getenv("HF_BASE_URL", "https://api-inference.huggingface.co")
+
 # Networking
 HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
 
+# Shared keep-alive clients for LLM providers: (max connections, max idle kept alive)
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+PROVIDER_POOL_LIMITS = {
+    "openrouter": (
+        int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "20")),
+        int(os.getenv("OPENROUTER_MAX_KEEPALIVE", "10")),
+    ),
+    "hf": (
+        int(os.getenv("HF_MAX_CONNECTIONS", "20")),
+        int(os.getenv("HF_MAX_KEEPALIVE", "10")),
+    ),
+}
+
+# Client-side provider limits, to stay under provider quotas: (requests per
+# minute, burst, calls in flight); 0 disables a limit. A provider without
+# capacity is skipped at once for the other provider or the fallback, except
+# on /summarize-quote/batch, which waits up to SUMMARY_BATCH_LIMIT_WAIT_S for
+# a token (leaving one of the burst to interactive calls) before falling back.
+PROVIDER_RATE_LIMITS = {
+    "openrouter": (
+        float(os.getenv("OPENROUTER_RATE_PER_MIN", "18")),
+        int(os.getenv("OPENROUTER_BURST", "3")),
+        int(os.getenv("OPENROUTER_MAX_IN_FLIGHT", "4")),
+    ),
+    "hf": (
+        float(os.getenv("HF_RATE_PER_MIN", "60")),
+        int(os.getenv("HF_BURST", "10")),
+        int(os.getenv("HF_MAX_IN_FLIGHT", "8")),
+    ),
+}
+
 USE_EXTERNAL_LLM = os.getenv("USE_EXTERNAL_LLM", "true").lower() == "true"
+
+# Provider hedging: the second provider starts after the first's rolling p90
+# latency (clamped), and a provider is skipped for CIRCUIT_COOLDOWN_S after
+# CIRCUIT_FAILURES consecutive failures, then gets a single trial call.
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", "100"))
+HEDGE_DEFAULT_DELAY_S = float(os.getenv("HEDGE_DEFAULT_DELAY_S", "1.5"))
+HEDGE_MIN_DELAY_S = float(os.getenv("HEDGE_MIN_DELAY_S", "0.25"))
+HEDGE_MAX_DELAY_S = float(os.getenv("HEDGE_MAX_DELAY_S", "4.0"))
+CIRCUIT_FAILURES = int(os.getenv("CIRCUIT_FAILURES", "3"))
+CIRCUIT_COOLDOWN_S = float(os.getenv("CIRCUIT_COOLDOWN_S", "30"))
+
+# /summarize-quote/stream falls back to the deterministic summary if the
+# provider has not produced any text within this many seconds.
+STREAM_FIRST_TOKEN_S = float(os.getenv("STREAM_FIRST_TOKEN_S", "3.0"))
+
+# /summarize-quote/batch: quotes summarised at once across all batch requests
+# (each races the providers like /summarize-quote), and the most quotes one
+# request may send
+SUMMARY_BATCH_CONCURRENCY = int(os.getenv("SUMMARY_BATCH_CONCURRENCY", "8"))
+SUMMARY_BATCH_MAX_QUOTES = int(os.getenv("SUMMARY_BATCH_MAX_QUOTES", "500"))
+SUMMARY_BATCH_LIMIT_WAIT_S = float(os.getenv("SUMMARY_BATCH_LIMIT_WAIT_S", "15"))
+
+# Synonym tables for product type / material / glazing normalisation
+NORMALIZATION_SYNONYMS_PATH = os.getenv(
+    "NORMALIZATION_SYNONYMS_PATH",
+    str(Path(__file__).resolve().parent / "data" / "synonyms.json"),
+)
+
+# Prompt size: item lines are grouped by configuration (and the smallest
+# groups elided) when the user prompt would exceed PROMPT_TOKEN_BUDGET tokens.
+# PROMPT_TOKENIZER is "estimate" (built in) or "tiktoken" (if installed).
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "estimate").lower()
+
+# Summary cache: "memory" (per worker), "sqlite" (shared file) or "off"
+SUMMARY_CACHE_BACKEND = os.getenv("SUMMARY_CACHE_BACKEND", "memory").lower()
+SUMMARY_CACHE_TTL_S = float(os.getenv("SUMMARY_CACHE_TTL_S", "86400"))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "2048"))
+SUMMARY_CACHE_MAX_BYTES = int(os.getenv("SUMMARY_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+SUMMARY_CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH", "/tmp/reliant-summary-cache.sqlite3")
+
+# Pricing model artifact (trained by `python -m app.artifact`, or on first start)
+MODEL_ARTIFACT_PATH = os.getenv(
+    "MODEL_ARTIFACT_PATH",
+    str(Path(__file__).resolve().parent.parent / "artifacts" / "pricing.pkl"),
+)
+
+# Background retraining: every RETRAIN_INTERVAL_S (0 = only via POST
+# /model/retrain) fit a candidate on RETRAIN_SOURCE ("synthetic", or the path
+# of a CSV/Parquet export of won quote lines with a unit_price column), score
+# it on a RETRAIN_HOLDOUT fraction, and swap it in unless its holdout error is
+# more than RETRAIN_TOLERANCE (relative) worse than the serving model's.
+RETRAIN_SOURCE = os.getenv("RETRAIN_SOURCE", "synthetic")
+RETRAIN_INTERVAL_S = float(os.getenv("RETRAIN_INTERVAL_S", "0"))
+RETRAIN_HOLDOUT = float(os.getenv("RETRAIN_HOLDOUT", "0.2"))
+RETRAIN_TOLERANCE = float(os.getenv("RETRAIN_TOLERANCE", "0.05"))
+
+# Accepted models are written to MODEL_ARTIFACT_PATH. Every MODEL_SYNC_INTERVAL_S
+# each process checks the artifact's sidecar and adopts a model persisted by
+# another replica or worker (0 = only read at start-up).
+MODEL_SYNC_INTERVAL_S = float(os.getenv("MODEL_SYNC_INTERVAL_S", "5"))
+
+# Fast start: load the pricing model in the background after start-up (/ready
+# turns 200 when done). When false, start-up waits for the model.
+FAST_START = os.getenv("FAST_START", "true").lower() == "true"
+
+# Raw predictions memoised per normalised feature tuple (0 disables)
+PREDICTION_MEMO_SIZE = int(os.getenv("PREDICTION_MEMO_SIZE", "50000"))
+
+# Where pricing runs: inline (event loop), thread or process pool. Requests
+# beyond PRICING_MAX_PENDING running/queued jobs get 503 + Retry-After.
+PRICING_BACKEND = os.getenv("PRICING_BACKEND", "thread").lower()
+PRICING_WORKERS = int(os.getenv("PRICING_WORKERS", str(os.cpu_count() or 1)))
+PRICING_MAX_PENDING = int(os.getenv("PRICING_MAX_PENDING", "64"))
+PRICING_RETRY_AFTER_S = float(os.getenv("PRICING_RETRY_AFTER_S", "1"))
+
+# /predict-quote/stream: NDJSON items are priced in chunks of this many lines;
+# longer lines are rejected per line.
+PRICING_STREAM_CHUNK = int(os.getenv("PRICING_STREAM_CHUNK", "1000"))
+PRICING_STREAM_MAX_LINE_BYTES = int(os.getenv("PRICING_STREAM_MAX_LINE_BYTES", "65536"))
+
+# /price-grid: largest width x height matrix computed in one request
+PRICE_GRID_MAX_CELLS = int(os.getenv("PRICE_GRID_MAX_CELLS", "100000"))
+
+# Micro-batching: concurrent pricing requests wait up to this long (or until
+# PRICING_BATCH_MAX_ITEMS rows are queued) and share one model call. 0 disables.
+# Requests of PRICING_BATCH_MAX_ITEMS or more skip it and are priced whole
+# (features, memo, model and rows) in one executor job.
+PRICING_BATCH_WINDOW_MS = float(os.getenv("PRICING_BATCH_WINDOW_MS", "2"))
+PRICING_BATCH_MAX_ITEMS = int(os.getenv("PRICING_BATCH_MAX_ITEMS", "512"))
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from .config import (
+    PRICING_BACKEND,
+    PRICING_MAX_PENDING,
+    PRICING_RETRY_AFTER_S,
+    PRICING_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+T = TypeVar("T")
+
+
+class PricingSaturated(Exception):
+    """Raised instead of queueing when the pricing backend is at capacity."""
+
+    def __init__(self, retry_after_s: float):
+        super().__init__("Pricing backend saturated")
+        self.retry_after_s = retry_after_s
+
+
+def _warm_worker(kernel_state: Optional[Dict[str, Any]] = None, version: Optional[str] = None) -> None:
+    # Load the model once per worker process rather than on its first job.
+    # After a swap the persisted artifact holds ``version``; ``kernel_state``
+    # covers an artifact that could not be written.
+    from . import pricing
+    from .kernel import PricingKernel
+
+    pricing.ensure_loaded()
+    if kernel_state is not None and pricing.model_version() != version:
+        pricing.activate(None, PricingKernel.from_state(kernel_state), source="swap")
+
+
+class PricingExecutor:
+    """
+    Where CPU-bound pricing runs: ``inline`` on the event loop, a ``thread``
+    pool, or a ``process`` pool whose workers preload the model (no GIL shared
+    with the async LLM routes). At most ``max_pending`` jobs may be running or
+    queued; beyond that :meth:`run` raises :class:`PricingSaturated`.
+    """
+
+    def __init__(
+        self,
+        backend: str = PRICING_BACKEND,
+        workers: int = PRICING_WORKERS,
+        max_pending: int = PRICING_MAX_PENDING,
+        retry_after_s: float = PRICING_RETRY_AFTER_S,
+    ):
+        if backend not in ("inline", "thread", "process"):
+            raise ValueError(f"Unknown PRICING_BACKEND: {backend!r}")
+        self.backend = backend
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retry_after_s = retry_after_s
+        self.pending = 0
+        self.rejected = 0
+        self._pool: Optional[Executor] = None
+
+    def start(self) -> None:
+        if self._pool is not None or self.backend == "inline":
+            return
+        if self.backend == "thread":
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="pricing")
+            return
+        self._pool = self._process_pool()
+
+    def _process_pool(
+        self, kernel_state: Optional[Dict[str, Any]] = None, version: Optional[str] = None
+    ) -> ProcessPoolExecutor:
+        # spawn: forking a process that already runs an event loop and threads is unsafe
+        pool = ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_worker,
+            initargs=(kernel_state, version),
+        )
+        for _ in range(self.workers):
+            pool.submit(_warm_worker, kernel_state, version)
+        return pool
+
+    def reload(self, kernel_state: Dict[str, Any], version: Optional[str] = None) -> None:
+        """
+        After a model swap: new jobs go to fresh process workers, which load
+        ``version`` from the artifact (or ``kernel_state`` if it holds another
+        version), while jobs already queued or running finish on the old pool.
+        Thread and inline backends share the swapped module state.
+        """
+        if self.backend != "process" or self._pool is None:
+            return
+        old, self._pool = self._pool, self._process_pool(kernel_state, version)
+        old.shutdown(wait=False)
+
+    def shutdown(self) -> None:
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """
+        Run ``fn(*args)`` on the backend (``fn`` must be picklable for
+        ``process``). Thread jobs see the caller's context variables, so stage
+        timers inside them keep the request's route label.
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PricingSaturated(self.retry_after_s)
+        self.pending += 1
+        try:
+            if self.backend == "inline":
+                return fn(*args)
+            self.start()
+            job = functools.partial(fn, *args)
+            if self.backend == "thread":
+                job = functools.partial(contextvars.copy_context().run, job)
+            return await asyncio.get_running_loop().run_in_executor(self._pool, job)
+        finally:
+            self.pending -= 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "workers": self.workers if self.backend != "inline" else 0,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+        }
+
+
+pricing_executor = PricingExecutor()
@@ -1,5 +1,10 @@
 from __future__ import annotations
-from typing import Optional
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .models import VALID_GLAZINGS, VALID_MATERIALS, VALID_PRODUCT_TYPES
+
+Combo = Tuple[Optional[str], Optional[str], Optional[str]]
 
 PRODUCT_FACTS = {
     ("window", "uPVC", "double"): [
@@ -72,9 +77,10 @@ SECURITY_TECH = {
 }
 
 
-def gather_facts(
+def _derive(
     product_type: Optional[str], material: Optional[str], glazing: Optional[str]
 ) -> list[str]:
+    """Facts for one combination: exact match, then broader keys, each fact once."""
     keys = [
         (product_type, material, glazing),
         (product_type, material, None),
@@ -88,3 +94,65 @@ def gather_facts(
                 seen.add(s)
                 out.append(s)
     return out
+
+
+class FactsIndex:
+    """
+    Immutable fact lists for every normalised (product_type, material, glazing)
+    combination, plus named groups (accreditations, each security product),
+    stored as indices into one fact table. Merging facts across quote lines is
+    then an ordered union over small ints tracked in a bitmask.
+    """
+
+    __slots__ = ("facts", "_ids", "_combos", "_groups")
+
+    def __init__(self, combos: Iterable[Combo], groups: Dict[str, Sequence[str]]):
+        table: Dict[str, int] = {}
+        for lines in [*PRODUCT_FACTS.values(), *groups.values()]:
+            for s in lines:
+                table.setdefault(s, len(table))
+        self.facts: Tuple[str, ...] = tuple(table)
+        self._ids = MappingProxyType(table)
+        self._combos = MappingProxyType({c: self._lookup(_derive(*c)) for c in combos})
+        self._groups = MappingProxyType({g: self._lookup(lines) for g, lines in groups.items()})
+
+    def _lookup(self, lines: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self._ids[s] for s in lines)
+
+    @property
+    def groups(self) -> Tuple[str, ...]:
+        return tuple(self._groups)
+
+    def ids(self, combo: Combo) -> Tuple[int, ...]:
+        """Fact indices for ``combo``; combinations outside the index are derived on the fly."""
+        got = self._combos.get(combo)
+        return got if got is not None else self._lookup(_derive(*combo))
+
+    def union(self, combos: Iterable[Combo], groups: Sequence[str] = ()) -> List[str]:
+        """Facts for every combo, then every named group, in first-seen order, each once."""
+        mask, order = 0, []
+        id_lists = [self.ids(c) for c in dict.fromkeys(combos)]
+        id_lists += [self._groups[g] for g in groups]
+        for ids in id_lists:
+            for i in ids:
+                if not mask >> i & 1:
+                    mask |= 1 << i
+                    order.append(i)
+        return [self.facts[i] for i in order]
+
+
+facts_index = FactsIndex(
+    combos=[
+        (pt, mat, glz)
+        for pt in sorted(VALID_PRODUCT_TYPES)
+        for mat in VALID_MATERIALS
+        for glz in VALID_GLAZINGS
+    ],
+    groups={"accreditations": ACCREDITATIONS, **SECURITY_TECH},
+)
+
+
+def gather_facts(
+    product_type: Optional[str], material: Optional[str], glazing: Optional[str]
+) -> list[str]:
+    return [facts_index.facts[i] for i in facts_index.ids((product_type, material, glazing))]
@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from .config import (
+    CIRCUIT_COOLDOWN_S,
+    CIRCUIT_FAILURES,
+    HEDGE_DEFAULT_DELAY_S,
+    HEDGE_MAX_DELAY_S,
+    HEDGE_MIN_DELAY_S,
+    LATENCY_WINDOW,
+)
+from .limits import ProviderLimiter, acquire_first, provider_limiters
+from .metrics import provider_call
+
+logger = logging.getLogger(__name__)
+
+# (provider name, zero-arg factory returning the provider call)
+Branch = Tuple[str, Callable[[], Awaitable[str]]]
+
+
+def _quantile(values: Sequence[float], q: float) -> float:
+    s = sorted(values)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+
+class ProviderStats:
+    """Rolling latency window and circuit-breaker state for one provider."""
+
+    def __init__(self, window: int):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        # when the half-open trial call was admitted; 0 while none is in flight
+        self.probe_since = 0.0
+
+    def p50(self) -> Optional[float]:
+        return _quantile(self.latencies, 0.5) if self.latencies else None
+
+    def p90(self) -> Optional[float]:
+        return _quantile(self.latencies, 0.9) if self.latencies else None
+
+
+class ProviderHealth:
+    """
+    Tracks provider latency and failures to decide call order, hedge delay and
+    which providers to skip. A provider's circuit opens after ``failure_threshold``
+    consecutive failures. After ``cooldown_s`` it is half-open: :meth:`available`
+    admits a single trial call, whose success closes the circuit and whose
+    failure re-opens it.
+    Providers with a limiter in ``limits`` are also skipped while they are out
+    of rate or concurrency capacity (:meth:`try_acquire`).
+    """
+
+    def __init__(
+        self,
+        window: int = LATENCY_WINDOW,
+        failure_threshold: int = CIRCUIT_FAILURES,
+        cooldown_s: float = CIRCUIT_COOLDOWN_S,
+        default_delay_s: float = HEDGE_DEFAULT_DELAY_S,
+        min_delay_s: float = HEDGE_MIN_DELAY_S,
+        max_delay_s: float = HEDGE_MAX_DELAY_S,
+        limits: Optional[Mapping[str, ProviderLimiter]] = None,
+    ):
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.default_delay_s = default_delay_s
+        self.min_delay_s = min_delay_s
+        self.max_delay_s = max_delay_s
+        self.limits: Dict[str, ProviderLimiter] = dict(limits or {})
+        self._stats: Dict[str, ProviderStats] = {}
+
+    def __getitem__(self, name: str) -> ProviderStats:
+        st = self._stats.get(name)
+        if st is None:
+            st = self._stats[name] = ProviderStats(self.window)
+        return st
+
+    def reset(self) -> None:
+        self._stats.clear()
+        for lim in self.limits.values():
+            lim.reset()
+
+    def available(self, name: str, now: Optional[float] = None) -> bool:
+        """
+        True if ``name`` may be called now. While half-open, the first caller
+        takes the trial call and others get False until it is recorded or
+        :meth:`cancel_probe` is called; a probe never settled lapses after
+        ``cooldown_s``.
+        """
+        st = self[name]
+        now = time.monotonic() if now is None else now
+        if st.open_until > now:
+            return False
+        if st.open_until == 0.0:
+            return True
+        if st.probe_since and now - st.probe_since < self.cooldown_s:
+            return False
+        st.probe_since = now
+        logger.info("Circuit half-open for %s: admitting a trial call", name)
+        return True
+
+    def cancel_probe(self, name: str) -> None:
+        """Give back a trial call taken by :meth:`available` but never made or finished."""
+        self[name].probe_since = 0.0
+
+    def try_acquire(self, name: str) -> bool:
+        """Take a call slot within ``name``'s limits, or False at once if it has none."""
+        lim = self.limits.get(name)
+        return lim is None or lim.try_acquire()
+
+    async def acquire_first(self, names: Sequence[str], timeout: float) -> Optional[str]:
+        """
+        The first of ``names`` with a call slot free now, else whichever frees
+        up first within ``timeout``; None if none does.
+        """
+        i = await acquire_first([self.limits.get(n) for n in names], timeout)
+        return names[i] if i is not None else None
+
+    def release(self, name: str) -> None:
+        lim = self.limits.get(name)
+        if lim is not None:
+            lim.release()
+
+    def order(self, names: Sequence[str]) -> List[str]:
+        """Currently healthy, fastest-recent first; ties keep the given order."""
+        def key(n: str):
+            st = self[n]
+            return (st.consecutive_failures, st.p50() or 0.0)
+        return sorted(names, key=key)
+
+    def hedge_delay(self, name: str) -> float:
+        """How long to give ``name`` before also starting the next provider."""
+        p90 = self[name].p90()
+        if p90 is None:
+            return self.default_delay_s
+        return min(self.max_delay_s, max(self.min_delay_s, p90))
+
+    def record_success(self, name: str, latency_s: float) -> None:
+        st = self[name]
+        st.latencies.append(latency_s)
+        st.consecutive_failures = 0
+        st.open_until = 0.0
+        st.probe_since = 0.0
+
+    def record_failure(self, name: str) -> None:
+        st = self[name]
+        st.consecutive_failures += 1
+        st.probe_since = 0.0
+        if st.consecutive_failures >= self.failure_threshold:
+            if st.open_until <= time.monotonic():
+                logger.warning("Circuit open for %s after %d failures", name, st.consecutive_failures)
+            st.open_until = time.monotonic() + self.cooldown_s
+
+
+provider_health = ProviderHealth(limits=provider_limiters())
+
+
+async def hedged_first_success(
+    branches: Sequence[Branch],
+    parse: Callable[[str], str],
+    deadline_s: float,
+    health: ProviderHealth = provider_health,
+    wait_s: float = 0.0,
+) -> Optional[str]:
+    """
+    Start the best provider, and the next one only if it fails or has not
+    answered within its hedge delay. A provider out of rate or concurrency
+    capacity is passed over for the next one without being called; with
+    ``wait_s``, a call started while no other is running goes to the first
+    provider with capacity, or waits that long for whichever frees up first. Returns the first non-empty parsed text, or
+    None when every available provider fails or is skipped. Raises
+    ``asyncio.TimeoutError`` ``deadline_s`` after the first call starts.
+    Losing calls are cancelled.
+    """
+    now = time.monotonic()
+    factories = dict(branches)
+    pending = health.order([n for n, _ in branches if health.available(n, now)])
+    if not pending:
+        return None
+
+    end = float("inf")
+    running: Dict["asyncio.Future[str]", Tuple[str, float]] = {}
+    next_hedge = 0.0
+
+    async def call(name: str) -> str:
+        with provider_call(name) as rec:
+            text = parse(await factories[name]())
+            if not text:
+                rec["outcome"] = "empty"
+            return text
+
+    async def launch() -> bool:
+        nonlocal next_hedge
+        while pending:
+            # only wait while nothing runs, so a wait never hides a finished call
+            wait = min(wait_s, end - time.monotonic()) if not running else 0.0
+            if wait > 0:
+                # any provider with capacity now beats waiting for the first choice
+                name = await health.acquire_first(pending, wait)
+                if name is None:
+                    for skipped in pending:
+                        health.cancel_probe(skipped)
+                    logger.info("LLM branches %s skipped: no capacity within %.1fs", pending, wait)
+                    pending.clear()
+                    return False
+                pending.remove(name)
+            else:
+                name = pending.pop(0)
+                if not health.try_acquire(name):
+                    health.cancel_probe(name)
+                    logger.info("LLM branch %s skipped: at its rate/concurrency limit", name)
+                    continue
+            started = time.monotonic()
+            task = asyncio.ensure_future(call(name))
+            # done callbacks run even if the task is cancelled before it starts
+            task.add_done_callback(lambda _, name=name: health.release(name))
+            running[task] = (name, started)
+            next_hedge = started + health.hedge_delay(name)
+            return True
+        return False
+
+    try:
+        if not await launch():
+            return None
+        end = time.monotonic() + deadline_s
+        while running:
+            now = time.monotonic()
+            if now >= end:
+                raise asyncio.TimeoutError()
+            timeout = end - now
+            if pending:
+                timeout = min(timeout, max(0.0, next_hedge - now))
+            done, _ = await asyncio.wait(
+                running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                name, started = running.pop(task)
+                try:
+                    text = task.result()
+                except Exception as e:
+                    logger.warning("LLM branch %s failed: %s", name, e)
+                    health.record_failure(name)
+                    continue
+                if not text:
+                    health.record_failure(name)
+                    continue
+                health.record_success(name, time.monotonic() - started)
+                return text
+            if pending and (not running or time.monotonic() >= next_hedge):
+                await launch()
+        return None
+    finally:
+        # providers that were admitted but never called, or lost the race
+        for name in pending:
+            health.cancel_probe(name)
+        for task, (name, _) in running.items():
+            task.cancel()
+            health.cancel_probe(name)
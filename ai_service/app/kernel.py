@@ -0,0 +1,123 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+
+import numpy as np
+
+
+class PricingKernel:
+    """
+    Closed-form evaluator for a fitted ``ColumnTransformer(OneHotEncoder,
+    passthrough) -> LinearRegression`` pipeline.
+
+    A one-hot linear model is an intercept, plus one coefficient per
+    categorical value, plus a dot product over the numeric columns, so the
+    fitted pipeline is exported as plain lookup tables and evaluated without
+    pandas or sklearn. Values the encoder did not see (or dropped) score 0.0,
+    matching ``handle_unknown="ignore"``.
+    """
+
+    __slots__ = ("intercept", "tables", "num_columns", "num_coef")
+
+    def __init__(
+        self,
+        intercept: float,
+        tables: Sequence[Tuple[str, Mapping[Any, float]]],
+        num_columns: Sequence[str],
+        num_coef: Sequence[float],
+    ):
+        self.intercept = float(intercept)
+        self.tables = tuple((col, dict(tab)) for col, tab in tables)
+        self.num_columns = tuple(num_columns)
+        self.num_coef = np.asarray(num_coef, dtype=float)
+
+    def to_state(self) -> Dict[str, Any]:
+        """Plain-data form, safe to persist regardless of import path."""
+        return {
+            "intercept": self.intercept,
+            "tables": [(c, dict(t)) for c, t in self.tables],
+            "num_columns": list(self.num_columns),
+            "num_coef": self.num_coef.tolist(),
+        }
+
+    @classmethod
+    def from_state(cls, state: Mapping[str, Any]) -> "PricingKernel":
+        return cls(state["intercept"], state["tables"], state["num_columns"], state["num_coef"])
+
+    @property
+    def columns(self) -> List[str]:
+        return [c for c, _ in self.tables] + list(self.num_columns)
+
+    def _cat_sum(self, row: Mapping[str, Any]) -> float:
+        total = self.intercept
+        for col, tab in self.tables:
+            total += tab.get(row[col], 0.0)
+        return total
+
+    def predict(self, rows: Sequence[Mapping[str, Any]]) -> np.ndarray:
+        """Predict feature dicts (as built by ``routes._features``)."""
+        n = len(rows)
+        if not n:
+            return np.zeros(0)
+        base = np.fromiter((self._cat_sum(r) for r in rows), dtype=float, count=n)
+        num = np.array([[r[c] for c in self.num_columns] for r in rows], dtype=float)
+        return base + num @ self.num_coef
+
+    def predict_grid(self, row: Mapping[str, Any], column: str, values: np.ndarray) -> np.ndarray:
+        """Predict ``row`` with numeric ``column`` swept over ``values`` (any shape) in one broadcast."""
+        if column not in self.num_columns:
+            raise ValueError(f"{column!r} is not a numeric model column")
+        num = 0.0
+        for col, coef in zip(self.num_columns, self.num_coef):
+            num = num + coef * (values if col == column else row[col])
+        return self._cat_sum(row) + num
+
+    def predict_one(self, row: Mapping[str, Any]) -> float:
+        total = self._cat_sum(row)
+        for col, coef in zip(self.num_columns, self.num_coef):
+            total += coef * row[col]
+        return float(total)
+
+
+def compile_kernel(pipeline) -> PricingKernel:
+    """Export a fitted pricing Pipeline into a :class:`PricingKernel`."""
+    pre = pipeline.named_steps["pre"]
+    lin = pipeline.named_steps["lin"]
+    coef = np.ravel(lin.coef_)
+
+    tables: List[Tuple[str, Dict[Any, float]]] = []
+    num_columns: List[str] = []
+    num_coef: List[float] = []
+    pos = 0
+    for name, trans, cols in pre.transformers_:
+        if trans == "drop" or not len(cols):
+            continue
+        if not hasattr(trans, "categories_"):
+            # sklearn stores "passthrough" as an identity FunctionTransformer
+            if trans != "passthrough" and getattr(trans, "func", None) is not None:
+                raise ValueError(f"Unsupported transformer for kernel: {name}")
+            for col in cols:
+                num_columns.append(col)
+                num_coef.append(float(coef[pos]))
+                pos += 1
+            continue
+        # OneHotEncoder: emitted columns are each feature's categories minus
+        # the dropped one, in order.
+        drop_idx = getattr(trans, "drop_idx_", None)
+        for i, (col, cats) in enumerate(zip(cols, trans.categories_)):
+            tab: Dict[Any, float] = {}
+            for j, cat in enumerate(cats):
+                if drop_idx is not None and drop_idx[i] is not None and j == drop_idx[i]:
+                    tab[cat] = 0.0
+                    continue
+                tab[cat] = float(coef[pos])
+                pos += 1
+            tables.append((col, tab))
+    if pos != coef.shape[0]:
+        raise ValueError(f"Pipeline has {coef.shape[0]} coefficients, kernel mapped {pos}")
+    return PricingKernel(float(lin.intercept_), tables, num_columns, num_coef)
+
+
+def parity_error(pipeline, kernel: PricingKernel, X) -> float:
+    """Max absolute difference between ``pipeline.predict`` and the kernel on DataFrame ``X``."""
+    rows = X[kernel.columns].to_dict("records")
+    return float(np.max(np.abs(pipeline.predict(X) - kernel.predict(rows)), initial=0.0))
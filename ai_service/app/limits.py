@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Callable, Dict, Mapping, Optional, Sequence, Tuple
+
+from .config import PROVIDER_RATE_LIMITS
+
+
+class TokenBucket:
+    """Refills ``rate_per_s`` tokens a second up to ``capacity``; taking never blocks."""
+
+    __slots__ = ("rate_per_s", "capacity", "tokens", "updated", "clock")
+
+    def __init__(self, rate_per_s: float, capacity: int, clock: Callable[[], float] = time.monotonic):
+        self.rate_per_s = rate_per_s
+        self.capacity = float(capacity)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_s)
+        self.updated = now
+
+    def try_take(self, reserve: float = 0.0) -> bool:
+        """Take a token if one is left over after ``reserve``."""
+        self._refill()
+        if self.tokens >= 1.0 + reserve:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def wait_s(self, reserve: float = 0.0) -> float:
+        """Seconds until :meth:`try_take` with ``reserve`` can succeed."""
+        self._refill()
+        return max(0.0, (1.0 + reserve - self.tokens) / self.rate_per_s)
+
+    def level(self) -> float:
+        self._refill()
+        return self.tokens
+
+    def fill(self) -> None:
+        self.tokens, self.updated = self.capacity, self.clock()
+
+
+class ProviderLimiter:
+    """
+    Request rate (token bucket) and calls-in-flight cap for one provider.
+    :meth:`try_acquire` never waits: an interactive caller refused a slot goes
+    to another provider or the fallback instead of queueing for a call that
+    would only be rate-limited. Background work such as batches uses
+    :meth:`acquire`, which waits for capacity but leaves part of the burst to
+    callers that do not wait. Used from the event loop only, so no locking.
+    """
+
+    def __init__(
+        self,
+        rate_per_min: float,
+        burst: int,
+        max_in_flight: int,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.bucket = TokenBucket(rate_per_min / 60.0, max(1, burst), clock) if rate_per_min > 0 else None
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.rejected = {"rate": 0, "concurrency": 0}
+
+    def _take(self, reserve: float = 0.0) -> Optional[str]:
+        """Take a slot, or say which limit refused it."""
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return "concurrency"
+        if self.bucket is not None and not self.bucket.try_take(reserve):
+            return "rate"
+        self.in_flight += 1
+        return None
+
+    def try_acquire(self) -> bool:
+        refused = self._take()
+        if refused is not None:
+            self.rejected[refused] += 1
+        return refused is None
+
+    def _reserve(self, reserve: float) -> float:
+        # a bucket of one token has nothing to spare
+        return min(reserve, self.bucket.capacity - 1) if self.bucket is not None else 0.0
+
+    def _wait_s(self, refused: str, reserve: float, poll_s: float) -> float:
+        return self.bucket.wait_s(self._reserve(reserve)) if refused == "rate" else poll_s
+
+    async def acquire(self, timeout: float, reserve: int = 1, poll_s: float = 0.05) -> bool:
+        """
+        Wait up to ``timeout`` seconds for a slot: for the next token when
+        rate-limited, re-checking every ``poll_s`` when at the in-flight cap.
+        Only takes a token while ``reserve`` more would be left for
+        :meth:`try_acquire` callers. False (counted as rejected) on timeout.
+        """
+        return await acquire_first([self], timeout, reserve, poll_s) is not None
+
+    def release(self) -> None:
+        self.in_flight -= 1
+
+    def reset(self) -> None:
+        if self.bucket is not None:
+            self.bucket.fill()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "tokens": round(self.bucket.level(), 2) if self.bucket is not None else None,
+            "rejected": dict(self.rejected),
+        }
+
+
+async def acquire_first(
+    limiters: Sequence[Optional[ProviderLimiter]],
+    timeout: float,
+    reserve: int = 1,
+    poll_s: float = 0.05,
+) -> Optional[int]:
+    """
+    Index of the first limiter (None meaning unlimited) with a slot free now,
+    else of whichever frees up first within ``timeout`` seconds, taking the
+    slot as :meth:`ProviderLimiter.acquire` does. None on timeout, counted as
+    a rejection by every limiter.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while limiters:
+        refused = []
+        for i, lim in enumerate(limiters):
+            why = lim._take(lim._reserve(reserve)) if lim is not None else None
+            if why is None:
+                return i
+            refused.append(why)
+        left = deadline - loop.time()
+        if left <= 0:
+            for lim, why in zip(limiters, refused):
+                lim.rejected[why] += 1
+            return None
+        wait = min(lim._wait_s(why, reserve, poll_s) for lim, why in zip(limiters, refused))
+        await asyncio.sleep(min(left, max(wait, 0.001)))
+    return None
+
+
+def provider_limiters(
+    limits: Mapping[str, Tuple[float, int, int]] = PROVIDER_RATE_LIMITS,
+    clock: Optional[Callable[[], float]] = None,
+) -> Dict[str, ProviderLimiter]:
+    """One limiter per provider from ``(rate per minute, burst, max in flight)``."""
+    kw = {"clock": clock} if clock is not None else {}
+    return {name: ProviderLimiter(*cfg, **kw) for name, cfg in limits.items()}
@@ -1,17 +1,21 @@
 from __future__ import annotations
 import json
-import httpx
-from typing import Dict, List
+from typing import AsyncIterator, Dict, List, Tuple
+from .clients import post, stream
 from .config import (
     OPENROUTER_API_KEY,
+    OPENROUTER_BASE_URL,
     OPENROUTER_MODEL,
     HUGGINGFACE_API_KEY,
+    HF_BASE_URL,
     HF_MODEL,
-    HTTP_TIMEOUT,
 )
 
 
-async def call_openrouter(messages: List[Dict[str, str]], max_tokens: int = 400) -> str:
+OPENROUTER_URL = f"{OPENROUTER_BASE_URL}/chat/completions"
+
+
+def _openrouter_request(messages: List[Dict[str, str]], max_tokens: int) -> Tuple[dict, dict]:
     if not OPENROUTER_API_KEY:
         raise RuntimeError("Missing OPENROUTER_API_KEY")
     headers = {
@@ -27,18 +31,35 @@ async def call_openrouter(messages: List[Dict[str, str]], max_tokens: int = 400)
         "response_format": {"type": "json_object"},
         "messages": messages,
     }
-    to = httpx.Timeout(
-        HTTP_TIMEOUT,
-        connect=min(5.0, HTTP_TIMEOUT),
-        read=HTTP_TIMEOUT,
-        write=HTTP_TIMEOUT,
-    )
-    async with httpx.AsyncClient(timeout=to) as client:
-        r = await client.post(
-            "https://openrouter.ai/api/v1/chat/completions", headers=headers, json=body
-        )
+    return headers, body
+
+
+async def call_openrouter(messages: List[Dict[str, str]], max_tokens: int = 400) -> str:
+    headers, body = _openrouter_request(messages, max_tokens)
+    r = await post("openrouter", OPENROUTER_URL, headers=headers, json=body)
+    r.raise_for_status()
+    return r.json()["choices"][0]["message"]["content"]
+
+
+async def stream_openrouter(
+    messages: List[Dict[str, str]], max_tokens: int = 400
+) -> AsyncIterator[str]:
+    """Yield content deltas of a streamed (``stream: true``) OpenRouter completion."""
+    headers, body = _openrouter_request(messages, max_tokens)
+    body["stream"] = True
+    async with stream("openrouter", "POST", OPENROUTER_URL, headers=headers, json=body) as r:
         r.raise_for_status()
-        return r.json()["choices"][0]["message"]["content"]
+        async for line in r.aiter_lines():
+            # SSE: "data: {...}" frames, ": keep-alive" comments, "data: [DONE]"
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            choices = json.loads(data).get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
 
 
 async def call_hf(messages: List[Dict[str, str]], max_new_tokens: int = 400) -> str:
@@ -58,22 +79,16 @@ async def call_hf(messages: List[Dict[str, str]], max_new_tokens: int = 400) ->
             "return_full_text": False,
         },
     }
-    to = httpx.Timeout(
-        HTTP_TIMEOUT,
-        connect=min(5.0, HTTP_TIMEOUT),
-        read=HTTP_TIMEOUT,
-        write=HTTP_TIMEOUT,
+    r = await post(
+        "hf",
+        f"{HF_BASE_URL}/models/{HF_MODEL}",
+        headers=headers,
+        json=payload,
     )
-    async with httpx.AsyncClient(timeout=to) as client:
-        r = await client.post(
-            f"https://api-inference.huggingface.co/models/{HF_MODEL}",
-            headers=headers,
-            json=payload,
-        )
-        r.raise_for_status()
-        out = r.json()
-        if isinstance(out, list) and out and "generated_text" in out[0]:
-            return out[0]["generated_text"]
-        if isinstance(out, dict) and "generated_text" in out:
-            return out["generated_text"]
-        return json.dumps({"text": str(out)})
+    r.raise_for_status()
+    out = r.json()
+    if isinstance(out, list) and out and "generated_text" in out[0]:
+        return out[0]["generated_text"]
+    if isinstance(out, dict) and "generated_text" in out:
+        return out["generated_text"]
+    return json.dumps({"text": str(out)})
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Sequence
+
+from .config import PREDICTION_MEMO_SIZE
+
+
+class PredictionMemo:
+    """Bounded LRU of raw model outputs keyed by the normalised feature tuple."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_many(self, keys: Sequence[Hashable]) -> List[Optional[float]]:
+        with self._lock:
+            out: List[Optional[float]] = []
+            for k in keys:
+                v = self._data.get(k)
+                if v is not None:
+                    self._data.move_to_end(k)
+                out.append(v)
+            hits = sum(v is not None for v in out)
+            self.hits += hits
+            self.misses += len(out) - hits
+            return out
+
+    def put_many(self, items: Dict[Hashable, float]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data.update(items)
+            for k in items:
+                self._data.move_to_end(k)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._data),
+            "max_size": self.max_entries,
+        }
+
+
+prediction_memo = PredictionMemo(PREDICTION_MEMO_SIZE)
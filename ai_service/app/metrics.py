@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+# Minimal Prometheus text-format (0.0.4) metrics; no client library needed.
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# Route template of the request being served, for per-stage labels.
+current_route: contextvars.ContextVar[str] = contextvars.ContextVar("current_route", default="")
+
+LabelValues = Tuple[str, ...]
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], le: Optional[float] = None) -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        parts.append(f'le="{_fmt(le)}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in sorted(self._values.items())
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: Dict[LabelValues, List[float]] = {}  # bucket counts..., sum, count
+
+    def observe(self, value: float, **labels: str) -> None:
+        k = self._key(labels)
+        with self._lock:
+            v = self._values.get(k)
+            if v is None:
+                v = self._values[k] = [0.0] * (len(self.buckets) + 2)
+            v[bisect.bisect_left(self.buckets, value)] += 1
+            v[-2] += value
+            v[-1] += 1
+
+    def count(self, **labels: str) -> float:
+        v = self._values.get(self._key(labels))
+        return v[-1] if v else 0.0
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for k, v in sorted(self._values.items()):
+            lines.extend(render_buckets(self.name, self.labelnames, k, self.buckets, v[:-2], v[-2], v[-1]))
+        return lines
+
+
+def render_buckets(name: str, labelnames: Sequence[str], labelvalues: Sequence[str],
+                   bounds: Sequence[float], counts: Sequence[float], total: float, n: float) -> List[str]:
+    """Histogram sample lines from per-bucket (non-cumulative) counts."""
+    lines, acc = [], 0.0
+    for b, c in zip(bounds, counts):
+        acc += c
+        lines.append(f"{name}_bucket{_labels(labelnames, labelvalues, le=b)} {_fmt(acc)}")
+    lines.append(f"{name}_sum{_labels(labelnames, labelvalues)} {_fmt(total)}")
+    lines.append(f"{name}_count{_labels(labelnames, labelvalues)} {_fmt(n)}")
+    return lines
+
+
+def family(name: str, kind: str, help: str, labelnames: Sequence[str],
+           samples: Dict[LabelValues, float]) -> List[str]:
+    """Exposition lines for a metric whose values live elsewhere (for collectors)."""
+    return [f"# HELP {name} {help}", f"# TYPE {name} {kind}"] + [
+        f"{name}{_labels(labelnames, k)} {_fmt(v)}" for k, v in sorted(samples.items())
+    ]
+
+
+REGISTRY: List[_Metric] = []
+# Called before each scrape to refresh gauges or emit extra pre-rendered lines.
+COLLECTORS: List[Callable[[], List[str]]] = []
+
+
+def render() -> str:
+    lines: List[str] = []
+    for collect in COLLECTORS:
+        lines.extend(collect())
+    for m in REGISTRY:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+# ----- service metrics -----
+
+REQUEST_SECONDS = Histogram(
+    "ai_http_request_duration_seconds", "HTTP request latency", ("route", "method", "status"))
+REQUESTS_IN_FLIGHT = Gauge("ai_http_requests_in_flight", "HTTP requests being served", ("route",))
+STAGE_SECONDS = Histogram(
+    "ai_stage_duration_seconds",
+    "Time spent per request stage (validation, normalization, inference, prompt, parse)",
+    ("route", "stage"))
+PROVIDER_SECONDS = Histogram(
+    "ai_provider_call_duration_seconds", "LLM provider call latency by outcome",
+    ("route", "provider", "outcome"),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 4.0, 6.0, 8.0, 15.0, 30.0, 60.0))
+PROVIDER_IN_FLIGHT = Gauge("ai_provider_calls_in_flight", "LLM provider calls in progress", ("provider",))
+FALLBACKS = Counter(
+    "ai_summary_fallbacks_total", "Deterministic summaries served instead of an LLM answer",
+    ("route", "reason"))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a request stage, labelled with the current route."""
+    with STAGE_SECONDS.time(route=current_route.get(), stage=name):
+        yield
+
+
+@contextmanager
+def provider_call(provider: str) -> Iterator[Dict[str, str]]:
+    """
+    Track one provider call: in-flight gauge plus latency by outcome. The
+    caller may set ``outcome`` in the yielded dict; exceptions map to
+    ``cancelled``/``timeout``/``failure``.
+    """
+    state = {"outcome": "success"}
+    PROVIDER_IN_FLIGHT.inc(provider=provider)
+    t0 = time.perf_counter()
+    try:
+        yield state
+    except BaseException as e:
+        if isinstance(e, (asyncio.CancelledError, GeneratorExit)):
+            state["outcome"] = "cancelled"
+        elif isinstance(e, (asyncio.TimeoutError, TimeoutError)):
+            state["outcome"] = "timeout"
+        else:
+            state["outcome"] = "failure"
+        raise
+    finally:
+        PROVIDER_IN_FLIGHT.dec(provider=provider)
+        PROVIDER_SECONDS.observe(
+            time.perf_counter() - t0, route=current_route.get(), provider=provider,
+            outcome=state["outcome"])
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency and in-flight requests per
+    route, and exposing the route to stage timers via ``current_route``.
+    Paths that match no route share the ``other`` label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._paths: Optional[Set[str]] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self._paths is None:
+            self._paths = {getattr(r, "path", "") for r in scope["app"].routes}
+        route = scope["path"] if scope["path"] in self._paths else "other"
+        token = current_route.set(route)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc(route=route)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec(route=route)
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - t0, route=route, method=scope["method"],
+                status=str(status["code"]))
+            current_route.reset(token)
@@ -1,100 +1,164 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Optional
-from pydantic import BaseModel, Field, ConfigDict, model_validator
+from functools import cached_property
+from typing import Any, Dict, List, Literal, NamedTuple, Optional, Union
+from pydantic import AliasChoices, BaseModel, Field, ConfigDict, model_validator
+
+from .config import NORMALIZATION_SYNONYMS_PATH, PRICE_GRID_MAX_CELLS, SUMMARY_BATCH_MAX_QUOTES
+from .metrics import stage
+from .normalize import CANONICAL, load_normalizers
 
 # ----- Normalisers -----
-VALID_PRODUCT_TYPES = {"window", "door", "conservatory"}
-
-def _norm_product_type(x: Optional[str]) -> str:
-    if not x:
-        return "window"
-    t = x.strip().lower()
-    if t in VALID_PRODUCT_TYPES:
-        return t
-    if any(k in t for k in ("bifold", "french", "patio", "door")):
-        return "door"
-    if "conserv" in t or "orangery" in t:
-        return "conservatory"
-    return "window"
-
-def _norm_material(x: Optional[str]) -> str:
-    s = (x or "").strip()
-    if s.lower() == "upvc":
-        return "uPVC"
-    if s.lower() == "aluminium":
-        return "Aluminium"
-    if s.lower() == "composite":
-        return "Composite"
-    return "uPVC"
-
-def _norm_glazing(x: Optional[str]) -> str:
-    s = (x or "").strip().lower()
-    if s in {"double", "triple"}:
-        return s
-    return "double"
+VALID_PRODUCT_TYPES = set(CANONICAL["product_type"])
+VALID_MATERIALS = CANONICAL["material"]
+VALID_GLAZINGS = CANONICAL["glazing"]
+
+# Built from the synonym tables in NORMALIZATION_SYNONYMS_PATH (app/data/synonyms.json)
+NORMALIZERS = load_normalizers(NORMALIZATION_SYNONYMS_PATH)
+_norm_product_type = NORMALIZERS["product_type"]
+_norm_material = NORMALIZERS["material"]
+_norm_glazing = NORMALIZERS["glazing"]
+
+ProductType = Literal["window", "door", "conservatory"]
+Material = Literal["uPVC", "Aluminium", "Composite"]
+Glazing = Literal["double", "triple"]
+
+class NormalizedItem(NamedTuple):
+    """Canonical view of one quote line, shared by pricing, prompts and summaries."""
+    product_id: Optional[int]
+    product_type: ProductType
+    material: Material
+    glazing: Glazing
+    color_tier: Optional[str]
+    hardware_tier: Optional[str]
+    install_complexity: Optional[str]
+    width_mm: int
+    height_mm: int
+    area: float
+    qty: int
 
 # ----- IO models -----
+def _either(snake: str, camel: str) -> AliasChoices:
+    """Accept snake_case or camelCase input; snake_case wins if both are sent."""
+    return AliasChoices(snake, camel)
+
 class QuoteItemIn(BaseModel):
-    product_type: Optional[str] = None
-    product_id: Optional[int] = None
-    width_mm: int = Field(ge=300, le=4000)
-    height_mm: int = Field(ge=300, le=4000)
+    product_type: Optional[str] = Field(None, validation_alias=_either("product_type", "productType"))
+    product_id: Optional[int] = Field(None, validation_alias=_either("product_id", "productId"))
+    width_mm: int = Field(ge=300, le=4000, validation_alias=_either("width_mm", "widthMm"))
+    height_mm: int = Field(ge=300, le=4000, validation_alias=_either("height_mm", "heightMm"))
     material: str
     glazing: str
-    color_tier: Optional[str] = None
-    hardware_tier: Optional[str] = None
-    install_complexity: Optional[str] = None
+    color_tier: Optional[str] = Field(None, validation_alias=_either("color_tier", "colorTier"))
+    hardware_tier: Optional[str] = Field(None, validation_alias=_either("hardware_tier", "hardwareTier"))
+    install_complexity: Optional[str] = Field(
+        None, validation_alias=_either("install_complexity", "installComplexity")
+    )
     qty: int = Field(ge=1)
 
     model_config = ConfigDict(extra="ignore", str_strip_whitespace=True)
 
-    @model_validator(mode="before")
+    def model_post_init(self, __context: Any) -> None:
+        self.norm  # normalise once, at validation
+
+    @cached_property
+    def norm(self) -> NormalizedItem:
+        """Canonical values for this line; read by pricing, prompts and summaries."""
+        return NormalizedItem(
+            self.product_id,
+            _norm_product_type(self.product_type),
+            _norm_material(self.material),
+            _norm_glazing(self.glazing),
+            self.color_tier,
+            self.hardware_tier,
+            self.install_complexity,
+            self.width_mm,
+            self.height_mm,
+            (self.width_mm * self.height_mm) / 1_000_000.0,
+            self.qty,
+        )
+
+class _TimedRequest(BaseModel):
+    """Request body whose validation time is recorded as the ``validation`` stage."""
+
+    @model_validator(mode="wrap")
     @classmethod
-    def _accept_camel(cls, data: Any) -> Any:
-        if not isinstance(data, dict):
-            return data
-        mapping = {
-            "productType": "product_type",
-            "productId": "product_id",
-            "widthMm": "width_mm",
-            "heightMm": "height_mm",
-            "colorTier": "color_tier",
-            "hardwareTier": "hardware_tier",
-            "installComplexity": "install_complexity",
-        }
-        for camel, snake in mapping.items():
-            if camel in data and snake not in data:
-                data[snake] = data[camel]
-        return data
-
-class PredictBatchRequest(BaseModel):
+    def _time_validation(cls, data: Any, handler):
+        with stage("validation"):
+            return handler(data)
+
+class PredictBatchRequest(_TimedRequest):
     items: List[QuoteItemIn]
 
 class PredictItemOut(BaseModel):
     unit_price: float
     confidence: float
-    features: Dict[str, Any]
+    features: Optional[Dict[str, Any]] = None  # omitted with ?features=false
 
 class PredictBatchResponse(BaseModel):
     items: List[PredictItemOut]
 
-class QuoteSummaryRequest(BaseModel):
-    customer_name: Optional[str] = None
-    items: List[QuoteItemIn]
-    vat_rate: float = 0.20
+class GridRange(BaseModel):
+    """Sizes from ``start`` to ``stop`` (inclusive) every ``step`` mm."""
+    start: int = Field(ge=300, le=4000)
+    stop: int = Field(ge=300, le=4000)
+    step: int = Field(100, ge=1)
+
+    @model_validator(mode="after")
+    def _ordered(self) -> "GridRange":
+        if self.stop < self.start:
+            raise ValueError("stop must be >= start")
+        return self
+
+    def values(self) -> range:
+        return range(self.start, self.stop + 1, self.step)
+
+class PriceGridRequest(_TimedRequest):
+    product_type: Optional[str] = Field(None, validation_alias=_either("product_type", "productType"))
+    material: str
+    glazing: str
+    color_tier: Optional[str] = Field(None, validation_alias=_either("color_tier", "colorTier"))
+    hardware_tier: Optional[str] = Field(None, validation_alias=_either("hardware_tier", "hardwareTier"))
+    install_complexity: Optional[str] = Field(
+        None, validation_alias=_either("install_complexity", "installComplexity")
+    )
+    qty: int = Field(1, ge=1)
+    width: GridRange
+    height: GridRange
 
     model_config = ConfigDict(extra="ignore", str_strip_whitespace=True)
 
-    @model_validator(mode="before")
-    @classmethod
-    def _accept_camel(cls, data: Any) -> Any:
-        if not isinstance(data, dict):
-            return data
-        if "customerName" in data and "customer_name" not in data:
-            data["customer_name"] = data["customerName"]
-        if "vatRate" in data and "vat_rate" not in data:
-            data["vat_rate"] = data["vatRate"]
-        return data
+    @model_validator(mode="after")
+    def _bounded(self) -> "PriceGridRequest":
+        cells = len(self.width.values()) * len(self.height.values())
+        if cells > PRICE_GRID_MAX_CELLS:
+            raise ValueError(f"grid has {cells} cells; the limit is {PRICE_GRID_MAX_CELLS}")
+        return self
+
+    @cached_property
+    def config(self) -> Dict[str, Any]:
+        """Normalised categorical features and qty (every model input except area)."""
+        return dict(
+            product_type=_norm_product_type(self.product_type),
+            material=_norm_material(self.material),
+            glazing=_norm_glazing(self.glazing),
+            color_tier=self.color_tier,
+            hardware_tier=self.hardware_tier,
+            install_complexity=self.install_complexity,
+            qty=self.qty,
+        )
+
+class QuoteSummaryRequest(_TimedRequest):
+    customer_name: Optional[str] = Field(None, validation_alias=_either("customer_name", "customerName"))
+    items: List[QuoteItemIn]
+    vat_rate: float = Field(0.20, validation_alias=_either("vat_rate", "vatRate"))
+
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True)
 
 class QuoteSummaryResponse(BaseModel):
     text: str
+
+class SummaryBatchItem(QuoteSummaryRequest):
+    id: Optional[Union[int, str]] = None  # echoed on this quote's result line
+
+class SummaryBatchRequest(BaseModel):
+    quotes: List[SummaryBatchItem] = Field(min_length=1, max_length=SUMMARY_BATCH_MAX_QUOTES)
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, Optional, Tuple
+
+import orjson
+from starlette.responses import StreamingResponse
+
+
+def loads(raw: bytes) -> Any:
+    return orjson.loads(raw)
+
+
+def dumps_line(obj: Any) -> bytes:
+    """One NDJSON record, newline-terminated."""
+    return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+
+
+async def iter_lines(
+    chunks: AsyncIterator[bytes], max_line_bytes: int
+) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """
+    ``(line number, raw line)`` for each non-blank line of an NDJSON body, read
+    incrementally. Lines longer than ``max_line_bytes`` are discarded as they
+    arrive and yielded as ``None`` so memory stays bounded.
+    """
+    buf = bytearray()
+    line_no = 0
+    overflow = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end < 0:
+                if not overflow:
+                    buf += chunk[start:]
+                    if len(buf) > max_line_bytes:
+                        overflow = True
+                        buf.clear()
+                break
+            line_no += 1
+            if not overflow:
+                buf += chunk[start:end]
+            if overflow or len(buf) > max_line_bytes:
+                yield line_no, None
+            elif buf.strip():
+                yield line_no, bytes(buf)
+            buf.clear()
+            overflow = False
+            start = end + 1
+    if overflow:
+        yield line_no + 1, None
+    elif buf.strip():
+        yield line_no + 1, bytes(buf)
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse for handlers that are still reading the request body
+    while they respond. Starlette's version listens for disconnect on
+    ``receive`` concurrently, which would swallow body chunks; here the body
+    reader sees the disconnect instead (``ClientDisconnect``).
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
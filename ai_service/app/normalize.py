@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Optional, Sequence, Tuple, Union
+
+# Canonical values the pricing model and facts index know about.
+CANONICAL = {
+    "product_type": ("window", "door", "conservatory"),
+    "material": ("uPVC", "Aluminium", "Composite"),
+    "glazing": ("double", "triple"),
+}
+
+
+class Normalizer:
+    """
+    Maps free text to a canonical value: an ``exact`` synonym first, then the
+    first ``contains`` rule (in table order) with a keyword anywhere in the
+    text, else ``default``. Case-insensitive on the stripped input. All rules
+    are compiled into one regex, and results are cached per raw string (up to
+    ``cache_size`` entries).
+    """
+
+    def __init__(
+        self,
+        field: str,
+        default: str,
+        exact: Mapping[str, str],
+        contains: Sequence[Tuple[str, Iterable[str]]] = (),
+        cache_size: int = 4096,
+    ):
+        allowed = CANONICAL[field]
+        targets = [default, *exact.values(), *(c for c, _ in contains)]
+        bad = sorted({t for t in targets if t not in allowed})
+        if bad:
+            raise ValueError(f"Unknown canonical {field} value(s) {bad}; expected one of {allowed}")
+        self.field = field
+        self.default = sys.intern(default)
+        self.exact = {k.strip().lower(): sys.intern(v) for k, v in exact.items()}
+        # One lookahead branch per rule; alternation tries them in order, so an
+        # earlier rule wins even if a later rule's keyword comes first in the
+        # text. The branch's capture group tells us which rule matched.
+        self._rule_values = [sys.intern(c) for c, _ in contains]
+        branches = [
+            "(?=.*?(%s))" % "|".join(re.escape(k.strip().lower()) for k in kws)
+            for _, kws in contains
+        ]
+        self._matcher = re.compile("|".join(branches), re.S) if branches else None
+        self.cache_size = cache_size
+        self._cache: Dict[str, str] = {}
+
+    def _resolve(self, raw: str) -> str:
+        t = raw.strip().lower()
+        hit = self.exact.get(t)
+        if hit is not None:
+            return hit
+        m = self._matcher.match(t) if self._matcher is not None else None
+        if m is not None and m.lastindex:
+            return self._rule_values[m.lastindex - 1]
+        return self.default
+
+    def __call__(self, raw: Optional[str]) -> str:
+        if not raw:
+            return self.default
+        v = self._cache.get(raw)
+        if v is None:
+            v = self._resolve(raw)
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[sys.intern(raw)] = v
+        return v
+
+
+def load_normalizers(path: Union[str, Path]) -> Dict[str, Normalizer]:
+    """Build one Normalizer per field from a synonyms JSON file (see app/data/synonyms.json)."""
+    spec = json.loads(Path(path).read_text(encoding="utf-8"))
+    missing = sorted(set(CANONICAL) - set(spec))
+    if missing:
+        raise ValueError(f"{path}: no synonym table for {missing}")
+    return {
+        field: Normalizer(
+            field,
+            table["default"],
+            table.get("exact", {}),
+            [(c, kws) for c, kws in table.get("contains", [])],
+        )
+        for field, table in spec.items()
+        if field in CANONICAL
+    }
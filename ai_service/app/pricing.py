@@ -1,51 +1,357 @@
 from __future__ import annotations
-import numpy as np, pandas as pd
-from sklearn.compose import ColumnTransformer
-from sklearn.preprocessing import OneHotEncoder
-from sklearn.linear_model import LinearRegression
-from sklearn.pipeline import Pipeline
+import hashlib
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
 
-def _training(n=5000, seed=42) -> pd.DataFrame:
+import numpy as np
+
+from .artifact import load, load_or_build, read_meta, save
+from .config import MODEL_ARTIFACT_PATH, MODEL_SYNC_INTERVAL_S
+from .kernel import PricingKernel, compile_kernel, parity_error
+
+if TYPE_CHECKING:  # pandas/sklearn are only imported when training
+    import pandas as pd
+
+PARITY_TOL = 1e-9
+
+logger = logging.getLogger(__name__)
+
+# Synthetic catalogue: category values and the multipliers applied to each,
+# indexed by the integer codes drawn in _training_chunk.
+PRODUCT_TYPES = np.array(["window", "door", "conservatory"], dtype=object)
+MATERIALS = np.array(["uPVC", "Aluminium", "Composite"], dtype=object)
+GLAZINGS = np.array(["double", "triple"], dtype=object)
+COLOR_TIERS = np.array([None, "Standard", "Premium"], dtype=object)
+HARDWARE_TIERS = np.array([None, "Standard", "Premium"], dtype=object)
+INSTALL_LVLS = np.array([None, "Standard", "Complex"], dtype=object)
+
+_BASE = np.array([260.0, 850.0, 400.0])
+_AREA_COEFF = np.array([0.5, 0.5, 2.0])
+_MAT_MULT = np.array([1.0, 1.30, 1.15])
+_GLZ_MULT = np.array([1.00, 1.18])
+_COL_MULT = np.array([1.00, 1.00, 1.10])
+_HW_MULT = np.array([1.00, 1.00, 1.08])
+_INS_MULT = np.array([1.00, 1.00, 1.20])
+
+# Rows drawn per chunk; bounds peak memory for very large n.
+TRAINING_CHUNK = 250_000
+
+
+def _training_chunk(rng: np.random.Generator, m: int) -> pd.DataFrame:
+    pt = rng.integers(0, len(PRODUCT_TYPES), m)
+    mat = rng.integers(0, len(MATERIALS), m)
+    glz = rng.integers(0, len(GLAZINGS), m)
+    w = rng.integers(600, 2400, m)
+    h = rng.integers(600, 2400, m)
+    qty = rng.integers(1, 5, m)
+    col = rng.integers(0, len(COLOR_TIERS), m)
+    hw = rng.integers(0, len(HARDWARE_TIERS), m)
+    ins = rng.integers(0, len(INSTALL_LVLS), m)
+    area = (w * h) / 1_000_000.0
+    unit = (
+        _BASE[pt] * (1.0 + _AREA_COEFF[pt] * area)
+        * _MAT_MULT[mat] * _GLZ_MULT[glz] * _COL_MULT[col] * _HW_MULT[hw] * _INS_MULT[ins]
+    )
+    unit = np.maximum(80, unit + rng.normal(0, unit * 0.05))
+    import pandas as pd
+
+    return pd.DataFrame(dict(
+        product_type=PRODUCT_TYPES[pt], material=MATERIALS[mat], glazing=GLAZINGS[glz],
+        width_mm=w, height_mm=h, area=area, qty=qty, color_tier=COLOR_TIERS[col],
+        hardware_tier=HARDWARE_TIERS[hw], install_complexity=INSTALL_LVLS[ins], unit_price=unit,
+    ))
+
+
+def iter_training(n=5000, seed=42, chunk_size=TRAINING_CHUNK) -> Iterator[pd.DataFrame]:
+    """Yield ``n`` synthetic rows as DataFrames of at most ``chunk_size`` rows."""
     rng = np.random.default_rng(seed)
-    product_types = ["window", "door", "conservatory"]
-    materials = ["uPVC", "Aluminium", "Composite"]
-    glazings = ["double", "triple"]
-    color_tiers = [None, "Standard", "Premium"]
-    hardware_tiers = [None, "Standard", "Premium"]
-    install_lvls = [None, "Standard", "Complex"]
-    rows = []
-    for _ in range(n):
-        pt = rng.choice(product_types)
-        mat = rng.choice(materials)
-        glz = rng.choice(glazings)
-        w = int(rng.integers(600, 2400))
-        h = int(rng.integers(600, 2400))
-        qty = int(rng.integers(1, 5))
-        col = rng.choice(color_tiers)
-        hw = rng.choice(hardware_tiers)
-        ins = rng.choice(install_lvls)
-        area = (w * h) / 1_000_000.0
-        base = {"window": 260, "door": 850, "conservatory": 400}[pt]
-        area_coeff = 0.5 if pt != "conservatory" else 2.0
-        mat_mult = {"uPVC": 1.0, "Aluminium": 1.30, "Composite": 1.15}[mat]
-        glz_mult = {"double": 1.00, "triple": 1.18}[glz]
-        col_mult = {"Standard": 1.00, "Premium": 1.10, None: 1.00}[col]
-        hw_mult = {"Standard": 1.00, "Premium": 1.08, None: 1.00}[hw]
-        ins_mult = {"Standard": 1.00, "Complex": 1.20, None: 1.00}[ins]
-        unit = base * (1.0 + area_coeff * area) * mat_mult * glz_mult * col_mult * hw_mult * ins_mult
-        unit = max(80, unit + rng.normal(0, unit * 0.05))
-        rows.append(dict(product_type=pt, material=mat, glazing=glz, width_mm=w, height_mm=h, area=area, qty=qty,
-                         color_tier=col, hardware_tier=hw, install_complexity=ins, unit_price=unit))
-    return pd.DataFrame(rows)
-
-_df = _training()
-pre = ColumnTransformer([
-    ("cat", OneHotEncoder(handle_unknown="ignore"),
-     ["product_type","material","glazing","color_tier","hardware_tier","install_complexity"]),
-    ("num", "passthrough", ["area","qty"])
-])
-model = Pipeline([("pre", pre), ("lin", LinearRegression())])
-model.fit(
-    _df[["product_type","material","glazing","color_tier","hardware_tier","install_complexity","area","qty"]],
-    _df["unit_price"]
-)
+    for start in range(0, n, chunk_size):
+        yield _training_chunk(rng, min(chunk_size, n - start))
+
+
+def _training(n=5000, seed=42) -> pd.DataFrame:
+    import pandas as pd
+
+    chunks = list(iter_training(n, seed))
+    return chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+
+CATEGORICAL = ["product_type","material","glazing","color_tier","hardware_tier","install_complexity"]
+NUMERIC = ["area","qty"]
+
+
+# Reference (dropped) level per categorical column, first one present in the
+# data. Unknown values score like the reference under handle_unknown="ignore",
+# so an unrecognised tier prices as "no tier" rather than as a premium one.
+_REFERENCE_LEVELS = (None, "Standard")
+
+
+def _reference_levels(df: pd.DataFrame) -> list:
+    refs = []
+    for col in CATEGORICAL:
+        present = set(df[col].unique())
+        refs.append(next(r for r in (*_REFERENCE_LEVELS, *sorted(present, key=str)) if r in present))
+    return refs
+
+
+def fit(df: pd.DataFrame):
+    """Fit the pricing pipeline on training rows and compile its serve-time kernel."""
+    from sklearn.compose import ColumnTransformer
+    from sklearn.linear_model import LinearRegression
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+
+    pre = ColumnTransformer([
+        # Dropping one level per column keeps the design matrix full rank; with a
+        # dummy per category the fit is collinear and predictions depend on
+        # summation order.
+        ("cat", OneHotEncoder(handle_unknown="ignore", drop=_reference_levels(df)), CATEGORICAL),
+        ("num", "passthrough", NUMERIC)
+    ])
+    model = Pipeline([("pre", pre), ("lin", LinearRegression())])
+    model.fit(df[CATEGORICAL + NUMERIC], df["unit_price"])
+    # Serve-time evaluator; must agree with the sklearn pipeline it was compiled from.
+    kernel = compile_kernel(model)
+    err = parity_error(model, kernel, df.head(512))
+    if err > PARITY_TOL:
+        raise RuntimeError(f"Pricing kernel diverges from model by {err:.3g}")
+    return model, kernel
+
+
+def train(n=5000, seed=42):
+    """Fit on ``n`` synthetic rows."""
+    return fit(_training(n, seed))
+
+# Everything that determines the fitted model. Bump "rev" whenever _training or
+# train change so persisted artifacts are treated as stale.
+TRAINING_SPEC = {"n": 5000, "seed": 42, "rev": 3}
+
+
+def build():
+    return train(n=TRAINING_SPEC["n"], seed=TRAINING_SPEC["seed"])
+
+
+class ActiveModel(NamedTuple):
+    """The serving model. Replaced as one reference, so a call that has read it
+    keeps a consistent (model, kernel) even if a retrain swaps in a new one."""
+    model: Any  # None in process-pool workers, which only need the kernel
+    kernel: PricingKernel
+    version: str
+    info: Dict[str, Any]
+
+
+def kernel_version(kernel: PricingKernel) -> str:
+    """Content hash of the fitted coefficients; identical fits share a version."""
+    return hashlib.sha256(repr(kernel.to_state()).encode()).hexdigest()[:12]
+
+
+# Loaded on first use or by the app's background warm-up; swapped by activate().
+_active: Optional[ActiveModel] = None
+_load_lock = threading.RLock()
+# Sidecar version of the artifact this process last loaded or wrote, and when
+# ensure_loaded last compared it with the file.
+_stored_version: Optional[str] = None
+_synced_at = 0.0
+
+
+def model_entry(model: Any, kernel: PricingKernel, **info: Any) -> ActiveModel:
+    """An entry for ``kernel`` that is not serving yet (see :func:`activate`)."""
+    return ActiveModel(model, kernel, kernel_version(kernel), info)
+
+
+def activate(model: Any, kernel: PricingKernel, **info: Any) -> ActiveModel:
+    """Make ``kernel`` (and its pipeline) the serving model."""
+    global _active
+    entry = ActiveModel(model, kernel, kernel_version(kernel), {**info, "activated_at": time.time()})
+    with _load_lock:
+        _active = entry
+    return entry
+
+
+def _activate_stored(model: Any, kernel: PricingKernel) -> ActiveModel:
+    global _stored_version, _synced_at
+    meta = read_meta(Path(MODEL_ARTIFACT_PATH)) or {}
+    entry = activate(model, kernel, source="artifact")
+    _stored_version, _synced_at = meta.get("version", entry.version), time.monotonic()
+    return entry
+
+
+def _sync() -> None:
+    """Adopt a model another process persisted since this one last looked."""
+    global _synced_at
+    if not _load_lock.acquire(blocking=False):  # a load or sync is under way
+        return
+    try:
+        if time.monotonic() - _synced_at < MODEL_SYNC_INTERVAL_S:
+            return
+        _synced_at = time.monotonic()
+        path = Path(MODEL_ARTIFACT_PATH)
+        meta = read_meta(path)
+        if meta is None or meta.get("version") in (None, _stored_version):
+            return
+        payload = load(path, TRAINING_SPEC)
+        if payload is None:
+            return
+        entry = _activate_stored(payload["model"], PricingKernel.from_state(payload["kernel"]))
+        logger.info("Pricing model %s adopted from %s", entry.version, path)
+    finally:
+        _load_lock.release()
+
+
+def ensure_loaded() -> ActiveModel:
+    """
+    Load the artifact (training it if needed) once; safe from any thread.
+    Every MODEL_SYNC_INTERVAL_S it also picks up a model persisted since.
+    """
+    if _active is None:
+        with _load_lock:
+            if _active is None:
+                _activate_stored(*load_or_build(
+                    MODEL_ARTIFACT_PATH, TRAINING_SPEC, build, version=kernel_version
+                ))
+    elif MODEL_SYNC_INTERVAL_S > 0 and time.monotonic() - _synced_at >= MODEL_SYNC_INTERVAL_S:
+        _sync()
+    return _active
+
+
+def persist(entry: ActiveModel, **info: Any) -> bool:
+    """
+    Write ``entry`` atomically over the artifact, with its version in the
+    sidecar, so restarts, replicas and pricing workers load it. False (and the
+    model keeps serving from memory) if the artifact cannot be written.
+    """
+    global _stored_version
+    with _load_lock:
+        previous, _stored_version = _stored_version, entry.version
+        try:
+            save(
+                Path(MODEL_ARTIFACT_PATH),
+                {"model": entry.model, "kernel": entry.kernel.to_state()},
+                TRAINING_SPEC,
+                version=entry.version,
+                **info,
+            )
+        except OSError as e:
+            _stored_version = previous
+            logger.warning("Could not persist pricing model %s: %s", entry.version, e)
+            return False
+    return True
+
+
+def is_loaded() -> bool:
+    return _active is not None
+
+
+def model_version() -> Optional[str]:
+    active = _active
+    return active.version if active is not None else None
+
+
+def __getattr__(name: str):
+    # ``pricing.model`` / ``pricing.kernel`` stay importable but load lazily.
+    if name == "model":
+        return ensure_loaded()[0]
+    if name == "kernel":
+        return ensure_loaded()[1]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def predict_features(feats):
+    """Raw predictions for feature dicts; picklable entry point for pricing workers."""
+    return ensure_loaded()[1].predict(feats).tolist()
+
+
+def predict_versioned(feats) -> Tuple[str, List[float]]:
+    """
+    As :func:`predict_features`, with the version of the model that priced
+    them: a process worker can still hold the previous model for a moment
+    after a swap.
+    """
+    active = ensure_loaded()
+    return active.version, active.kernel.predict(feats).tolist()
+
+
+def price_grid(row, widths, heights, kernel: Optional[PricingKernel] = None) -> np.ndarray:
+    """
+    Raw predictions for one configuration at every size: ``row`` holds the
+    categorical features and qty, and the result is ``len(heights) x
+    len(widths)``, computed as one broadcast over area. ``kernel`` defaults
+    to the serving one.
+    """
+    area = np.multiply.outer(np.asarray(heights, dtype=np.int64), np.asarray(widths, dtype=np.int64))
+    kernel = kernel if kernel is not None else ensure_loaded()[1]
+    return kernel.predict_grid(row, "area", area / 1_000_000.0)
+
+
+# ----- Retraining -----
+
+# Smallest training set (after the holdout split) a retrain will fit on.
+MIN_TRAINING_ROWS = 100
+
+
+def load_training(source: str, n: int = 5000, seed: int = 42) -> pd.DataFrame:
+    """
+    Training rows from ``source``: ``"synthetic"`` (the generator above) or the
+    path of a CSV/Parquet export of won quote lines, with the QuoteItemIn
+    columns plus ``unit_price``. Categories go through the serving normalisers
+    so the model is fitted on the values it will be asked about.
+    """
+    if source == "synthetic":
+        return _training(n, seed)
+    import pandas as pd
+
+    from .models import NORMALIZERS
+
+    path = Path(source)
+    df = pd.read_parquet(path) if path.suffix.lower() in (".parquet", ".pq") else pd.read_csv(path)
+    missing = {"material", "glazing", "width_mm", "height_mm", "unit_price"} - set(df.columns)
+    if missing:
+        raise ValueError(f"{source}: missing columns {sorted(missing)}")
+    df = df.dropna(subset=["width_mm", "height_mm", "unit_price"])
+    df = df[df["unit_price"] > 0].copy()
+    for col in CATEGORICAL:
+        raw = df[col].astype(object) if col in df else pd.Series(None, index=df.index, dtype=object)
+        df[col] = raw.where(raw.notna(), None)
+        if col in NORMALIZERS:
+            df[col] = df[col].map(NORMALIZERS[col])
+    df["qty"] = df["qty"].fillna(1) if "qty" in df else 1
+    df["area"] = (df["width_mm"] * df["height_mm"]) / 1_000_000.0
+    return df.reset_index(drop=True)
+
+
+def holdout_mae(kernel: PricingKernel, df: pd.DataFrame) -> float:
+    """Mean absolute error of served unit prices (with the 80 floor) on ``df``."""
+    pred = np.maximum(80.0, kernel.predict(df[kernel.columns].to_dict("records")))
+    return float(np.mean(np.abs(pred - df["unit_price"].to_numpy(dtype=float))))
+
+
+def retrain(source: str, holdout: float = 0.2, tolerance: float = 0.05, seed: int = 42):
+    """
+    Fit a candidate on ``source`` minus a random holdout, and score it and the
+    serving model on that holdout. Returns ``((model, kernel) or None, report)``:
+    the candidate only when its error is at most ``tolerance`` (relative) worse.
+    """
+    df = load_training(source, n=TRAINING_SPEC["n"], seed=seed)
+    cut = int(len(df) * holdout)
+    if cut < 1 or len(df) - cut < MIN_TRAINING_ROWS:
+        raise ValueError(f"{source}: {len(df)} usable rows is too few to train and validate on")
+    order = np.random.default_rng(seed).permutation(len(df))
+    test, rows = df.iloc[order[:cut]], df.iloc[order[cut:]]
+
+    model, kernel = fit(rows)
+    active = ensure_loaded()
+    candidate_mae, active_mae = holdout_mae(kernel, test), holdout_mae(active.kernel, test)
+    accepted = candidate_mae <= active_mae * (1.0 + tolerance)
+    report = {
+        "source": source,
+        "rows": len(df),
+        "holdout_rows": cut,
+        "candidate_version": kernel_version(kernel),
+        "candidate_mae": round(candidate_mae, 4),
+        "active_version": active.version,
+        "active_mae": round(active_mae, 4),
+        "accepted": accepted,
+    }
+    return ((model, kernel) if accepted else None), report
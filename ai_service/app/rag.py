@@ -1,25 +1,152 @@
 from __future__ import annotations
-from typing import Tuple
-from .models import (
-    QuoteSummaryRequest,
-    _norm_product_type,
-    _norm_material,
-    _norm_glazing,
-)
-
-
-def build_rag_context(req: QuoteSummaryRequest) -> Tuple[str, int]:
-    lines, n_tokens = [], 0
-    for it in req.items:
-        pt = _norm_product_type(it.product_type)
-        area = (it.width_mm * it.height_mm) / 1_000_000.0
-        ln = (
-            f"- product_id={it.product_id or 'n/a'} "
-            f"type={pt} size={it.width_mm}x{it.height_mm}mm ({area:.2f} m²) "
-            f"material={_norm_material(it.material)} glazing={_norm_glazing(it.glazing)} "
-            f"color={it.color_tier or '—'} hardware={it.hardware_tier or '—'} "
-            f"install={it.install_complexity or '—'} qty={it.qty}"
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from .config import PROMPT_TOKEN_BUDGET
+from .models import NormalizedItem, QuoteSummaryRequest
+from .tokens import count_tokens
+
+# One format call per line (no per-item list building / joins).
+_RAG_LINE = (
+    "- product_id={} type={} size={}x{}mm ({:.2f} m²) material={} glazing={} "
+    "color={} hardware={} install={} qty={}"
+).format
+_SUMMARY_LINE = "{}) {}× {} {} {} ({}×{}mm ~ {:.2f} m²)".format
+_GROUP_LINE = (
+    "- qty={} type={} material={} glazing={} color={} hardware={} install={} "
+    "width={}mm height={}mm lines={} total_area={:.2f} m²"
+).format
+_ELIDED_LINE = "- ... {} more configurations ({} units over {} lines) not listed".format
+
+
+def rag_line(n: NormalizedItem) -> str:
+    return _RAG_LINE(
+        n.product_id or "n/a", n.product_type, n.width_mm, n.height_mm, n.area,
+        n.material, n.glazing, n.color_tier or "—", n.hardware_tier or "—",
+        n.install_complexity or "—", n.qty,
+    )
+
+
+def summary_line(i: int, n: NormalizedItem) -> str:
+    """One numbered line of the deterministic summary."""
+    line = _SUMMARY_LINE(
+        i, n.qty, n.product_type, n.material, n.glazing, n.width_mm, n.height_mm, n.area
+    )
+    if n.color_tier:
+        line += f" , colour {n.color_tier}"
+    if n.hardware_tier:
+        line += f" , hardware {n.hardware_tier}"
+    if n.install_complexity:
+        line += f" , install {n.install_complexity}"
+    return line
+
+
+def rag_lines(items: Iterable[NormalizedItem]) -> List[str]:
+    return [rag_line(n) for n in items]
+
+
+def _span(lo: int, hi: int) -> str:
+    return str(lo) if lo == hi else f"{lo}-{hi}"
+
+
+class _Group:
+    __slots__ = ("first", "qty", "lines", "w", "h", "area")
+
+    def __init__(self, n: NormalizedItem):
+        self.first = n
+        self.qty, self.lines, self.area = 0, 0, 0.0
+        self.w = [n.width_mm, n.width_mm]
+        self.h = [n.height_mm, n.height_mm]
+
+    def add(self, n: NormalizedItem) -> None:
+        self.qty += n.qty
+        self.lines += 1
+        self.area += n.area * n.qty
+        self.w[0], self.w[1] = min(self.w[0], n.width_mm), max(self.w[1], n.width_mm)
+        self.h[0], self.h[1] = min(self.h[0], n.height_mm), max(self.h[1], n.height_mm)
+
+    def line(self) -> str:
+        n = self.first
+        return _GROUP_LINE(
+            self.qty, n.product_type, n.material, n.glazing, n.color_tier or "—",
+            n.hardware_tier or "—", n.install_complexity or "—",
+            _span(*self.w), _span(*self.h), self.lines, self.area,
         )
-        lines.append(ln)
-        n_tokens += len(ln.split())
-    return "\n".join(lines), n_tokens
+
+
+def group_items(items: Iterable[NormalizedItem]) -> List[_Group]:
+    """Lines with the same configuration (type, material, glazing, tiers), first-seen order."""
+    groups: Dict[tuple, _Group] = {}
+    for n in items:
+        key = n[1:7]  # product_type .. install_complexity
+        g = groups.get(key)
+        if g is None:
+            g = groups[key] = _Group(n)
+        g.add(n)
+    return list(groups.values())
+
+
+def _lines_within(lines: Sequence[str], budget: int) -> Optional[int]:
+    """Tokens of ``lines`` joined by newlines, or None as soon as they pass ``budget``."""
+    total = -1  # n lines, n - 1 newlines
+    for ln in lines:
+        total += count_tokens(ln) + 1
+        if total > budget:
+            return None
+    return max(total, 0)
+
+
+def fit_rag(items: Sequence[NormalizedItem], budget: int) -> Tuple[str, Optional[int]]:
+    """
+    As :func:`compact_rag`, but the token count is None when the item lines
+    fit on their UTF-8 length alone (no tokeniser yields more tokens than
+    bytes) and were never counted.
+    """
+    lines = rag_lines(items)
+    text = "\n".join(lines)
+    if len(text.encode()) <= budget:
+        return text, None
+    tokens = _lines_within(lines, budget)
+    if tokens is not None:
+        return text, tokens
+
+    groups = group_items(items)
+    lines = [g.line() for g in groups]
+    text = "\n".join(lines)
+    if len(text.encode()) <= budget:
+        return text, None
+
+    # Count lines largest group first, only until the budget is passed: those
+    # that fit next to the closing summary line are kept.
+    reserve = count_tokens(_ELIDED_LINE(len(groups), sum(g.qty for g in groups), len(items))) + 1
+    order = sorted(range(len(groups)), key=lambda i: -groups[i].qty)
+    total, keep, used = -1, None, 0
+    for k, i in enumerate(order):
+        cost = count_tokens(lines[i]) + 1  # +1 for the newline
+        if keep is None and total + 1 + cost + reserve > budget:
+            keep, used = set(order[:k]), total + 1
+        total += cost
+        if total > budget:
+            break
+    else:
+        return text, total
+
+    dropped = [g for i, g in enumerate(groups) if i not in keep]
+    out = [ln for i, ln in enumerate(lines) if i in keep]
+    elided = _ELIDED_LINE(len(dropped), sum(g.qty for g in dropped), sum(g.lines for g in dropped))
+    out.append(elided)
+    return "\n".join(out), used + count_tokens(elided)
+
+
+def compact_rag(items: Sequence[NormalizedItem], budget: int) -> Tuple[str, int]:
+    """
+    Item lines for the prompt within ``budget`` tokens, and their token count.
+    One line per item when that fits; otherwise one line per configuration
+    with summed quantities and size ranges; if still too long, the groups with
+    the fewest units are dropped and summarised in a closing line. Each line
+    is counted once and the total summed; counting stops once over budget.
+    """
+    text, tokens = fit_rag(items, budget)
+    return text, count_tokens(text) if tokens is None else tokens
+
+
+def build_rag_context(req: QuoteSummaryRequest, budget: int = PROMPT_TOKEN_BUDGET) -> Tuple[str, int]:
+    return compact_rag([it.norm for it in req.items], budget)
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from . import pricing
+from .config import RETRAIN_HOLDOUT, RETRAIN_INTERVAL_S, RETRAIN_SOURCE, RETRAIN_TOLERANCE
+from .executor import pricing_executor
+from .memo import prediction_memo
+
+logger = logging.getLogger(__name__)
+
+
+class RetrainInProgress(Exception):
+    """Raised by :meth:`Retrainer.run_once` while another retrain is running."""
+
+
+class Retrainer:
+    """
+    Fits candidate pricing models off the event loop and swaps accepted ones
+    in. Pricing calls already under way finish on the model they started
+    with; later ones see the new version. An accepted model is persisted to
+    the artifact; on a swap the prediction memo is cleared and process-pool
+    workers are replaced.
+    """
+
+    def __init__(
+        self,
+        source: str = RETRAIN_SOURCE,
+        interval_s: float = RETRAIN_INTERVAL_S,
+        holdout: float = RETRAIN_HOLDOUT,
+        tolerance: float = RETRAIN_TOLERANCE,
+    ):
+        self.source = source
+        self.interval_s = interval_s
+        self.holdout = holdout
+        self.tolerance = tolerance
+        self.runs = {"accepted": 0, "rejected": 0, "failed": 0}
+        self.last: Optional[Dict[str, Any]] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def start(self) -> None:
+        if self._task is None and self.interval_s > 0:
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_s)
+            try:
+                await self.run_once()
+            except Exception:  # in progress via the endpoint, or failed (logged); next interval
+                pass
+
+    async def run_once(self) -> Dict[str, Any]:
+        """Train, validate and (if accepted) swap; returns the run's report."""
+        if self._lock.locked():
+            raise RetrainInProgress()
+        async with self._lock:
+            started = time.monotonic()
+            # a fresh synthetic sample each run; ignored for file sources
+            seed = pricing.TRAINING_SPEC["seed"] + sum(self.runs.values()) + 1
+            try:
+                candidate, report = await asyncio.to_thread(
+                    pricing.retrain, self.source, self.holdout, self.tolerance, seed
+                )
+            except Exception as e:
+                self.runs["failed"] += 1
+                self.last = {"source": self.source, "accepted": False, "error": repr(e)}
+                logger.exception("Pricing model retrain failed")
+                raise
+            if candidate is not None:
+                info = {"source": self.source, "holdout_mae": report["candidate_mae"]}
+                report["persisted"] = await asyncio.to_thread(
+                    pricing.persist, pricing.model_entry(*candidate), **info
+                )
+                # No await from here on: a request that reads the new version
+                # finds the memo cleared and its pricing jobs on new workers.
+                entry = pricing.activate(*candidate, **info)
+                prediction_memo.clear()
+                pricing_executor.reload(entry.kernel.to_state(), entry.version)
+                logger.info("Pricing model %s -> %s (holdout MAE %.2f vs %.2f)",
+                            report["active_version"], entry.version,
+                            report["candidate_mae"], report["active_mae"])
+            else:
+                logger.warning("Pricing model candidate %s rejected (holdout MAE %.2f vs %.2f)",
+                               report["candidate_version"], report["candidate_mae"], report["active_mae"])
+            self.runs["accepted" if candidate is not None else "rejected"] += 1
+            self.last = {**report, "duration_s": round(time.monotonic() - started, 3)}
+            return self.last
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "source": self.source,
+            "interval_s": self.interval_s,
+            "running": self.running,
+            "runs": dict(self.runs),
+            "last": self.last,
+        }
+
+
+retrainer = Retrainer()
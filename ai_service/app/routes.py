@@ -3,24 +3,57 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
-from typing import Iterable, List
-
-import pandas as pd
-from fastapi import APIRouter
-
-from .facts import gather_facts
-from .llm import call_hf, call_openrouter
+import time
+from functools import lru_cache
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import (
+    ORJSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+from pydantic import ValidationError
+from starlette.requests import ClientDisconnect
+
+from . import metrics
+from .batcher import MicroBatcher
+from .cache import summary_cache, summary_key
+from .clients import pool_stats
+from .config import (
+    HF_MODEL,
+    OPENROUTER_MODEL,
+    PRICING_STREAM_CHUNK,
+    PRICING_STREAM_MAX_LINE_BYTES,
+    PROMPT_TOKEN_BUDGET,
+    STREAM_FIRST_TOKEN_S,
+    SUMMARY_BATCH_CONCURRENCY,
+    SUMMARY_BATCH_LIMIT_WAIT_S,
+)
+from .executor import PricingSaturated, pricing_executor
+from .facts import facts_index
+from .hedge import Branch, hedged_first_success, provider_health
+from .llm import call_hf, call_openrouter, stream_openrouter
+from .memo import prediction_memo
+from .metrics import FALLBACKS, current_route, provider_call, stage
 from .models import (
     PredictBatchRequest,
     PredictBatchResponse,
-    PredictItemOut,
+    PriceGridRequest,
+    QuoteItemIn,
     QuoteSummaryRequest,
     QuoteSummaryResponse,
-    _norm_glazing,
-    _norm_material,
-    _norm_product_type,
+    SummaryBatchRequest,
 )
-from .pricing import model
+from .ndjson import DuplexStreamingResponse, dumps_line, iter_lines, loads
+from .pricing import ensure_loaded, is_loaded, model_version, predict_versioned, price_grid
+from .rag import fit_rag, summary_line
+from .retrain import RetrainInProgress, retrainer
+from .singleflight import SingleFlight
+from .streaming import JsonTextExtractor, sse
+from .tokens import count_tokens
+from .warmup import warmup
 
 # --- config flags (optional env switch) ---
 try:
@@ -32,142 +65,232 @@ except Exception:  # default to True if not present
 PROVIDER_DEADLINE_S = 6.0  # per provider hard ceiling
 ROUTE_DEADLINE_S = 8.0  # overall ceiling (race + parse)
 
+# orjson-backed JSON responses (orjson is pinned in requirements.txt)
+JSONOut = ORJSONResponse
+
 logger = logging.getLogger(__name__)
 router = APIRouter()
+_summaries_in_flight = SingleFlight()
+# Shared by every /summarize-quote/batch request: SUMMARY_BATCH_CONCURRENCY
+# bounds the batch quotes in progress across the process, not per request.
+_batch_summary_slots = asyncio.Semaphore(SUMMARY_BATCH_CONCURRENCY)
+pricing_batcher = MicroBatcher(lambda feats: _run_model(feats))
 
 
 # -------------------------- utils --------------------------
 
 
-def _predict_row(it) -> PredictItemOut:
-    """Predict one item and return API payload."""
-    pt = _norm_product_type(it.product_type)
-    mat = _norm_material(it.material)
-    glz = _norm_glazing(it.glazing)
-    area = (it.width_mm * it.height_mm) / 1_000_000.0
-    X = dict(
-        product_type=pt,
-        material=mat,
-        glazing=glz,
-        color_tier=it.color_tier,
-        hardware_tier=it.hardware_tier,
-        install_complexity=it.install_complexity,
-        area=area,
-        qty=it.qty,
+def _version_header(version: Optional[str]) -> dict:
+    """``X-Model-Version`` of the pricing model that priced the response."""
+    return {"X-Model-Version": version} if version else {}
+
+
+def _saturated(e: PricingSaturated) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Pricing is at capacity; retry shortly.",
+        headers={"Retry-After": str(max(1, round(e.retry_after_s)))},
     )
-    pred = float(model.predict(pd.DataFrame([X]))[0])
-    return PredictItemOut(
-        unit_price=round(max(80.0, pred), 2),
-        confidence=0.85,
-        features={"productId": it.product_id, **X},
+
+
+def _features(it) -> dict:
+    """Normalised model features for one item."""
+    n = it.norm
+    return dict(
+        product_type=n.product_type,
+        material=n.material,
+        glazing=n.glazing,
+        color_tier=n.color_tier,
+        hardware_tier=n.hardware_tier,
+        install_complexity=n.install_complexity,
+        area=n.area,
+        qty=n.qty,
     )
 
 
+def _lookup_rows(items: Sequence, version: Optional[str]):
+    """Features, memo keys, memoised predictions (None on miss) and distinct misses."""
+    # Keys carry the version of the model that computed the price, so one
+    # being swapped out is never served once the new one is active.
+    with stage("normalization"):
+        feats = [_features(it) for it in items]
+        keys = [(version, *f.values()) for f in feats]
+    preds = prediction_memo.get_many(keys)
+    misses = {k: f for k, f, p in zip(keys, feats, preds) if p is None}
+    return feats, keys, preds, misses
+
+
+def _build_rows(items: Sequence, feats, keys, preds, fresh, with_features: bool = True) -> List[dict]:
+    """Response rows (PredictItemOut-shaped plain dicts, ready to serialise)."""
+    if fresh:
+        prediction_memo.put_many(fresh)
+        preds = [fresh[k] if p is None else p for k, p in zip(keys, preds)]
+    if not with_features:
+        return [{"unit_price": round(max(80.0, float(p)), 2), "confidence": 0.85} for p in preds]
+    return [
+        {
+            "unit_price": round(max(80.0, float(pred)), 2),
+            "confidence": 0.85,
+            "features": {"productId": it.product_id, **f},
+        }
+        for it, f, pred in zip(items, feats, preds)
+    ]
+
+
+def _predict_rows(items: Sequence, with_features: bool = True) -> Tuple[Optional[str], List[dict]]:
+    """
+    Predict many items: the model version and the rows, in input order.
+    Feature tuples seen before are served from the prediction memo and the
+    distinct misses go to the model in a single call.
+    """
+    if not items:
+        return model_version(), []
+    active = ensure_loaded()  # one model for the memo keys and the misses
+    feats, keys, preds, misses = _lookup_rows(items, active.version)
+    fresh = {}
+    if misses:
+        with stage("inference"):
+            fresh = dict(zip(misses, active.kernel.predict(list(misses.values())).tolist()))
+    return active.version, _build_rows(items, feats, keys, preds, fresh, with_features)
+
+
+async def _run_model(feats: List[dict]) -> List[Tuple[str, float]]:
+    # each row carries the version, so it survives the batcher's per-caller split
+    version, values = await pricing_executor.run(predict_versioned, feats)
+    return [(version, v) for v in values]
+
+
+async def _predict_rows_offloaded(
+    items: Sequence, with_features: bool = True
+) -> Tuple[Optional[str], List[dict]]:
+    """
+    As _predict_rows, off the event loop. Requests of at least the
+    micro-batcher's max_items (or any request when it is disabled) run
+    _predict_rows whole - features, memo, inference and rows - as one pricing
+    executor job. Smaller ones check the memo here and send their misses to the
+    micro-batcher, to share a model call with concurrent requests; if a worker
+    priced them on another model than the memo was read for (mid-swap), the
+    request is priced whole instead.
+    """
+    if not items:
+        return model_version(), []
+    if pricing_batcher.window_s <= 0 or len(items) >= pricing_batcher.max_items:
+        return await pricing_executor.run(_predict_rows, items, with_features)
+    version = model_version()
+    feats, keys, preds, misses = _lookup_rows(items, version)
+    fresh = {}
+    if misses:
+        with stage("inference"):
+            priced = await pricing_batcher.submit(list(misses.values()))
+        if priced[0][0] != version:
+            return await pricing_executor.run(_predict_rows, items, with_features)
+        fresh = {k: v for k, (_, v) in zip(misses, priced)}
+    return version, _build_rows(items, feats, keys, preds, fresh, with_features)
+
+
+def _predict_row(it) -> dict:
+    """Predict one item and return API payload."""
+    return _predict_rows([it])[1][0]
+
+
+_SYSTEM_PROMPT = (
+    "You are a sales assistant for a UK windows & doors company (Reliant). "
+    "Write a concise, factual quotation summary in UK English. Mention quantities, "
+    "dimensions (mm), materials, glazing. Avoid prices and hype. "
+    "End with a short VAT & standards note. "
+    'Return strictly JSON: {"text": string}.'
+)
+
+
+@lru_cache(maxsize=1)
+def _system_tokens() -> int:
+    return count_tokens(_SYSTEM_PROMPT)
+
+
 def _make_prompt(req: QuoteSummaryRequest) -> tuple[str, str]:
     """Build (system, user) prompts from request including in-RAG facts."""
     name = req.customer_name or "the customer"
-    # RAG lines
-    lines: List[str] = []
-    for it in req.items:
-        pt = _norm_product_type(it.product_type)
-        area = (it.width_mm * it.height_mm) / 1_000_000.0
-        lines.append(
-            " ".join(
-                [
-                    f"- product_id={it.product_id or 'n/a'}",
-                    f"type={pt}",
-                    f"size={it.width_mm}x{it.height_mm}mm ({area:.2f} m²)",
-                    f"material={_norm_material(it.material)}",
-                    f"glazing={_norm_glazing(it.glazing)}",
-                    f"color={it.color_tier or '—'}",
-                    f"hardware={it.hardware_tier or '—'}",
-                    f"install={it.install_complexity or '—'}",
-                    f"qty={it.qty}",
-                ]
-            )
-        )
-    rag = "\n".join(lines)
+    norms = [it.norm for it in req.items]
 
     # dedup cross-item facts
-    seen, facts_block = set(), []
-    for it in req.items:
-        for s in gather_facts(
-            _norm_product_type(it.product_type),
-            _norm_material(it.material),
-            _norm_glazing(it.glazing),
-        ):
-            if s not in seen:
-                seen.add(s)
-                facts_block.append(s)
+    facts_block = facts_index.union((n.product_type, n.material, n.glazing) for n in norms)
     facts_text = "\n".join(f"- {s}" for s in facts_block)
 
-    system = (
-        "You are a sales assistant for a UK windows & doors company (Reliant). "
-        "Write a concise, factual quotation summary in UK English. Mention quantities, "
-        "dimensions (mm), materials, glazing. Avoid prices and hype. "
-        "End with a short VAT & standards note. "
-        'Return strictly JSON: {"text": string}.'
-    )
-    user = (
-        f"Customer: {name}\n"
-        f"Items:\n{rag}\n\n"
+    system = _SYSTEM_PROMPT
+    head = f"Customer: {name}\nItems:\n"
+    tail = (
+        "\n\n"
         + (f"Relevant facts:\n{facts_text}\n\n" if facts_text else "")
         + f"VAT rate: {int(req.vat_rate*100)}%"
     )
+    # RAG lines, grouped/trimmed if the prompt would exceed the token budget
+    rag, _ = fit_rag(norms, PROMPT_TOKEN_BUDGET - _system_tokens() - count_tokens(head + tail))
+    user = head + rag + tail
     return system, user
 
 
 def _parse_json_text(content: str) -> str:
     """Accept either JSON {text: ...} or raw text from a model."""
-    try:
-        data = json.loads(content)
-        text = data.get("text", "")
-        return text.strip()
-    except Exception:
-        return content.strip()
+    with stage("parse"):
+        try:
+            data = json.loads(content)
+            text = data.get("text", "")
+            return text.strip()
+        except Exception:
+            return content.strip()
 
 
 def _det_summary_line(i: int, it) -> str:
     """One line of the deterministic summary."""
-    pt = _norm_product_type(it.product_type)
-    area = (it.width_mm * it.height_mm) / 1_000_000.0
-    parts = [
-        f"{i}) {it.qty}× {pt} {_norm_material(it.material)} {_norm_glazing(it.glazing)}",
-        f"({it.width_mm}×{it.height_mm}mm ~ {area:.2f} m²)",
-    ]
-    if it.color_tier:
-        parts.append(f", colour {it.color_tier}")
-    if it.hardware_tier:
-        parts.append(f", hardware {it.hardware_tier}")
-    if it.install_complexity:
-        parts.append(f", install {it.install_complexity}")
-    return " ".join(parts)
+    return summary_line(i, it.norm)
+
+
+def _det_summary(req: QuoteSummaryRequest, reason: str) -> str:
+    """Deterministic summary used when no LLM answers (``reason`` feeds the fallback counter)."""
+    FALLBACKS.inc(route=current_route.get(), reason=reason)
+    name = req.customer_name or "the customer"
+    lines = [summary_line(i, it.norm) for i, it in enumerate(req.items, start=1)]
+    text = (
+        f"Quotation for {name}:\n"
+        + "\n".join(lines)
+        + f"\nPrices exclude VAT; VAT rate {int(req.vat_rate*100)}% applied on invoice. "
+        "All installations FENSA-compliant; A+ energy-rated options available."
+    )
+    return text
 
 
-async def _race_first_success(coros: Iterable[asyncio.Future]) -> str | None:
+async def _race_first_success(branches: Sequence[Branch], wait_s: float = 0.0) -> str | None:
     """
-    Run multiple coroutines concurrently, return the first non-empty parsed
-    text or None if all fail/time out. Cancels the rest upon first success.
+    Return the first non-empty parsed text from the providers, or None if all
+    fail/time out. Providers are hedged rather than all fired at once: the one
+    with the best recent latency goes first and the next only starts if it
+    fails or runs past its rolling p90; providers with an open circuit are skipped.
+    ``wait_s`` is how long to wait for a provider's rate/concurrency capacity.
     """
-    tasks = [asyncio.create_task(c) for c in coros]
-    try:
-        for task in asyncio.as_completed(tasks, timeout=ROUTE_DEADLINE_S):
-            try:
-                content = await task
-                text = _parse_json_text(content)
-                if text:
-                    # Cancel remaining tasks
-                    for t in tasks:
-                        if t is not task and not t.done():
-                            t.cancel()
-                    return text
-            except Exception as e:
-                logger.warning("LLM branch failed: %s", e)
-        return None
-    finally:
-        for t in tasks:
-            if not t.done():
-                t.cancel()
+    return await hedged_first_success(branches, _parse_json_text, ROUTE_DEADLINE_S, wait_s=wait_s)
+
+
+async def _llm_summary(key: str, system: str, user: str, wait_s: float = 0.0) -> str | None:
+    """Race both providers (per-branch ceilings) and cache the winning text."""
+    msgs = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+    branches: list[Branch] = [
+        (
+            "openrouter",
+            lambda: asyncio.wait_for(
+                call_openrouter(msgs, max_tokens=400), timeout=PROVIDER_DEADLINE_S
+            ),
+        ),
+        (
+            "hf",
+            lambda: asyncio.wait_for(
+                call_hf(msgs, max_new_tokens=400), timeout=PROVIDER_DEADLINE_S
+            ),
+        ),
+    ]
+    winner = await _race_first_success(branches, wait_s)
+    if winner and summary_cache is not None:
+        await summary_cache.aset(key, winner)
+    return winner
 
 
 # -------------------------- routes --------------------------
@@ -175,63 +298,487 @@ async def _race_first_success(coros: Iterable[asyncio.Future]) -> str | None:
 
 @router.get("/health")
 def health():
+    """Liveness: answers as soon as the process serves HTTP."""
     return {"status": "ok", "service": "ai"}
 
 
+@router.get("/ready")
+def ready():
+    """Readiness: 200 once the pricing model is loaded, 503 while warming up."""
+    status = warmup.status()
+    return JSONOut(
+        {"status": "ready" if status["ready"] else "loading", **status, "model_version": model_version()},
+        status_code=200 if status["ready"] else 503,
+    )
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/stats")
+def stats():
+    return {
+        "prediction_memo": prediction_memo.stats(),
+        "summary_cache": summary_cache.stats() if summary_cache is not None else None,
+        "pricing_executor": pricing_executor.stats(),
+        "pricing_batcher": pricing_batcher.stats(),
+        "pricing_model": _model_status(),
+        "provider_limits": {p: lim.stats() for p, lim in provider_health.limits.items()},
+    }
+
+
+def _model_status() -> dict:
+    active = ensure_loaded() if is_loaded() else None
+    return {
+        "version": active.version if active else None,
+        "info": active.info if active else None,
+        "retrain": retrainer.status(),
+    }
+
+
+@router.get("/model")
+def model_status():
+    """Serving pricing model version and the background retrainer's state."""
+    return _model_status()
+
+
+@router.post("/model/retrain")
+async def model_retrain():
+    """
+    Retrain now from RETRAIN_SOURCE; the candidate is swapped in only if it
+    passes the holdout check. Returns the run report (``accepted``, both
+    versions and holdout errors); 409 while another retrain is running.
+    """
+    try:
+        return await retrainer.run_once()
+    except RetrainInProgress:
+        raise HTTPException(status_code=409, detail="A retrain is already running.")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Retrain failed: {e}")
+
+
 @router.post("/predict-quote/batch", response_model=PredictBatchResponse)
-def predict_batch(req: PredictBatchRequest):
-    items = [_predict_row(it) for it in req.items]
-    return PredictBatchResponse(items=items)
+async def predict_batch(req: PredictBatchRequest, features: bool = True):
+    """``?features=false`` returns only unit_price and confidence per item."""
+    try:
+        version, items = await _predict_rows_offloaded(req.items, with_features=features)
+    except PricingSaturated as e:
+        raise _saturated(e)
+    # Rows are already JSON-ready; skip re-validating them through the response model.
+    return JSONOut({"items": items}, headers=_version_header(version))
 
 
-@router.post("/summarize-quote", response_model=QuoteSummaryResponse)
-async def summarize(req: QuoteSummaryRequest):
-    name = req.customer_name or "the customer"
+def _grid_csv(widths: Sequence[int], heights: Sequence[int], prices: List[List[float]]) -> str:
+    lines = [",".join(["height_mm/width_mm", *map(str, widths)])]
+    lines += [",".join([str(h), *map(str, row)]) for h, row in zip(heights, prices)]
+    return "\n".join(lines) + "\n"
+
+
+def _grid_body(config: dict, widths: List[int], heights: List[int], fmt: str) -> Tuple[str, bytes]:
+    """
+    The model version and /price-grid response body, built as one pricing
+    executor job: model broadcast, floor and rounding, then the JSON or CSV
+    encoding, so none of it runs on the event loop.
+    """
+    active = ensure_loaded()
+    raw = price_grid(config, widths, heights, active.kernel)
+    prices = [[round(max(80.0, p), 2) for p in row] for row in raw.tolist()]
+    if fmt == "csv":
+        return active.version, _grid_csv(widths, heights, prices).encode()
+    body = JSONOut({"config": config, "widths": widths, "heights": heights, "unit_prices": prices}).body
+    return active.version, body
+
+
+@router.post("/price-grid")
+async def price_grid_matrix(
+    req: PriceGridRequest, fmt: str = Query("json", alias="format", pattern="^(json|csv)$")
+):
+    """
+    Unit prices for one configuration over a width x height grid, one model
+    broadcast for the whole matrix. ``unit_prices[i][j]`` is for ``heights[i]``
+    by ``widths[j]``, floored and rounded exactly as /predict-quote/batch.
+    """
+    widths, heights = list(req.width.values()), list(req.height.values())
+    try:
+        with stage("inference"):
+            version, body = await pricing_executor.run(_grid_body, req.config, widths, heights, fmt)
+    except PricingSaturated as e:
+        raise _saturated(e)
+    media_type = "text/csv" if fmt == "csv" else "application/json"
+    return Response(body, media_type=media_type, headers=_version_header(version))
+
+
+async def _price_chunk(items: Sequence, with_features: bool) -> Tuple[Optional[str], List[dict]]:
+    """Price one stream chunk, waiting out executor saturation rather than failing."""
+    while True:
+        try:
+            return await _predict_rows_offloaded(items, with_features)
+        except PricingSaturated as e:
+            await asyncio.sleep(e.retry_after_s)
+
+
+def _parse_line(line_no: int, raw: bytes | None):
+    """Parse and validate one NDJSON line: (item, item id) or an error record."""
+    if raw is None:
+        return {"line": line_no, "error": "line_too_long",
+                "detail": f"exceeds {PRICING_STREAM_MAX_LINE_BYTES} bytes"}
+    try:
+        obj = loads(raw)
+    except ValueError as e:
+        return {"line": line_no, "error": "invalid_json", "detail": str(e)}
+    if not isinstance(obj, dict):
+        return {"line": line_no, "error": "invalid_item", "detail": "expected a JSON object"}
+    try:
+        return QuoteItemIn.model_validate(obj), obj.get("id")
+    except ValidationError as e:
+        detail = [{"loc": list(err["loc"]), "msg": err["msg"]} for err in e.errors()]
+        return {"line": line_no, "id": obj.get("id"), "error": "validation", "detail": detail}
+
+
+async def _stream_price_lines(body: AsyncIterator[bytes], with_features: bool) -> AsyncIterator[bytes]:
+    """
+    NDJSON results for /predict-quote/stream, in input order: one record per
+    non-blank input line (a price or that line's error), then a summary record.
+    At most PRICING_STREAM_CHUNK items are held at once, and the body is read
+    only as fast as the client takes results.
+    """
+    totals = {"lines": 0, "priced": 0, "errors": 0}
+    slots: list = []  # per line: error record, or (line_no, id) of a pending item
+    items: list = []
+    version = None  # of the model that priced the latest chunk
+
+    async def flush() -> bytes:
+        nonlocal version
+        rows: List[dict] = []
+        if items:
+            try:
+                version, rows = await _price_chunk(items, with_features)
+            except Exception as e:
+                logger.exception("Bulk pricing chunk failed: %s", e)
+        out, it = [], iter(rows)
+        for slot in slots:
+            if isinstance(slot, dict):
+                totals["errors"] += 1
+                out.append(dumps_line(slot))
+                continue
+            line_no, item_id = slot
+            row = next(it, None)
+            if row is None:
+                totals["errors"] += 1
+                rec = {"line": line_no, "error": "pricing_failed"}
+            else:
+                totals["priced"] += 1
+                rec = {"line": line_no, **row}
+            if item_id is not None:
+                rec["id"] = item_id
+            out.append(dumps_line(rec))
+        slots.clear()
+        items.clear()
+        return b"".join(out)
+
+    try:
+        async for line_no, raw in iter_lines(body, PRICING_STREAM_MAX_LINE_BYTES):
+            totals["lines"] += 1
+            parsed = _parse_line(line_no, raw)
+            if isinstance(parsed, dict):
+                slots.append(parsed)
+            else:
+                items.append(parsed[0])
+                slots.append((line_no, parsed[1]))
+            if len(items) >= PRICING_STREAM_CHUNK or len(slots) >= 4 * PRICING_STREAM_CHUNK:
+                yield await flush()
+    except ClientDisconnect:
+        logger.info("Bulk pricing client went away after %d lines", totals["lines"])
+        return
+    if slots:
+        yield await flush()
+    yield dumps_line({"done": True, **totals, "model_version": version or model_version()})
+
+
+@router.post("/predict-quote/stream")
+async def predict_stream(request: Request, features: bool = True):
+    """
+    Bulk pricing over NDJSON: one QuoteItemIn object per request line, one
+    result per line back in the same order (``line`` is the 1-based input
+    line; an input ``id`` is echoed), ending with ``{"done": true, ...}``.
+    """
+    return DuplexStreamingResponse(
+        _stream_price_lines(request.stream(), features), media_type="application/x-ndjson"
+    )
+
 
+async def _summarize(req: QuoteSummaryRequest, wait_s: float = 0.0) -> Tuple[str, str]:
+    """
+    Summary text and its source: ``llm``, ``cache`` or ``fallback``. Providers
+    out of capacity are skipped, or waited for up to ``wait_s``.
+    """
     # Build prompts / RAG once
-    system, user = _make_prompt(req)
+    with stage("prompt"):
+        system, user = _make_prompt(req)
 
     # Optionally skip external calls (offline/CI)
     if USE_EXTERNAL_LLM is False:
         logger.info("Summarize: external LLMs disabled; using deterministic fallback.")
-        lines = [_det_summary_line(i, it) for i, it in enumerate(req.items, start=1)]
-        text = (
-            f"Quotation for {name}:\n"
-            + "\n".join(lines)
-            + f"\nPrices exclude VAT; VAT rate {int(req.vat_rate*100)}% applied on invoice. "
-            "All installations FENSA-compliant; A+ energy-rated options available."
-        )
-        return QuoteSummaryResponse(text=text)
-
-    # Build the two provider calls with per-branch ceilings
-    msgs = [{"role": "system", "content": system}, {"role": "user", "content": user}]
-    coros: list[asyncio.Future] = [
-        asyncio.wait_for(
-            call_openrouter(msgs, max_tokens=400), timeout=PROVIDER_DEADLINE_S
-        ),
-        asyncio.wait_for(
-            call_hf(msgs, max_new_tokens=400), timeout=PROVIDER_DEADLINE_S
-        ),
-    ]
-
-    # Race; first valid text wins
+        return _det_summary(req, "disabled"), "fallback"
+
+    # Same prompt to the same models → reuse an earlier answer
+    key = summary_key(system, user, (OPENROUTER_MODEL, HF_MODEL))
+    if summary_cache is not None:
+        cached = await summary_cache.aget(key)
+        if cached:
+            return cached, "cache"
+
+    # Race; first valid text wins. Identical prompts already in flight share
+    # the one race instead of starting their own, but only with callers
+    # willing to wait as long for provider capacity.
+    reason = "no_answer"
+    flight_key = f"{key}:wait={wait_s:g}" if wait_s else key
     try:
-        winner = await _race_first_success(coros)
+        winner = await _summaries_in_flight.do(
+            flight_key, lambda: _llm_summary(key, system, user, wait_s)
+        )
         if winner:
-            return QuoteSummaryResponse(text=winner)
+            return winner, "llm"
     except asyncio.TimeoutError:
+        reason = "timeout"
         logger.warning(
             "Summarize: overall timeout (%.1fs). Falling back.", ROUTE_DEADLINE_S
         )
     except Exception as e:
+        reason = "error"
         logger.exception("Summarize: unexpected error: %s", e)
 
     # Deterministic fallback
-    lines = [_det_summary_line(i, it) for i, it in enumerate(req.items, start=1)]
-    text = (
-        f"Quotation for {name}:\n"
-        + "\n".join(lines)
-        + f"\nPrices exclude VAT; VAT rate {int(req.vat_rate*100)}% applied on invoice. "
-        "All installations FENSA-compliant; A+ energy-rated options available."
-    )
+    return _det_summary(req, reason), "fallback"
+
+
+@router.post("/summarize-quote", response_model=QuoteSummaryResponse)
+async def summarize(req: QuoteSummaryRequest):
+    text, _ = await _summarize(req)
     return QuoteSummaryResponse(text=text)
+
+
+async def _summarize_each(
+    quotes: Sequence[QuoteSummaryRequest], concurrency: int, slots: asyncio.Semaphore
+) -> AsyncIterator[Tuple[int, str, str]]:
+    """
+    ``(index, text, source)`` for every quote in completion order, with at
+    most ``concurrency`` summaries of this call in progress, each holding one
+    of ``slots`` (shared with other calls). A quote that errors gets its
+    deterministic summary; the rest carry on.
+    """
+    done: asyncio.Queue = asyncio.Queue()
+    todo = iter(enumerate(quotes))  # shared by the workers
+
+    async def worker() -> None:
+        for i, q in todo:
+            try:
+                async with slots:
+                    text, source = await _summarize(q, wait_s=SUMMARY_BATCH_LIMIT_WAIT_S)
+            except Exception as e:
+                logger.exception("Batch summary %d failed: %s", i, e)
+                text, source = _det_summary(q, "error"), "fallback"
+            done.put_nowait((i, text, source))
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(quotes)))]
+    try:
+        for _ in range(len(quotes)):
+            yield await done.get()
+    finally:  # client gone: stop starting new summaries
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+async def _stream_summary_batch(req: SummaryBatchRequest) -> AsyncIterator[bytes]:
+    sources = {"llm": 0, "cache": 0, "fallback": 0}
+    quotes = _summarize_each(req.quotes, SUMMARY_BATCH_CONCURRENCY, _batch_summary_slots)
+    async for i, text, source in quotes:
+        sources[source] += 1
+        rec = {"index": i, "text": text, "source": source}
+        if req.quotes[i].id is not None:
+            rec["id"] = req.quotes[i].id
+        yield dumps_line(rec)
+    yield dumps_line({"done": True, "quotes": len(req.quotes), "sources": sources})
+
+
+@router.post("/summarize-quote/batch")
+async def summarize_batch(req: SummaryBatchRequest):
+    """
+    Summaries for many quotes as NDJSON, one line per quote as soon as it is
+    ready (``index`` into ``quotes``, ``id`` if sent, ``text``, ``source``),
+    then ``{"done": true, ...}``. At most SUMMARY_BATCH_CONCURRENCY quotes run
+    at once across all batch requests.
+    """
+    return StreamingResponse(_stream_summary_batch(req), media_type="application/x-ndjson")
+
+
+async def _stream_summary_events(req: QuoteSummaryRequest) -> AsyncIterator[str]:
+    """
+    SSE frames for /summarize-quote/stream: ``token`` events carrying text as
+    it is generated, then one ``done`` event with the full text and its source.
+    """
+    with stage("prompt"):
+        system, user = _make_prompt(req)
+    key = summary_key(system, user, (OPENROUTER_MODEL, HF_MODEL))
+    cached = await summary_cache.aget(key) if summary_cache is not None else None
+    if cached:
+        yield sse("token", {"text": cached})
+        yield sse("done", {"text": cached, "source": "cache"})
+        return
+    reason = None
+    if USE_EXTERNAL_LLM is False:
+        reason = "disabled"
+    elif not provider_health.available("openrouter"):
+        reason = "circuit_open"
+    elif not provider_health.try_acquire("openrouter"):
+        provider_health.cancel_probe("openrouter")
+        reason = "rate_limited"
+    if reason is not None:
+        text = _det_summary(req, reason)
+        yield sse("token", {"text": text})
+        yield sse("done", {"text": text, "source": "fallback"})
+        return
+
+    msgs = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+    extractor = JsonTextExtractor()
+
+    async def pieces() -> AsyncIterator[str]:
+        async for delta in stream_openrouter(msgs, max_tokens=400):
+            out = extractor.feed(delta)
+            if out:
+                yield out
+        tail = extractor.finish()
+        if tail:
+            yield tail
+
+    started = time.monotonic()
+    end = started + ROUTE_DEADLINE_S
+    gen = pieces()
+    settled = False
+    try:
+        with provider_call("openrouter") as rec:
+            try:
+                first = await asyncio.wait_for(
+                    gen.__anext__(), timeout=min(STREAM_FIRST_TOKEN_S, ROUTE_DEADLINE_S)
+                )
+            except Exception as e:  # timeout, provider error, or an empty completion
+                if isinstance(e, StopAsyncIteration):
+                    rec["outcome"] = "empty"
+                else:
+                    rec["outcome"] = "timeout" if isinstance(e, asyncio.TimeoutError) else "failure"
+                    logger.warning("Summarize stream: no first token (%r). Falling back.", e)
+                provider_health.record_failure("openrouter")
+                settled = True
+                text = _det_summary(req, "first_token")
+                yield sse("token", {"text": text})
+                yield sse("done", {"text": text, "source": "fallback"})
+                return
+
+            yield sse("token", {"text": first})
+            try:
+                while True:
+                    try:
+                        piece = await asyncio.wait_for(
+                            gen.__anext__(), timeout=max(0.0, end - time.monotonic())
+                        )
+                    except StopAsyncIteration:
+                        break
+                    yield sse("token", {"text": piece})
+            except asyncio.TimeoutError:
+                # Slow but still answering: stop at the route deadline without
+                # counting it against the provider.
+                rec["outcome"] = "timeout"
+                logger.warning(
+                    "Summarize stream: overall timeout (%.1fs). Truncating.", ROUTE_DEADLINE_S
+                )
+                yield sse("done", {"text": extractor.text.strip(), "source": "llm", "truncated": True})
+                return
+            except Exception as e:
+                # Tokens already reached the client; report what we have.
+                rec["outcome"] = "failure"
+                logger.warning("Summarize stream: provider failed mid-stream: %s", e)
+                provider_health.record_failure("openrouter")
+                settled = True
+                yield sse("done", {"text": extractor.text.strip(), "source": "llm", "truncated": True})
+                return
+        text = extractor.text.strip()
+        provider_health.record_success("openrouter", time.monotonic() - started)
+        settled = True
+        if summary_cache is not None:
+            await summary_cache.aset(key, text)
+        yield sse("done", {"text": text, "source": "llm"})
+    finally:
+        provider_health.release("openrouter")
+        if not settled:  # client went away or the deadline hit: no verdict
+            provider_health.cancel_probe("openrouter")
+        await gen.aclose()
+
+
+@router.post("/summarize-quote/stream")
+async def summarize_stream(req: QuoteSummaryRequest):
+    return StreamingResponse(
+        _stream_summary_events(req),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _collect_stats() -> List[str]:
+    """Scrape-time export of memo, cache, executor, batcher and client-pool state."""
+    memo = prediction_memo.stats()
+    lines = metrics.family(
+        "ai_prediction_memo_lookups_total", "counter", "Prediction memo lookups by result",
+        ("result",), {("hit",): memo["hits"], ("miss",): memo["misses"]})
+    lines += metrics.family(
+        "ai_prediction_memo_entries", "gauge", "Feature tuples held in the prediction memo",
+        (), {(): memo["size"]})
+    if summary_cache is not None:
+        sc = summary_cache.stats()
+        lines += metrics.family(
+            "ai_summary_cache_lookups_total", "counter", "Summary cache lookups by result",
+            ("result",), {("hit",): sc["hits"], ("miss",): sc["misses"]})
+    ex = pricing_executor.stats()
+    lines += metrics.family(
+        "ai_pricing_pending", "gauge", "Pricing jobs running or queued on the executor",
+        ("backend",), {(ex["backend"],): ex["pending"]})
+    lines += metrics.family(
+        "ai_pricing_rejected_total", "counter", "Pricing requests rejected as saturated",
+        ("backend",), {(ex["backend"],): ex["rejected"]})
+    for name, h, help in (
+        ("ai_pricing_batch_size", pricing_batcher.batch_sizes, "Rows per merged model call"),
+        ("ai_pricing_batch_queue_delay_ms", pricing_batcher.queue_delay_ms,
+         "Milliseconds a pricing submission waited for its batch"),
+    ):
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+        lines += metrics.render_buckets(name, (), (), h.bounds, h.counts, h.total, h.n)
+    lines += metrics.family(
+        "ai_pricing_model_loaded", "gauge", "1 once the pricing model is loaded", (), {(): int(is_loaded())})
+    version = model_version()
+    if version is not None:
+        lines += metrics.family(
+            "ai_pricing_model_info", "gauge", "Serving pricing model version", ("version",), {(version,): 1})
+    lines += metrics.family(
+        "ai_pricing_model_retrains_total", "counter", "Background retrains by result",
+        ("result",), {(r,): n for r, n in retrainer.runs.items()})
+    limits = {p: lim.stats() for p, lim in provider_health.limits.items()}
+    lines += metrics.family(
+        "ai_llm_provider_skipped_total", "counter",
+        "Provider calls skipped client-side for lack of rate or concurrency capacity",
+        ("provider", "reason"),
+        {(p, r): n for p, st in limits.items() for r, n in st["rejected"].items()})
+    lines += metrics.family(
+        "ai_llm_provider_rate_tokens", "gauge", "Calls each provider's rate limit would admit now",
+        ("provider",), {(p,): st["tokens"] for p, st in limits.items() if st["tokens"] is not None})
+    pools = pool_stats()
+    for state in ("active", "idle", "max"):
+        lines += metrics.family(
+            f"ai_llm_pool_connections_{state}", "gauge",
+            f"{state.capitalize()} connections in each provider's HTTP pool",
+            ("provider",), {(p,): st[state] for p, st in pools.items()})
+    return lines
+
+
+metrics.COLLECTORS.append(_collect_stats)
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Dict
+
+_TEXT_KEY = re.compile(r'"text"\s*:\s*"')
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class JsonTextExtractor:
+    """
+    Incrementally pull the ``text`` string out of a streamed ``{"text": ...}``
+    completion, so tokens can be forwarded before the JSON is complete.
+    Completions that do not start with a JSON object (optionally inside a
+    ``` fence) are passed through as plain text.
+    """
+
+    def __init__(self) -> None:
+        self.raw = ""  # everything received
+        self.text = ""  # everything emitted
+        self._mode = "start"  # start | seek | string | done | plain
+        self._buf = ""  # received but not yet consumed
+        self._esc = ""  # partial escape sequence carried across chunks
+
+    def feed(self, chunk: str) -> str:
+        """Consume a chunk and return the newly decoded text (may be empty)."""
+        self.raw += chunk
+        self._buf += chunk
+        out = ""
+        if self._mode == "start":
+            head = self._buf.lstrip()
+            if not head or (head.startswith("`") and "{" not in head):
+                return ""
+            if head.startswith("{") or head.startswith("`"):
+                self._mode = "seek"
+            else:
+                self._mode, out, self._buf = "plain", self._buf.lstrip(), ""
+        if self._mode == "seek":
+            m = _TEXT_KEY.search(self._buf)
+            if m:
+                self._mode, self._buf = "string", self._buf[m.end():]
+        if self._mode == "string":
+            out = self._decode()
+        elif self._mode == "plain":
+            out, self._buf = out + self._buf, ""
+        self.text += out
+        return out
+
+    def _decode(self) -> str:
+        out, buf, i = [], self._esc + self._buf, 0
+        self._esc = ""
+        while i < len(buf):
+            ch = buf[i]
+            if ch == "\\":
+                if i + 1 >= len(buf):
+                    self._esc = buf[i:]
+                    break
+                nxt = buf[i + 1]
+                if nxt == "u":
+                    if i + 6 > len(buf):
+                        self._esc = buf[i:]
+                        break
+                    out.append(chr(int(buf[i + 2:i + 6], 16)))
+                    i += 6
+                    continue
+                out.append(_ESCAPES.get(nxt, nxt))
+                i += 2
+                continue
+            if ch == '"':
+                self._mode = "done"
+                break
+            out.append(ch)
+            i += 1
+        self._buf = ""
+        return "".join(out)
+
+    def finish(self) -> str:
+        """Text to emit at end of stream if no ``text`` field was ever found."""
+        if self.text or self._mode not in ("start", "seek"):
+            return ""
+        try:
+            data = json.loads(self.raw.strip().strip("`").removeprefix("json"))
+            out = str(data.get("text", "")).strip()
+        except Exception:
+            out = self.raw.strip()
+        self.text += out
+        return out
+
+
+def sse(event: str, data: Dict[str, Any]) -> str:
+    """One server-sent event frame."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import importlib.util
+import logging
+import re
+from functools import lru_cache
+from typing import Callable
+
+from .config import PROMPT_TOKENIZER
+
+logger = logging.getLogger(__name__)
+
+# GPT-style pre-tokenisation, already cut to estimated token size: letter runs
+# in sixes and punctuation runs in pairs (each with an optional leading space),
+# digit groups of up to three, whitespace runs.
+_CHUNKS = re.compile(r" ?[^\W\d_]{1,6}| ?\d{1,3}| ?(?:[^\s\w]|_){1,2}|\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Token count for BPE tokenisers (cl100k/o200k style) without loading one.
+    Errs high: long words count one token per six letters, punctuation runs
+    one per two characters, and each non-ASCII character adds one. Never
+    exceeds the text's UTF-8 length.
+    """
+    # subn counts matches without building a string per match
+    n = _CHUNKS.subn("", text)[1]
+    if not text.isascii():
+        n += len(text) - len(text.encode("ascii", "ignore"))
+    return n
+
+
+@lru_cache(maxsize=1)
+def _tokenizer() -> Callable[[str], int]:
+    if PROMPT_TOKENIZER == "tiktoken":
+        if importlib.util.find_spec("tiktoken") is None:
+            logger.warning("PROMPT_TOKENIZER=tiktoken but the package is missing; using the estimate.")
+        else:
+            import tiktoken
+
+            enc = tiktoken.get_encoding("cl100k_base")
+            return lambda text: len(enc.encode(text, disallowed_special=()))
+    return estimate_tokens
+
+
+def count_tokens(text: str) -> int:
+    """Prompt tokens per PROMPT_TOKENIZER."""
+    return _tokenizer()(text)
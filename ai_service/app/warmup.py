@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from . import pricing
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """
+    Loads the pricing model off the event loop after start-up so the server
+    accepts connections (and answers /health) straight away; /ready reports
+    when loading has finished.
+    """
+
+    def __init__(self):
+        self.started_at: Optional[float] = None
+        self.duration_s: Optional[float] = None
+        self.error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return pricing.is_loaded()
+
+    def start(self) -> "asyncio.Task":
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return self._task
+
+    async def _run(self) -> None:
+        self.started_at = time.monotonic()
+        try:
+            await asyncio.to_thread(pricing.ensure_loaded)
+        except Exception as e:  # keep serving; /ready stays 503 and says why
+            self.error = repr(e)
+            logger.exception("Pricing model warm-up failed")
+        finally:
+            self.duration_s = time.monotonic() - self.started_at
+        if self.error is None:
+            logger.info("Pricing model ready after %.2fs", self.duration_s)
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()  # the loader thread itself runs to completion
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "warmup_s": round(self.duration_s, 3) if self.duration_s is not None else None,
+            "error": self.error,
+        }
+
+
+warmup = Warmup()
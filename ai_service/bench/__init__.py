@@ -0,0 +1 @@
+"""Performance harness for the AI service hot paths (``python -m bench``)."""
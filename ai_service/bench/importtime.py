@@ -0,0 +1,66 @@
+"""
+Import-time profile of the service (wraps ``python -X importtime``).
+
+Run from ``ai_service/``::
+
+    python -m bench.importtime                  # top 25 modules by cumulative time
+    python -m bench.importtime --sort self --top 40 --module app.pricing
+    python -m bench.importtime --json > importtime.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile(module: str = "app.app") -> List[Dict[str, object]]:
+    """One row per imported module: self/cumulative microseconds and nesting depth."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=os.environ.copy(), capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append({
+                "module": m.group(4),
+                "self_us": int(m.group(1)),
+                "cumulative_us": int(m.group(2)),
+                "depth": (len(m.group(3)) - 1) // 2,
+            })
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m bench.importtime", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--module", default="app.app", help="module to import (default app.app)")
+    ap.add_argument("--top", type=int, default=25)
+    ap.add_argument("--sort", choices=["cumulative", "self"], default="cumulative")
+    ap.add_argument("--json", action="store_true", help="print all rows as JSON")
+    args = ap.parse_args(argv)
+
+    rows = profile(args.module)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    total = next((r["cumulative_us"] for r in rows if r["module"] == args.module), 0)
+    rows.sort(key=lambda r: r[f"{args.sort}_us"], reverse=True)
+    print(f"import {args.module}: {total / 1000:.1f} ms total\n")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for r in rows[:args.top]:
+        print(f"{r['cumulative_us'] / 1000:14.1f} {r['self_us'] / 1000:9.1f}  {r['module']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Benchmarks for the AI service hot paths.
+
+Run from ``ai_service/``::
+
+    python -m bench --out bench.json                     # full run
+    python -m bench --quick --baseline bench.json        # compare, exit 1 on regression
+
+Every case reports median/p95 wall time in milliseconds; ``--baseline``
+compares medians against an earlier ``--out`` file and fails when any case
+is slower by more than ``--threshold`` (fractional, default 0.25).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .stub_llm import StubConfig, StubServer, free_port
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PRODUCT_TYPES = ["window", "Window", "bifold door", "french door", "door", "conservatory", "orangery"]
+MATERIALS = ["uPVC", "upvc", "Aluminium", "Composite"]
+GLAZINGS = ["double", "triple", "Double"]
+TIERS = [None, "Standard", "Premium"]
+INSTALLS = [None, "Standard", "Complex"]
+STANDARD_SIZES = [600, 900, 1200, 1500, 1800, 2100, 2400]
+
+
+def make_items(n: int, seed: int = 0, catalogue_share: float = 0.8) -> List[Dict[str, Any]]:
+    """Request items; ``catalogue_share`` of them use standard sizes so memo hits are realistic."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        std = rng.random() < catalogue_share
+        size = (lambda: rng.choice(STANDARD_SIZES)) if std else (lambda: rng.randint(300, 4000))
+        out.append({
+            "productType": rng.choice(PRODUCT_TYPES),
+            "productId": rng.randint(1, 40),
+            "widthMm": size(),
+            "heightMm": size(),
+            "material": rng.choice(MATERIALS),
+            "glazing": rng.choice(GLAZINGS),
+            "colorTier": rng.choice(TIERS),
+            "hardwareTier": rng.choice(TIERS),
+            "installComplexity": rng.choice(INSTALLS),
+            "qty": rng.randint(1, 6),
+        })
+    return out
+
+
+def _summarise(samples: List[float], items: Optional[int] = None) -> Dict[str, float]:
+    samples = sorted(samples)
+    res = {
+        "median_ms": statistics.median(samples) * 1000,
+        "p95_ms": samples[min(len(samples) - 1, int(0.95 * len(samples)))] * 1000,
+        "runs": len(samples),
+    }
+    if items:
+        res["per_item_us"] = res["median_ms"] * 1000 / items
+    return res
+
+
+def time_sync(fn: Callable[[], Any], repeat: int, setup: Optional[Callable[[], Any]] = None,
+              items: Optional[int] = None) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return _summarise(samples, items)
+
+
+async def time_async(fn: Callable[[], Awaitable[Any]], repeat: int, concurrency: int = 1,
+                     setup: Optional[Callable[[], Any]] = None,
+                     items: Optional[int] = None) -> Dict[str, float]:
+    samples: List[float] = []
+
+    async def one():
+        t0 = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - t0)
+
+    for _ in range(max(1, repeat // concurrency)):
+        if setup:
+            setup()
+        await asyncio.gather(*(one() for _ in range(concurrency)))
+    return _summarise(samples, items)
+
+
+# Fresh process until the lifespan has started and the model warm-up finished.
+_READY_SNIPPET = """
+import asyncio
+from app.app import create_app
+from app.warmup import warmup
+app = create_app()
+async def main():
+    async with app.router.lifespan_context(app):
+        await warmup.start()
+asyncio.run(main())
+"""
+
+
+def bench_startup(repeat: int) -> Dict[str, Dict[str, float]]:
+    """Fresh-interpreter import time of app.pricing and the app factory, and time to ready."""
+    out = {}
+    for name, code in (
+        ("startup.import_pricing", "import app.pricing"),
+        ("startup.create_app", "from app.app import create_app; create_app()"),
+        ("startup.ready", _READY_SNIPPET),
+    ):
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True, env=os.environ.copy())
+            samples.append(time.perf_counter() - t0)
+        out[name] = _summarise(samples)
+    return out
+
+
+def bench_cpu(sizes: List[int], repeat: int) -> Dict[str, Dict[str, float]]:
+    from app.facts import facts_index, gather_facts
+    from app.memo import prediction_memo
+    from app.models import QuoteItemIn, QuoteSummaryRequest
+    from app.rag import build_rag_context
+    from app.routes import _make_prompt, _predict_row, _predict_rows
+
+    out: Dict[str, Dict[str, float]] = {}
+    one = QuoteItemIn(**make_items(1, seed=1)[0])
+    out["predict_row"] = time_sync(lambda: _predict_row(one), repeat * 20, setup=prediction_memo.clear)
+    for n in sizes:
+        items = [QuoteItemIn(**d) for d in make_items(n, seed=n)]
+        reps = max(3, repeat if n <= 1000 else repeat // 4)
+        out[f"predict_rows.cold[n={n}]"] = time_sync(
+            lambda: _predict_rows(items), reps, setup=prediction_memo.clear, items=n)
+        _predict_rows(items)
+        out[f"predict_rows.warm[n={n}]"] = time_sync(lambda: _predict_rows(items), reps, items=n)
+
+    for n in (10, 100, 1000):
+        req = QuoteSummaryRequest(customer_name="Bench", items=make_items(n, seed=n))
+        out[f"make_prompt[n={n}]"] = time_sync(lambda: _make_prompt(req), repeat, items=n)
+        out[f"build_rag_context[n={n}]"] = time_sync(lambda: build_rag_context(req), repeat, items=n)
+
+    combos = [("window", "uPVC", "double"), ("door", "Composite", "triple"), ("conservatory", "Aluminium", "double")]
+    out["gather_facts[x1000]"] = time_sync(
+        lambda: [gather_facts(*c) for _ in range(334) for c in combos], repeat)
+    out["facts_union[n=1000]"] = time_sync(lambda: facts_index.union(combos * 334), repeat)
+    return out
+
+
+async def bench_http(sizes: List[int], repeat: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    import httpx
+
+    from app.app import create_app
+    from app.hedge import provider_health
+    from app.memo import prediction_memo
+
+    app = create_app()
+    out: Dict[str, Dict[str, float]] = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as c:
+            for n in sizes:
+                body = {"items": make_items(n, seed=n)}
+
+                async def predict():
+                    r = await c.post("/predict-quote/batch", json=body)
+                    r.raise_for_status()
+
+                async def predict_slim():
+                    r = await c.post("/predict-quote/batch?features=false", json=body)
+                    r.raise_for_status()
+
+                reps = max(3, repeat if n <= 1000 else repeat // 4)
+                out[f"predict_batch.http[n={n}]"] = await time_async(
+                    predict, reps, setup=prediction_memo.clear, items=n)
+                out[f"predict_batch.http.slim[n={n}]"] = await time_async(
+                    predict_slim, reps, setup=prediction_memo.clear, items=n)
+
+            grid = {"product_type": "window", "material": "uPVC", "glazing": "double",
+                    "width": {"start": 600, "stop": 2400, "step": 50},
+                    "height": {"start": 600, "stop": 2400, "step": 50}}
+
+            async def price_grid():
+                r = await c.post("/price-grid", json=grid)
+                r.raise_for_status()
+
+            out["price_grid.http[37x37]"] = await time_async(price_grid, repeat, items=37 * 37)
+
+            counter = iter(range(10**9))
+
+            def summary_body(n_items: int) -> Dict[str, Any]:
+                # unique customer per request so cache/coalescing never short-circuit
+                return {"customerName": f"Bench {next(counter)}", "items": make_items(n_items, seed=3)}
+
+            async def summarize():
+                r = await c.post("/summarize-quote", json=summary_body(5))
+                r.raise_for_status()
+
+            async def stream_ttfb():
+                async with c.stream("POST", "/summarize-quote/stream", json=summary_body(5)) as r:
+                    async for _ in r.aiter_raw():
+                        break
+
+            provider_health.reset()
+            for conc in sorted({1, concurrency}):
+                out[f"summarize.e2e[c={conc}]"] = await time_async(summarize, repeat, concurrency=conc)
+            out["summarize.stream.ttfb"] = await time_async(stream_ttfb, repeat)
+    return out
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            threshold: float) -> List[str]:
+    """Cases whose median slowed down by more than ``threshold`` versus the baseline."""
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base or base.get("median_ms", 0) <= 0:
+            continue
+        ratio = res["median_ms"] / base["median_ms"]
+        if ratio > 1 + threshold:
+            regressions.append(
+                f"{name}: {res['median_ms']:.3f} ms vs {base['median_ms']:.3f} ms (x{ratio:.2f})")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m bench", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--quick", action="store_true", help="smaller sizes and fewer repeats")
+    ap.add_argument("--out", type=Path, help="write JSON results here")
+    ap.add_argument("--baseline", type=Path, help="earlier --out file to compare against")
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown (0.25 = +25%%)")
+    ap.add_argument("--only", choices=["startup", "cpu", "http"], action="append",
+                    help="run only these groups (repeatable)")
+    ap.add_argument("--concurrency", type=int, default=8, help="parallel /summarize-quote callers")
+    ap.add_argument("--llm-latency-ms", type=float, default=200.0)
+    ap.add_argument("--llm-jitter-ms", type=float, default=50.0)
+    ap.add_argument("--llm-failure-rate", type=float, default=0.0)
+    args = ap.parse_args(argv)
+
+    groups = set(args.only or ["startup", "cpu", "http"])
+    sizes = [1, 10, 100, 1000] if args.quick else [1, 10, 100, 1000, 10000]
+    repeat = 5 if args.quick else 30
+
+    # Point the service at the stub before any app module reads its config.
+    port = free_port()
+    os.environ.update({
+        "OPENROUTER_API_KEY": "bench",
+        "HUGGINGFACE_API_KEY": "bench",
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{port}",
+        "HF_BASE_URL": f"http://127.0.0.1:{port}",
+        "USE_EXTERNAL_LLM": "true",
+        "SUMMARY_CACHE_BACKEND": "off",
+        # the client-side provider limits would turn summarize.* into timing
+        # the rate-limited fallback once the bursts are spent
+        "OPENROUTER_RATE_PER_MIN": "0",
+        "OPENROUTER_MAX_IN_FLIGHT": "0",
+        "HF_RATE_PER_MIN": "0",
+        "HF_MAX_IN_FLIGHT": "0",
+    })
+    sys.path.insert(0, str(ROOT))
+
+    results: Dict[str, Dict[str, float]] = {}
+    if "startup" in groups:
+        results.update(bench_startup(3 if args.quick else 5))
+    if "cpu" in groups:
+        results.update(bench_cpu(sizes, repeat))
+    if "http" in groups:
+        stub = StubConfig(args.llm_latency_ms, args.llm_jitter_ms, args.llm_failure_rate)
+        with StubServer(stub, port):
+            results.update(asyncio.run(bench_http(sizes, repeat, args.concurrency)))
+
+    for name, res in results.items():
+        extra = f"  {res['per_item_us']:.2f} us/item" if "per_item_us" in res else ""
+        print(f"{name:36s} median {res['median_ms']:10.3f} ms  p95 {res['p95_ms']:10.3f} ms{extra}")
+
+    doc = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: str(v) for k, v in vars(args).items()},
+        },
+        "results": results,
+    }
+    if args.out:
+        args.out.write_text(json.dumps(doc, indent=2))
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text())["results"], args.threshold)
+        if regressions:
+            print("\nREGRESSIONS:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print(f"\nNo regressions beyond +{args.threshold:.0%} against {args.baseline}")
@@ -0,0 +1,100 @@
+"""Local stand-in for OpenRouter and the HF inference API with injectable latency and failures."""
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+SUMMARY = "Quotation summary from the stub LLM. Prices exclude VAT."
+
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 200.0
+    jitter_ms: float = 50.0
+    failure_rate: float = 0.0
+    seed: int = 0
+
+
+def make_app(cfg: StubConfig) -> Starlette:
+    rng = random.Random(cfg.seed)
+    calls = {"openrouter": 0, "hf": 0, "failed": 0}
+
+    async def _delay_or_fail(provider: str):
+        calls[provider] += 1
+        await asyncio.sleep(max(0.0, cfg.latency_ms + rng.uniform(-1, 1) * cfg.jitter_ms) / 1000)
+        if rng.random() < cfg.failure_rate:
+            calls["failed"] += 1
+            return Response(status_code=503)
+        return None
+
+    async def chat(request: Request):
+        body = await request.json()
+        failed = await _delay_or_fail("openrouter")
+        if failed is not None:
+            return failed
+        content = json.dumps({"text": SUMMARY})
+        if body.get("stream"):
+            async def frames():
+                for i in range(0, len(content), 8):
+                    delta = {"choices": [{"delta": {"content": content[i:i + 8]}}]}
+                    yield f"data: {json.dumps(delta)}\n\n"
+                    await asyncio.sleep(0.002)
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(frames(), media_type="text/event-stream")
+        return JSONResponse({"choices": [{"message": {"content": content}}]})
+
+    async def hf(request: Request):
+        failed = await _delay_or_fail("hf")
+        if failed is not None:
+            return failed
+        return JSONResponse([{"generated_text": json.dumps({"text": SUMMARY})}])
+
+    async def stats(request: Request):
+        return JSONResponse(calls)
+
+    return Starlette(routes=[
+        Route("/chat/completions", chat, methods=["POST"]),
+        Route("/models/{model:path}", hf, methods=["POST"]),
+        Route("/stats", stats),
+    ])
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StubServer:
+    """Runs the stub in a background thread: ``with StubServer(cfg, port) as url: ...``."""
+
+    def __init__(self, cfg: StubConfig, port: int):
+        self.port = port
+        self._server = uvicorn.Server(
+            uvicorn.Config(make_app(cfg), host="127.0.0.1", port=port, log_level="warning")
+        )
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self) -> str:
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("stub LLM server did not start")
+            time.sleep(0.01)
+        return f"http://127.0.0.1:{self.port}"
+
+    def __exit__(self, *exc) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
@@ -7,6 +7,30 @@ def test_health(client):
     assert r.json()["status"] == "ok"
 
 
+def test_ready_reports_model_loaded(client):
+    import time
+
+    deadline = time.monotonic() + 30
+    r = client.get("/ready")
+    while r.status_code == 503 and time.monotonic() < deadline:
+        assert r.json()["status"] == "loading"
+        time.sleep(0.05)
+        r = client.get("/ready")
+    assert r.status_code == 200
+    assert r.json()["status"] == "ready" and r.json()["error"] is None
+
+
+def test_app_import_defers_heavy_modules():
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    code = "import sys, app.app; print(sorted({'pandas', 'sklearn'} & set(sys.modules)))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).resolve().parents[1],
+                         capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]"
+
+
 def test_predict_batch_snake_case(client):
     payload = {
         "items": [
@@ -85,6 +109,94 @@ def test_predict_defaults_when_missing_or_unknown(client):
     assert feat["glazing"] == "double"
 
 
+def test_predict_batch_prefers_snake_case_when_both_sent(client):
+    item = {"product_type": "door", "productType": "window", "width_mm": 900, "widthMm": 3000,
+            "height_mm": 2100, "material": "Composite", "glazing": "double", "qty": 1}
+    feat = client.post("/predict-quote/batch", json={"items": [item]}).json()["items"][0]["features"]
+    assert feat["product_type"] == "door"
+    assert feat["area"] == pytest.approx(0.9 * 2.1)
+
+
+def test_predict_batch_slim_mode_omits_features(client):
+    payload = {"items": [{"widthMm": 1200, "heightMm": 1200, "material": "uPVC",
+                          "glazing": "double", "qty": 1}] * 3}
+    full = client.post("/predict-quote/batch", json=payload)
+    slim = client.post("/predict-quote/batch?features=false", json=payload)
+    assert slim.status_code == 200
+    assert slim.headers["content-type"] == "application/json"
+    assert [set(it) for it in slim.json()["items"]] == [{"unit_price", "confidence"}] * 3
+    assert [it["unit_price"] for it in slim.json()["items"]] == [
+        it["unit_price"] for it in full.json()["items"]]
+
+
+def test_predict_batch_matches_single_item_calls(client):
+    items = [
+        {"product_type": "window", "width_mm": 600, "height_mm": 900,
+         "material": "uPVC", "glazing": "double", "qty": 3},
+        {"product_type": "conservatory", "width_mm": 3500, "height_mm": 2500,
+         "material": "Aluminium", "glazing": "triple", "qty": 1,
+         "color_tier": "Premium", "install_complexity": "Complex"},
+        {"product_type": "french door", "width_mm": 1500, "height_mm": 2100,
+         "material": "Composite", "glazing": "double", "qty": 2,
+         "hardware_tier": "Premium"},
+    ]
+    batch = client.post("/predict-quote/batch", json={"items": items}).json()["items"]
+    singles = [
+        client.post("/predict-quote/batch", json={"items": [it]}).json()["items"][0]
+        for it in items
+    ]
+    assert batch == singles
+
+
+def test_large_batch_is_priced_in_one_executor_job(client, monkeypatch):
+    from ai_service.app import routes
+
+    jobs = []
+    run = routes.pricing_executor.run
+
+    async def spy(fn, *args):
+        jobs.append(fn)
+        return await run(fn, *args)
+
+    items = [{"product_type": "window", "width_mm": 600 + 50 * i, "height_mm": 900,
+              "material": "uPVC", "glazing": "double", "qty": 1} for i in range(4)]
+    small = client.post("/predict-quote/batch", json={"items": items}).json()["items"]
+    monkeypatch.setattr(routes.pricing_batcher, "max_items", 4)
+    monkeypatch.setattr(routes.pricing_executor, "run", spy)
+    large = client.post("/predict-quote/batch", json={"items": items}).json()["items"]
+    assert jobs == [routes._predict_rows]
+    assert large == small
+
+
+def test_predict_batch_memoises_repeated_configurations(client):
+    from ai_service.app.memo import prediction_memo
+
+    item = {"product_type": "window", "width_mm": 1234, "height_mm": 987,
+            "material": "Aluminium", "glazing": "triple", "qty": 2}
+    before = prediction_memo.stats()
+    r = client.post("/predict-quote/batch", json={"items": [item] * 10})
+    prices = {it["unit_price"] for it in r.json()["items"]}
+    after = client.get("/stats").json()["prediction_memo"]
+    assert len(prices) == 1
+    assert after["hits"] + after["misses"] - before["hits"] - before["misses"] == 10
+    again = client.post("/predict-quote/batch", json={"items": [item]}).json()["items"][0]
+    assert again["unit_price"] in prices
+    assert client.get("/stats").json()["prediction_memo"]["hits"] == after["hits"] + 1
+
+
+def test_predict_batch_503_when_pricing_saturated(client, monkeypatch):
+    from ai_service.app import routes
+    from ai_service.app.executor import PricingExecutor
+
+    full = PricingExecutor(backend="inline", max_pending=0, retry_after_s=3)
+    monkeypatch.setattr(routes, "pricing_executor", full)
+    item = {"product_type": "door", "width_mm": 777, "height_mm": 2011,
+            "material": "uPVC", "glazing": "double", "qty": 1}
+    r = client.post("/predict-quote/batch", json={"items": [item]})
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "3"
+
+
 @pytest.mark.parametrize(
     "field,value",
     [
@@ -107,6 +219,172 @@ def test_predict_batch_validation_422(client, field, value):
     assert r.status_code == 422
 
 
+def test_predict_stream_prices_lines_in_order(client, monkeypatch):
+    import json
+
+    from ai_service.app import routes
+
+    monkeypatch.setattr(routes, "PRICING_STREAM_CHUNK", 2)
+    monkeypatch.setattr(routes, "PRICING_STREAM_MAX_LINE_BYTES", 400)
+    items = [
+        {"id": "a", "product_type": "window", "width_mm": 600, "height_mm": 900,
+         "material": "uPVC", "glazing": "double", "qty": 3},
+        {"productType": "door", "widthMm": 900, "heightMm": 2100,
+         "material": "Composite", "glazing": "double", "qty": 1},
+        {"product_type": "conservatory", "width_mm": 3500, "height_mm": 2500,
+         "material": "Aluminium", "glazing": "triple", "qty": 1},
+    ]
+    body = "\n".join([
+        json.dumps(items[0]), "{not json", "", json.dumps(items[1]),
+        json.dumps({"id": 7, "width_mm": 10, "height_mm": 900, "material": "uPVC",
+                    "glazing": "double", "qty": 1}),
+        json.dumps({**items[2], "note": "x" * 500}), json.dumps(items[2]),
+    ])
+    r = client.post("/predict-quote/stream", content=body.encode())
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/x-ndjson"
+    recs = [json.loads(ln) for ln in r.text.splitlines()]
+
+    expected = client.post("/predict-quote/batch", json={"items": items}).json()["items"]
+    assert [rec["line"] for rec in recs[:-1]] == [1, 2, 4, 5, 6, 7]
+    assert recs[0]["id"] == "a" and recs[0]["unit_price"] == expected[0]["unit_price"]
+    assert recs[1]["error"] == "invalid_json"
+    assert recs[2]["unit_price"] == expected[1]["unit_price"] and "id" not in recs[2]
+    assert recs[3]["error"] == "validation" and recs[3]["id"] == 7
+    assert recs[3]["detail"][0]["loc"] == ["width_mm"]
+    assert recs[4]["error"] == "line_too_long"
+    assert recs[5]["features"] == expected[2]["features"]
+    assert recs[-1] == {"done": True, "lines": 6, "priced": 3, "errors": 3,
+                        "model_version": client.get("/model").json()["version"]}
+
+
+def test_ndjson_iter_lines_across_chunk_boundaries():
+    import asyncio
+
+    from ai_service.app.ndjson import iter_lines
+
+    async def chunks():
+        for c in [b'{"a"', b':1}\n\n{"b":2', b"}\n" + b"x" * 6, b"x" * 6 + b"\n", b"  \n{}"]:
+            yield c
+
+    async def collect():
+        return [got async for got in iter_lines(chunks(), max_line_bytes=10)]
+
+    assert asyncio.run(collect()) == [(1, b'{"a":1}'), (3, b'{"b":2}'), (4, None), (6, b"{}")]
+
+
+def test_price_grid_matches_batch_pricing(client):
+    body = {"productType": "Conservatory", "material": "aluminium", "glazing": "Triple",
+            "color_tier": "Premium", "install_complexity": "Complex", "qty": 2,
+            "width": {"start": 1800, "stop": 3600, "step": 450},
+            "height": {"start": 2000, "stop": 2600, "step": 300}}
+    r = client.post("/price-grid", json=body)
+    assert r.status_code == 200
+    grid = r.json()
+    assert grid["widths"] == [1800, 2250, 2700, 3150, 3600]
+    assert grid["heights"] == [2000, 2300, 2600]
+    assert grid["config"]["material"] == "Aluminium"
+
+    items = [{"product_type": "conservatory", "material": "Aluminium", "glazing": "triple",
+              "color_tier": "Premium", "install_complexity": "Complex", "qty": 2,
+              "width_mm": w, "height_mm": h} for h in grid["heights"] for w in grid["widths"]]
+    batch = client.post("/predict-quote/batch?features=false", json={"items": items}).json()["items"]
+    assert [p for row in grid["unit_prices"] for p in row] == [it["unit_price"] for it in batch]
+
+    csv = client.post("/price-grid?format=csv", json=body)
+    assert csv.headers["content-type"].startswith("text/csv")
+    lines = csv.text.splitlines()
+    assert lines[0] == "height_mm/width_mm,1800,2250,2700,3150,3600"
+    assert lines[1] == ",".join(["2000", *map(str, grid["unit_prices"][0])])
+
+
+def test_price_grid_body_is_built_in_the_pricing_job(client, monkeypatch):
+    from ai_service.app import routes
+
+    jobs = []
+    run = routes.pricing_executor.run
+
+    async def spy(fn, *args):
+        jobs.append(fn)
+        return await run(fn, *args)
+
+    monkeypatch.setattr(routes.pricing_executor, "run", spy)
+    body = {"material": "uPVC", "glazing": "double",
+            "width": {"start": 600, "stop": 900, "step": 100},
+            "height": {"start": 600, "stop": 700, "step": 100}}
+    grid = client.post("/price-grid", json=body)
+    csv = client.post("/price-grid?format=csv", json=body)
+    assert jobs == [routes._grid_body, routes._grid_body]
+    assert grid.headers["content-type"] == "application/json"
+    assert csv.text.splitlines()[1] == ",".join(["600", *map(str, grid.json()["unit_prices"][0])])
+
+
+@pytest.mark.parametrize("width", [
+    {"start": 900, "stop": 600},
+    {"start": 300, "stop": 4000, "step": 1},
+    {"start": 200, "stop": 600},
+])
+def test_price_grid_rejects_bad_ranges(client, width):
+    body = {"material": "uPVC", "glazing": "double", "width": width,
+            "height": {"start": 300, "stop": 4000, "step": 10}}
+    assert client.post("/price-grid", json=body).status_code == 422
+
+
+def test_prices_from_a_worker_on_another_model_are_not_served_as_current(client, monkeypatch):
+    from ai_service.app import routes
+    from ai_service.app.memo import prediction_memo
+
+    item = {"product_type": "window", "width_mm": 1234, "height_mm": 987,
+            "material": "uPVC", "glazing": "triple", "qty": 1}
+    prediction_memo.clear()
+    # a process worker still on the previous model answers the micro-batch
+    async def previous_model(feats):
+        return [("previous", 1e6)] * len(feats)
+
+    monkeypatch.setattr(routes, "_run_model", previous_model)
+    stale = client.post("/predict-quote/batch", json={"items": [item]})
+    monkeypatch.undo()
+    fresh = client.post("/predict-quote/batch", json={"items": [item]})
+    assert stale.headers["x-model-version"] == fresh.headers["x-model-version"] == routes.model_version()
+    assert stale.json() == fresh.json() and fresh.json()["items"][0]["unit_price"] < 1e6
+
+
+def test_model_retrain_swaps_version_without_downtime(client, tmp_path, monkeypatch):
+    from ai_service.app import pricing
+    from ai_service.app.executor import pricing_executor
+
+    original = pricing.ensure_loaded()
+    monkeypatch.setattr(pricing, "MODEL_ARTIFACT_PATH", str(tmp_path / "pricing.pkl"))
+    monkeypatch.setattr(pricing, "_stored_version", pricing._stored_version)
+    item = {"product_type": "door", "width_mm": 1000, "height_mm": 2100,
+            "material": "Composite", "glazing": "double", "qty": 1}
+    before = client.post("/predict-quote/batch", json={"items": [item]})
+    assert before.headers["x-model-version"] == original.version
+    try:
+        report = client.post("/model/retrain").json()
+        assert report["accepted"] and report["active_version"] == original.version
+        assert report["candidate_version"] != original.version and report["persisted"]
+        after = client.post("/predict-quote/batch", json={"items": [item]})
+        assert after.status_code == 200
+        assert after.headers["x-model-version"] == report["candidate_version"]
+        assert client.get("/model").json()["info"]["source"] == "synthetic"
+        assert f'ai_pricing_model_info{{version="{report["candidate_version"]}"}} 1' in \
+            client.get("/metrics").text
+    finally:
+        pricing.activate(original.model, original.kernel, **original.info)
+        pricing_executor.reload(original.kernel.to_state(), original.version)
+    assert client.post("/predict-quote/batch", json={"items": [item]}).json() == before.json()
+
+
+def test_provider_clients_are_pooled(client):
+    from ai_service.app.clients import get_client
+
+    c = get_client("openrouter")
+    assert c is not None and not c.is_closed
+    assert get_client("openrouter") is c
+    assert get_client("hf") is not c
+
+
 def test_summarize_snake_case(client):
     payload = {
         "customer_name": "Smith Family",
@@ -151,6 +429,303 @@ def test_summarize_camel_case(client):
     assert "5%" in text
 
 
+def test_summarize_reuses_cached_llm_answer(client, monkeypatch):
+    from ai_service.app import routes
+    from ai_service.app.hedge import provider_health
+
+    calls = []
+    provider_health.reset()
+
+    async def fake_llm(msgs, **kw):
+        calls.append(1)
+        return '{"text": "Cached summary for Cache Co"}'
+
+    monkeypatch.setattr(routes, "USE_EXTERNAL_LLM", True)
+    monkeypatch.setattr(routes, "call_openrouter", fake_llm)
+    monkeypatch.setattr(routes, "call_hf", fake_llm)
+    payload = {
+        "customer_name": "Cache Co",
+        "items": [{"product_type": "door", "width_mm": 900, "height_mm": 2100,
+                   "material": "Composite", "glazing": "double", "qty": 1}],
+    }
+    first = client.post("/summarize-quote", json=payload).json()["text"]
+    n = len(calls)
+    second = client.post("/summarize-quote", json=payload).json()["text"]
+    assert first == second == "Cached summary for Cache Co"
+    assert len(calls) == n
+
+
+def test_summarize_batch_streams_bounded_results(client, monkeypatch):
+    import asyncio
+    import json
+
+    from ai_service.app import routes
+    from ai_service.app.hedge import provider_health
+
+    running, peak = [0], [0]
+    provider_health.reset()
+
+    async def fake_llm(msgs, **kw):
+        prompt = msgs[1]["content"]
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        try:
+            # later quotes answer sooner, so completion order differs from input order
+            await asyncio.sleep(0.06 - 0.01 * int(prompt.split("Batch Co ")[1][0]))
+            if "Batch Co 2" in prompt:
+                raise RuntimeError("provider down")
+            return json.dumps({"text": "LLM summary " + prompt.split("Customer: ")[1].split("\n")[0]})
+        finally:
+            running[0] -= 1
+
+    monkeypatch.setattr(routes, "USE_EXTERNAL_LLM", True)
+    monkeypatch.setattr(routes, "SUMMARY_BATCH_CONCURRENCY", 2)
+    monkeypatch.setattr(routes, "_batch_summary_slots", asyncio.Semaphore(2))
+    monkeypatch.setattr(routes, "call_openrouter", fake_llm)
+    monkeypatch.setattr(routes, "call_hf", fake_llm)
+    item = {"product_type": "window", "width_mm": 1000, "height_mm": 1000,
+            "material": "uPVC", "glazing": "double", "qty": 1}
+    quotes = [{"id": f"q{i}", "customerName": f"Batch Co {i}", "items": [item]} for i in range(5)]
+    r = client.post("/summarize-quote/batch", json={"quotes": quotes})
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/x-ndjson"
+    recs = [json.loads(ln) for ln in r.text.splitlines()]
+    done, results = recs[-1], {rec["index"]: rec for rec in recs[:-1]}
+
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    assert [rec["index"] for rec in recs[:-1]] != [0, 1, 2, 3, 4]
+    assert peak[0] <= 2
+    assert results[2]["source"] == "fallback" and "Quotation for Batch Co 2" in results[2]["text"]
+    assert all(results[i]["text"] == f"LLM summary Batch Co {i}" and results[i]["source"] == "llm"
+               for i in (0, 1, 3, 4))
+    assert results[3]["id"] == "q3"
+    assert done == {"done": True, "quotes": 5, "sources": {"llm": 4, "cache": 0, "fallback": 1}}
+
+    assert client.post("/summarize-quote/batch", json={"quotes": []}).status_code == 422
+
+
+def test_summarize_batch_limit_is_shared_across_requests(monkeypatch):
+    import asyncio
+
+    from ai_service.app import routes
+    from ai_service.app.models import QuoteSummaryRequest
+
+    running, peak = [0], [0]
+
+    async def slow(q, wait_s=0.0):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        return "ok", "llm"
+
+    monkeypatch.setattr(routes, "_summarize", slow)
+    item = {"product_type": "window", "width_mm": 1000, "height_mm": 1000,
+            "material": "uPVC", "glazing": "double", "qty": 1}
+    quotes = [QuoteSummaryRequest(customer_name=f"C{i}", items=[item]) for i in range(6)]
+
+    async def scenario():
+        slots = asyncio.Semaphore(3)
+
+        async def batch():
+            return [r async for r in routes._summarize_each(quotes, 3, slots)]
+
+        return await asyncio.gather(batch(), batch(), batch())
+
+    assert all(len(out) == 6 for out in asyncio.run(scenario()))
+    assert peak[0] == 3
+
+
+def test_interactive_summary_does_not_join_a_waiting_batch_call(monkeypatch):
+    import asyncio
+
+    from ai_service.app import routes
+    from ai_service.app.models import QuoteSummaryRequest
+
+    calls = []
+
+    async def fake_llm_summary(key, system, user, wait_s=0.0):
+        calls.append(wait_s)
+        await asyncio.sleep(0.05)
+        return f"waited {wait_s:g}"
+
+    monkeypatch.setattr(routes, "USE_EXTERNAL_LLM", True)
+    monkeypatch.setattr(routes, "summary_cache", None)
+    monkeypatch.setattr(routes, "_llm_summary", fake_llm_summary)
+    item = {"product_type": "window", "width_mm": 1000, "height_mm": 1000,
+            "material": "uPVC", "glazing": "double", "qty": 1}
+    req = QuoteSummaryRequest(customer_name="Same Co", items=[item])
+
+    async def scenario():
+        return await asyncio.gather(
+            routes._summarize(req, wait_s=15), routes._summarize(req), routes._summarize(req)
+        )
+
+    batch, first, second = asyncio.run(scenario())
+    assert batch == ("waited 15", "llm")
+    assert first == second == ("waited 0", "llm")  # interactive callers coalesce only with each other
+    assert sorted(calls) == [0, 15]
+
+
+def _sse_events(body):
+    import json
+
+    events = []
+    for frame in body.strip().split("\n\n"):
+        lines = dict(ln.split(": ", 1) for ln in frame.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_summarize_stream_forwards_tokens(client, monkeypatch):
+    from ai_service.app import routes
+    from ai_service.app.hedge import provider_health
+
+    async def fake_stream(msgs, **kw):
+        for piece in ['{"te', 'xt": "Hel', 'lo\\n wor', 'ld"}']:
+            yield piece
+
+    provider_health.reset()
+    monkeypatch.setattr(routes, "USE_EXTERNAL_LLM", True)
+    monkeypatch.setattr(routes, "stream_openrouter", fake_stream)
+    payload = {
+        "customer_name": "Stream Ltd",
+        "items": [{"product_type": "window", "width_mm": 1000, "height_mm": 1200,
+                   "material": "uPVC", "glazing": "triple", "qty": 4}],
+    }
+    r = client.post("/summarize-quote/stream", json=payload)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+    events = _sse_events(r.text)
+    assert "".join(d["text"] for e, d in events if e == "token") == "Hello\n world"
+    assert events[-1] == ("done", {"text": "Hello\n world", "source": "llm"})
+
+
+def test_summarize_stream_falls_back_without_first_token(client, monkeypatch):
+    import asyncio
+
+    from ai_service.app import routes
+    from ai_service.app.hedge import provider_health
+
+    async def stalled(msgs, **kw):
+        await asyncio.sleep(5)
+        yield '{"text": "too late"}'
+
+    provider_health.reset()
+    monkeypatch.setattr(routes, "USE_EXTERNAL_LLM", True)
+    monkeypatch.setattr(routes, "STREAM_FIRST_TOKEN_S", 0.05)
+    monkeypatch.setattr(routes, "stream_openrouter", stalled)
+    payload = {
+        "customerName": "Slow Co",
+        "items": [{"productType": "door", "widthMm": 900, "heightMm": 2100,
+                   "material": "Composite", "glazing": "double", "qty": 1}],
+    }
+    events = _sse_events(client.post("/summarize-quote/stream", json=payload).text)
+    event, data = events[-1]
+    assert event == "done" and data["source"] == "fallback"
+    assert data["text"].startswith("Quotation for Slow Co")
+
+
+def test_summarize_stream_is_truncated_at_route_deadline(client, monkeypatch):
+    import asyncio
+    import time
+
+    from ai_service.app import routes
+    from ai_service.app.hedge import provider_health
+
+    async def dribbling(msgs, **kw):
+        yield '{"text": "Start'
+        while True:
+            await asyncio.sleep(0.02)
+            yield " more"
+
+    provider_health.reset()
+    monkeypatch.setattr(routes, "USE_EXTERNAL_LLM", True)
+    monkeypatch.setattr(routes, "ROUTE_DEADLINE_S", 0.2)
+    monkeypatch.setattr(routes, "stream_openrouter", dribbling)
+    payload = {
+        "customerName": "Chatty Co",
+        "items": [{"productType": "window", "widthMm": 900, "heightMm": 900,
+                   "material": "uPVC", "glazing": "double", "qty": 1}],
+    }
+    started = time.monotonic()
+    events = _sse_events(client.post("/summarize-quote/stream", json=payload).text)
+    assert time.monotonic() - started < 2
+    event, data = events[-1]
+    assert event == "done" and data["truncated"] and data["source"] == "llm"
+    assert data["text"].startswith("Start more")
+    assert provider_health["openrouter"].consecutive_failures == 0
+
+
+def test_summarize_stream_skips_provider_at_its_limit(client, monkeypatch):
+    from ai_service.app import routes
+    from ai_service.app.hedge import provider_health
+    from ai_service.app.limits import ProviderLimiter
+
+    calls = []
+
+    async def streamed(msgs, **kw):
+        calls.append(1)
+        yield '{"text": "never"}'
+
+    provider_health.reset()
+    full = ProviderLimiter(rate_per_min=0, burst=0, max_in_flight=1)
+    full.in_flight = 1
+    monkeypatch.setitem(provider_health.limits, "openrouter", full)
+    monkeypatch.setattr(routes, "USE_EXTERNAL_LLM", True)
+    monkeypatch.setattr(routes, "stream_openrouter", streamed)
+    payload = {
+        "customerName": "Busy Co",
+        "items": [{"productType": "window", "widthMm": 900, "heightMm": 900,
+                   "material": "uPVC", "glazing": "double", "qty": 1}],
+    }
+    event, data = _sse_events(client.post("/summarize-quote/stream", json=payload).text)[-1]
+    assert event == "done" and data["source"] == "fallback" and not calls
+    assert full.in_flight == 1 and full.rejected["concurrency"] == 1
+    text = client.get("/metrics").text
+    assert 'ai_llm_provider_skipped_total{provider="openrouter",reason="concurrency"} 1' in text
+    assert 'reason="rate_limited"' in text
+
+
+def test_metrics_exposes_stages_and_provider_outcomes(client, monkeypatch):
+    from ai_service.app import routes
+    from ai_service.app.hedge import provider_health
+
+    async def broken(msgs, **kw):
+        raise RuntimeError("provider down")
+
+    async def ok(msgs, **kw):
+        return '{"text": "Summary for Metrics Ltd"}'
+
+    provider_health.reset()
+    monkeypatch.setattr(routes, "USE_EXTERNAL_LLM", True)
+    monkeypatch.setattr(routes, "call_openrouter", broken)
+    monkeypatch.setattr(routes, "call_hf", ok)
+    payload = {
+        "customer_name": "Metrics Ltd",
+        "items": [{"product_type": "window", "width_mm": 1300, "height_mm": 1100,
+                   "material": "uPVC", "glazing": "double", "qty": 3}],
+    }
+    assert client.post("/summarize-quote", json=payload).json()["text"] == "Summary for Metrics Ltd"
+    client.post("/predict-quote/batch", json={"items": payload["items"]})
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    body = r.text
+    assert '# TYPE ai_stage_duration_seconds histogram' in body
+    for stage in ("validation", "prompt", "parse"):
+        assert f'ai_stage_duration_seconds_count{{route="/summarize-quote",stage="{stage}"}}' in body
+    assert 'ai_stage_duration_seconds_count{route="/predict-quote/batch",stage="normalization"}' in body
+    assert ('ai_provider_call_duration_seconds_count'
+            '{route="/summarize-quote",provider="openrouter",outcome="failure"}') in body
+    assert ('ai_provider_call_duration_seconds_count'
+            '{route="/summarize-quote",provider="hf",outcome="success"}') in body
+    assert 'ai_provider_calls_in_flight{provider="hf"} 0' in body
+    assert 'ai_http_request_duration_seconds_count{route="/summarize-quote",method="POST",status="200"}' in body
+    assert "ai_llm_pool_connections_max" in body
+
+
 def test_global_error_handler(client, monkeypatch):
     from ai_service import main as m
 
@@ -0,0 +1,444 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from ai_service.app.cache import MemoryBackend, SQLiteBackend, SummaryCache, summary_key
+from ai_service.app.facts import ACCREDITATIONS, SECURITY_TECH, _derive, facts_index
+from ai_service.app.hedge import ProviderHealth, hedged_first_success
+from ai_service.app.limits import ProviderLimiter
+from ai_service.app.models import QuoteItemIn, _norm_material, _norm_product_type
+from ai_service.app.normalize import Normalizer, load_normalizers
+from ai_service.app.rag import compact_rag, rag_line, summary_line
+from ai_service.app.tokens import estimate_tokens
+from ai_service.app.singleflight import SingleFlight
+from ai_service.app.streaming import JsonTextExtractor
+
+
+def test_summary_key_is_canonical():
+    a = summary_key("sys", "user", ["m1", "m2"])
+    assert a == summary_key("sys", "user", ("m1", "m2"))
+    assert a != summary_key("sys", "user ", ["m1", "m2"])
+    assert a != summary_key("sys", "user", ["m1", "m3"])
+
+
+def test_memory_cache_lru_ttl_and_byte_cap():
+    cache = SummaryCache(MemoryBackend(max_entries=2, max_bytes=10_000), ttl_s=60)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a") == "A"  # a is now most recent
+    cache.set("c", "C")
+    assert cache.get("b") is None and cache.get("c") == "C"
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+    small = MemoryBackend(max_entries=10, max_bytes=20)
+    small.set("k1", "x" * 10, 1e18)
+    small.set("k2", "y" * 10, 1e18)
+    assert len(small) == 1 and small.nbytes <= 20
+
+    expired = SummaryCache(MemoryBackend(10, 10_000), ttl_s=-1)
+    expired.set("a", "A")
+    assert expired.get("a") is None and len(expired.backend) == 0
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = SummaryCache(SQLiteBackend(path, max_entries=2), ttl_s=60)
+    second = SummaryCache(SQLiteBackend(path, max_entries=2), ttl_s=60)
+    first.set("a", json.dumps({"text": "hi"}))
+    assert json.loads(second.get("a")) == {"text": "hi"}
+    first.set("b", "B")
+    first.set("c", "C")
+    assert len(second.backend) == 2
+
+
+def test_sqlite_cache_reads_do_not_write_and_bytes_are_capped(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / "cache.sqlite3")
+    legacy = sqlite3.connect(path)  # file from before the byte cap
+    legacy.execute("CREATE TABLE summary_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                   "expires_at REAL NOT NULL, used_at REAL NOT NULL)")
+    legacy.execute("INSERT INTO summary_cache VALUES ('old', 'x', 9e12, 0)")
+    legacy.commit()
+    legacy.close()
+
+    backend = SQLiteBackend(path, max_entries=10, max_bytes=30, touch_interval_s=3600)
+    cache = SummaryCache(backend, ttl_s=60)
+    cache.set("a", "A" * 10)
+    cache.set("b", "B" * 10)
+    writes = backend._db.total_changes
+    assert cache.get("a") == "A" * 10 and cache.get("old") == "x"
+    assert backend._db.total_changes == writes  # recency is buffered
+    cache.set("c", "C" * 10)  # flushes "a" and "old" as recent; "b" is evicted for bytes
+    assert cache.get("b") is None and cache.get("a") and cache.get("c")
+    cache.set("huge", "H" * 100)  # larger than the cap: not stored
+    assert cache.get("huge") is None
+    assert asyncio.run(cache.aget("c")) == "C" * 10
+
+
+def test_singleflight_coalesces_identical_calls():
+    async def scenario():
+        sf, calls = SingleFlight(), []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "done"
+
+        results = await asyncio.gather(*(sf.do("k", work) for _ in range(5)))
+        assert results == ["done"] * 5 and len(calls) == 1
+        assert sf.coalesced == 4 and len(sf) == 0
+        # finished keys start a fresh call
+        assert await sf.do("k", work) == "done" and len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_singleflight_leader_cancellation_does_not_cancel_followers():
+    async def scenario():
+        sf, started = SingleFlight(), asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(0.02)
+            return "ok"
+
+        leader = asyncio.create_task(sf.do("k", work))
+        await started.wait()
+        follower = asyncio.create_task(sf.do("k", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == "ok"
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(scenario())
+
+
+def test_singleflight_cancels_work_when_all_callers_leave():
+    async def scenario():
+        sf, cancelled = SingleFlight(), asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.create_task(sf.do("k", work)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for c in callers:
+            c.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert len(sf) == 0
+
+    asyncio.run(scenario())
+
+
+def _provider(log, name, delay, result="ok"):
+    async def call():
+        log.append(name)
+        await asyncio.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return (name, call)
+
+
+def _race(branches, health):
+    return asyncio.run(hedged_first_success(branches, str.strip, 2.0, health))
+
+
+def test_hedge_only_calls_primary_when_it_is_fast():
+    health, log = ProviderHealth(default_delay_s=0.2), []
+    branches = [_provider(log, "a", 0.0, "A"), _provider(log, "b", 0.0, "B")]
+    assert _race(branches, health) == "A"
+    assert log == ["a"]
+
+
+def test_hedge_starts_second_provider_after_delay_or_failure():
+    health, log = ProviderHealth(default_delay_s=0.05), []
+    slow = [_provider(log, "a", 1.0, "A"), _provider(log, "b", 0.0, "B")]
+    assert _race(slow, health) == "B" and log == ["a", "b"]
+
+    health, log = ProviderHealth(default_delay_s=5.0), []
+    failing = [_provider(log, "a", 0.0, RuntimeError("429")), _provider(log, "b", 0.0, "B")]
+    assert _race(failing, health) == "B"
+    assert health["a"].consecutive_failures == 1
+
+
+def test_hedge_prefers_faster_provider_and_skips_open_circuits():
+    health = ProviderHealth(failure_threshold=2, cooldown_s=60)
+    health.record_success("a", 2.0)
+    health.record_success("b", 0.5)
+    assert health.order(["a", "b"]) == ["b", "a"]
+    assert health.hedge_delay("b") == max(health.min_delay_s, 0.5)
+
+    health.record_failure("b")
+    health.record_failure("b")
+    assert not health.available("b")
+    log = []
+    branches = [_provider(log, "a", 0.0, "A"), _provider(log, "b", 0.0, "B")]
+    assert _race(branches, health) == "A" and log == ["a"]
+
+    health.record_failure("a")
+    health.record_failure("a")
+    assert _race(branches, health) is None
+
+
+def test_circuit_half_open_admits_one_trial_call():
+    health = ProviderHealth(failure_threshold=1, cooldown_s=10)
+    health.record_failure("a")
+    assert not health.available("a")
+    later = time.monotonic() + 11
+    assert health.available("a", later)  # the trial call
+    assert not health.available("a", later)  # one at a time
+    health.cancel_probe("a")  # taken but never made
+    assert health.available("a", later) and not health.available("a", later)
+
+    health.record_failure("a")  # trial failed: open again
+    assert not health.available("a")
+    later = time.monotonic() + 11
+    assert health.available("a", later)
+    health.record_success("a", 0.1)
+    assert health.available("a") and health.available("a")
+
+    # a half-open provider left uncalled by the hedge race gives its probe back
+    health.record_failure("b")
+    health["b"].open_until = time.monotonic() - 1
+    log = []
+    branches = [_provider(log, "b", 1.0, "B"), _provider(log, "c", 0.0, "C")]
+    health.default_delay_s = 0.01
+    assert _race(branches, health) == "C" and log == ["c"]
+    assert health["b"].probe_since == 0.0 and health.available("b")
+
+
+def test_provider_limiter_rate_burst_and_concurrency():
+    now = [0.0]
+    lim = ProviderLimiter(rate_per_min=60, burst=2, max_in_flight=3, clock=lambda: now[0])
+    assert lim.try_acquire() and lim.try_acquire()
+    assert not lim.try_acquire()  # bucket empty
+    now[0] += 0.5
+    assert not lim.try_acquire()
+    now[0] += 0.5  # one token a second
+    assert lim.try_acquire() and lim.in_flight == 3
+    now[0] += 10
+    assert not lim.try_acquire()  # tokens again, but three calls in flight
+    lim.release()
+    assert lim.try_acquire()
+    assert lim.rejected == {"rate": 2, "concurrency": 1}
+    assert lim.stats()["tokens"] == 1.0
+
+    unlimited = ProviderLimiter(rate_per_min=0, burst=0, max_in_flight=0)
+    assert all(unlimited.try_acquire() for _ in range(1000))
+
+
+def test_hedge_skips_provider_without_capacity_immediately():
+    limits = {"a": ProviderLimiter(rate_per_min=0.001, burst=1, max_in_flight=0)}
+    health, log = ProviderHealth(default_delay_s=5.0, limits=limits), []
+    health.record_success("b", 1.0)  # "a" stays first choice
+    branches = [_provider(log, "a", 0.0, "A"), _provider(log, "b", 0.01, "B")]
+    assert _race(branches, health) == "A"
+    started = time.monotonic()
+    assert _race(branches, health) == "B"  # "a" is not called and its hedge delay not waited
+    assert time.monotonic() - started < 1.0
+    assert log == ["a", "b"] and limits["a"].rejected["rate"] == 1
+    assert health["a"].consecutive_failures == 0  # a skip is not a failure
+
+    limits["b"] = health.limits["b"] = ProviderLimiter(rate_per_min=0, burst=0, max_in_flight=1)
+    limits["b"].in_flight = 1
+    assert _race(branches, health) is None and log == ["a", "b"]
+
+
+def test_provider_limiter_acquire_waits_for_a_token_above_the_reserve():
+    lim = ProviderLimiter(rate_per_min=600, burst=2, max_in_flight=0)  # a token every 0.1 s
+    assert lim.try_acquire() and lim.try_acquire()
+
+    async def run():
+        started = time.monotonic()
+        assert await lim.acquire(1.0)  # waits for two tokens so one is left over
+        waited = time.monotonic() - started
+        assert lim.try_acquire()  # the reserved token is still there
+        assert not await lim.acquire(0.05)
+        return waited
+
+    assert 0.15 < asyncio.run(run()) < 0.5
+    assert lim.in_flight == 4 and lim.rejected == {"rate": 1, "concurrency": 0}
+
+
+def test_hedge_with_wait_s_uses_free_provider_then_waits_for_first_to_free_up():
+    limits = {
+        "a": ProviderLimiter(rate_per_min=300, burst=1, max_in_flight=0),  # a token every 0.2 s
+        "b": ProviderLimiter(rate_per_min=30, burst=1, max_in_flight=0),  # every 2 s
+    }
+    health, log = ProviderHealth(default_delay_s=5.0, limits=limits), []
+    health.record_success("b", 1.0)  # "a" stays first choice
+    branches = [_provider(log, "a", 0.0, "A"), _provider(log, "b", 0.0, "B")]
+
+    def race():
+        return asyncio.run(hedged_first_success(branches, str.strip, 2.0, health, wait_s=1.0))
+
+    assert limits["a"].try_acquire()
+    started = time.monotonic()
+    assert race() == "B" and log == ["b"]  # first choice empty: the other is used at once
+    assert time.monotonic() - started < 0.1
+    assert race() == "A" and log == ["b", "a"]  # both empty: "a" refills first
+    assert limits["a"].rejected["rate"] == limits["b"].rejected["rate"] == 0
+    assert _race(branches, health) is None  # without wait_s, both are skipped
+    assert limits["a"].rejected["rate"] == limits["b"].rejected["rate"] == 1
+
+
+def test_hedge_releases_slots_of_cancelled_losers():
+    limits = {"a": ProviderLimiter(0, 0, 1), "b": ProviderLimiter(0, 0, 1)}
+    health, log = ProviderHealth(default_delay_s=0.01, limits=limits), []
+    branches = [_provider(log, "a", 1.0, "A"), _provider(log, "b", 0.0, "B")]
+    assert _race(branches, health) == "B" and log == ["a", "b"]
+    assert limits["a"].in_flight == 0 and limits["b"].in_flight == 0
+
+
+def _extract(chunks):
+    ex = JsonTextExtractor()
+    out = "".join(ex.feed(c) for c in chunks) + ex.finish()
+    assert out == ex.text
+    return out
+
+
+def test_json_text_extractor_handles_arbitrary_splits():
+    doc = '{"text": "Line one\\nQuote \\"A\\" \\u00a3100 \\\\ ok", "extra": 1}'
+    expected = 'Line one\nQuote "A" \u00a3100 \\ ok'
+    assert _extract([doc]) == expected
+    assert _extract(list(doc)) == expected
+    assert _extract(["```json\n", doc[:5], doc[5:], "\n```"]) == expected
+
+
+def test_json_text_extractor_plain_text_and_missing_field():
+    assert _extract(["  Plain ", "summary."]) == "Plain summary."
+    assert _extract(['{"summary"', ': "x"}']) == ""
+
+
+def test_facts_index_union_matches_per_item_dedup():
+    import random
+
+    rng = random.Random(7)
+    combos = [
+        (rng.choice(["window", "door", "conservatory"]),
+         rng.choice(["uPVC", "Aluminium", "Composite"]),
+         rng.choice(["double", "triple"]))
+        for _ in range(300)
+    ]
+    seen, expected = set(), []
+    for c in combos:
+        for f in _derive(*c):
+            if f not in seen:
+                seen.add(f)
+                expected.append(f)
+    assert facts_index.union(combos) == expected
+    # combinations outside the precomputed domain still resolve
+    assert facts_index.union([("window", None, None)]) == _derive("window", None, None)
+
+
+def test_facts_index_selects_accreditation_and_security_groups():
+    out = facts_index.union([("door", "Composite", "double")], groups=["accreditations", "Kubu"])
+    assert out[-len(ACCREDITATIONS) - len(SECURITY_TECH["Kubu"]):] == ACCREDITATIONS + SECURITY_TECH["Kubu"]
+    assert len(out) == len(set(out))
+
+
+def test_items_are_normalised_once_at_validation():
+    it = QuoteItemIn(productType="Bifold Door", widthMm=1500, heightMm=2000, material="upvc",
+                     glazing="TRIPLE", colorTier="Premium", qty=2)
+    n = it.norm
+    assert (n.product_type, n.material, n.glazing, n.area) == ("door", "uPVC", "triple", 3.0)
+    assert rag_line(n) == (
+        "- product_id=n/a type=door size=1500x2000mm (3.00 m²) material=uPVC glazing=triple "
+        "color=Premium hardware=— install=— qty=2"
+    )
+    assert summary_line(1, n) == "1) 2× door uPVC triple (1500×2000mm ~ 3.00 m²) , colour Premium"
+
+
+def _norms(rows):
+    return [QuoteItemIn(material="uPVC", glazing="double", **r).norm for r in rows]
+
+
+def test_compact_rag_keeps_item_lines_when_within_budget():
+    items = _norms([{"width_mm": 900, "height_mm": 1200, "qty": 1},
+                    {"width_mm": 600, "height_mm": 600, "qty": 2}])
+    text, tokens = compact_rag(items, budget=10_000)
+    assert text.splitlines() == [rag_line(n) for n in items]
+    assert tokens == estimate_tokens(text)
+
+
+def test_compact_rag_groups_configurations_and_honours_budget():
+    rows = [{"width_mm": 600 + i, "height_mm": 900, "qty": 2} for i in range(200)]
+    rows += [{"product_type": "door", "width_mm": 900, "height_mm": 2100 + i, "qty": 1} for i in range(50)]
+    text, tokens = compact_rag(_norms(rows), budget=200)
+    lines = text.splitlines()
+    assert lines[0].startswith("- qty=400 type=window material=uPVC glazing=double")
+    assert "width=600-799mm height=900mm lines=200" in lines[0]
+    assert "qty=50 type=door" in lines[1] and "height=2100-2149mm" in lines[1]
+    assert tokens <= 200
+
+    # budget below two groups: the smaller one is summarised instead of listed
+    text, tokens = compact_rag(_norms(rows), budget=80)
+    lines = text.splitlines()
+    assert len(lines) == 2 and "qty=400" in lines[0]
+    assert lines[1] == "- ... 1 more configurations (50 units over 50 lines) not listed"
+    assert tokens <= 80
+
+
+def test_estimate_tokens_tracks_bpe_counts():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("Hello world") == 2
+    assert estimate_tokens("1234567") == 3  # digits group in threes
+    assert estimate_tokens("size=1200x900mm") > len("size=1200x900mm".split())
+
+
+def test_compact_rag_sums_line_counts_on_every_path():
+    rows = [{"width_mm": 600 + i, "height_mm": 900 + 7 * i, "qty": 1 + i % 3,
+             "product_type": ("window", "door", "bifold door")[i % 3],
+             "color_tier": (None, "Premium")[i % 2]} for i in range(120)]
+    items = _norms(rows)
+    for budget in (60, 150, 400, 10_000, 50_000):  # elided, grouped, counted, byte bound
+        text, tokens = compact_rag(items, budget)
+        assert tokens == estimate_tokens(text) <= budget
+    for text in ("m² × 3", "a\n\n\tb", "x" * 40, "—é"):
+        assert estimate_tokens(text) <= len(text.encode())
+
+
+@pytest.mark.parametrize("raw, expected", [
+    (None, "window"), ("", "window"), (" Window ", "window"), ("Bifold Door", "door"),
+    ("French windows", "door"), ("conservatory door", "door"), ("Orangery", "conservatory"),
+    ("lantern roof", "conservatory"), ("Sash", "window"), ("garage", "window"),
+])
+def test_product_type_synonyms_and_precedence(raw, expected):
+    assert _norm_product_type(raw) == expected
+
+
+def test_material_synonyms_default_and_cache():
+    assert [_norm_material(x) for x in ("upvc", "ALUMINUM", "composite", "oak", None)] == [
+        "uPVC", "Aluminium", "Composite", "uPVC", "uPVC"]
+    n = Normalizer("glazing", "double", {"triple": "triple"}, cache_size=2)
+    assert n("Triple") is n("Triple") == "triple"
+    n("a"), n("b")
+    assert len(n._cache) <= 2
+
+
+def test_synonym_tables_load_from_file_and_reject_unknown_values(tmp_path):
+    spec = {
+        "product_type": {"default": "window", "exact": {},
+                         "contains": [["conservatory", ["garden room"]]]},
+        "material": {"default": "uPVC", "exact": {"timber-look": "Composite"}},
+        "glazing": {"default": "double", "exact": {}},
+    }
+    path = tmp_path / "synonyms.json"
+    path.write_text(json.dumps(spec))
+    norms = load_normalizers(path)
+    assert norms["product_type"]("Garden Room") == "conservatory"
+    assert norms["material"]("Timber-look") == "Composite"
+
+    spec["glazing"]["default"] = "single"
+    path.write_text(json.dumps(spec))
+    with pytest.raises(ValueError):
+        load_normalizers(path)
@@ -0,0 +1,253 @@
+import asyncio
+import json
+
+import numpy as np
+import pandas as pd
+
+import pytest
+
+from ai_service.app import artifact, pricing
+from ai_service.app.batcher import MicroBatcher
+from ai_service.app.executor import PricingExecutor, PricingSaturated
+from ai_service.app.kernel import compile_kernel, parity_error
+from ai_service.app.pricing import (
+    PARITY_TOL,
+    _training,
+    iter_training,
+    predict_features,
+    kernel,
+    model,
+    train,
+)
+
+
+def test_kernel_matches_pipeline():
+    X = _training(n=2000, seed=7)
+    assert parity_error(model, kernel, X) <= PARITY_TOL
+    assert parity_error(model, compile_kernel(model), X) <= PARITY_TOL
+
+
+def test_kernel_unknown_category_matches_pipeline():
+    X = _training(n=50, seed=3)
+    X["color_tier"] = "Gold"
+    X["material"] = "Timber"
+    assert parity_error(model, kernel, X) <= PARITY_TOL
+
+
+def test_unknown_tiers_price_as_no_tier():
+    row = _training(n=1, seed=3)[kernel.columns].to_dict("records")[0]
+    base = {**row, "color_tier": None, "hardware_tier": None, "install_complexity": None}
+    odd = {**row, "color_tier": "Gold", "hardware_tier": "premium", "install_complexity": "Tricky"}
+    premium = {**base, "color_tier": "Premium"}
+    assert kernel.predict_one(odd) == kernel.predict_one(base)
+    assert kernel.predict_one(premium) > kernel.predict_one(base)
+
+
+def test_artifact_trains_once_then_loads(tmp_path):
+    path = tmp_path / "pricing.pkl"
+    spec = {"n": 300, "seed": 1, "rev": 1}
+    calls = []
+
+    def build():
+        calls.append(1)
+        return train(n=300, seed=1)
+
+    _, k1 = artifact.load_or_build(path, spec, build)
+    _, k2 = artifact.load_or_build(path, spec, build)
+    assert len(calls) == 1
+    assert k1.intercept == k2.intercept
+
+    # stale spec and corrupt payload both force a rebuild
+    artifact.load_or_build(path, {**spec, "rev": 2}, build)
+    assert len(calls) == 2
+    path.write_bytes(path.read_bytes() + b"x")
+    artifact.load_or_build(path, {**spec, "rev": 2}, build)
+    assert len(calls) == 3
+    meta = json.loads(path.with_name("pricing.pkl.json").read_text())
+    assert meta["spec"]["rev"] == 2 and meta["format"] == artifact.ARTIFACT_FORMAT
+
+
+def _reference_training(n, seed):
+    """The original row-at-a-time generator, kept as the statistical reference."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(n):
+        pt = rng.choice(["window", "door", "conservatory"])
+        mat = rng.choice(["uPVC", "Aluminium", "Composite"])
+        glz = rng.choice(["double", "triple"])
+        w, h = int(rng.integers(600, 2400)), int(rng.integers(600, 2400))
+        qty = int(rng.integers(1, 5))
+        col = rng.choice([None, "Standard", "Premium"])
+        hw = rng.choice([None, "Standard", "Premium"])
+        ins = rng.choice([None, "Standard", "Complex"])
+        area = (w * h) / 1_000_000.0
+        base = {"window": 260, "door": 850, "conservatory": 400}[pt]
+        unit = base * (1.0 + (0.5 if pt != "conservatory" else 2.0) * area)
+        unit *= {"uPVC": 1.0, "Aluminium": 1.30, "Composite": 1.15}[mat]
+        unit *= {"double": 1.00, "triple": 1.18}[glz]
+        unit *= {"Premium": 1.10}.get(col, 1.0) * {"Premium": 1.08}.get(hw, 1.0)
+        unit *= {"Complex": 1.20}.get(ins, 1.0)
+        unit = max(80, unit + rng.normal(0, unit * 0.05))
+        rows.append(dict(product_type=pt, unit_price=unit, area=area, qty=qty))
+    return pd.DataFrame(rows)
+
+
+def test_vectorized_training_matches_reference_distribution():
+    new, ref = _training(n=20000, seed=11), _reference_training(20000, 11)
+    assert abs(new.unit_price.mean() / ref.unit_price.mean() - 1) < 0.02
+    assert abs(new.unit_price.std() / ref.unit_price.std() - 1) < 0.03
+    for col in ("area", "qty"):
+        assert abs(new[col].mean() / ref[col].mean() - 1) < 0.02
+    by_type = new.groupby("product_type").unit_price.mean()
+    ref_by_type = ref.groupby("product_type").unit_price.mean()
+    assert np.allclose(by_type, ref_by_type[by_type.index], rtol=0.03)
+
+
+def test_training_is_chunked_and_seeded():
+    chunks = list(iter_training(n=1050, seed=5, chunk_size=500))
+    assert [len(c) for c in chunks] == [500, 500, 50]
+    pd.testing.assert_frame_equal(_training(n=300, seed=5), _training(n=300, seed=5))
+
+
+@pytest.mark.parametrize("backend", ["inline", "thread", "process"])
+def test_pricing_executor_backends_agree(backend):
+    feats = _training(n=20, seed=9)[kernel.columns].to_dict("records")
+    ex = PricingExecutor(backend=backend, workers=1, max_pending=4)
+    try:
+        out = asyncio.run(ex.run(predict_features, feats))
+    finally:
+        ex.shutdown()
+    assert out == predict_features(feats)
+
+
+def test_pricing_executor_rejects_when_saturated():
+    async def scenario():
+        ex = PricingExecutor(backend="thread", workers=1, max_pending=1, retry_after_s=2)
+        gate = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        def blocked():
+            asyncio.run_coroutine_threadsafe(gate.wait(), loop).result()
+            return "done"
+
+        first = asyncio.create_task(ex.run(blocked))
+        await asyncio.sleep(0.01)
+        with pytest.raises(PricingSaturated) as e:
+            await ex.run(predict_features, [])
+        assert e.value.retry_after_s == 2 and ex.rejected == 1
+        gate.set()
+        assert await first == "done"
+        ex.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_micro_batcher_merges_concurrent_submissions():
+    calls = []
+
+    async def run(rows):
+        calls.append(list(rows))
+        return [float(r) * 10 for r in rows]
+
+    async def scenario():
+        b = MicroBatcher(run, window_s=0.01, max_items=100)
+        out = await asyncio.gather(b.submit([1, 2]), b.submit([3]), b.submit([4, 5, 6]))
+        assert out == [[10.0, 20.0], [30.0], [40.0, 50.0, 60.0]]
+        assert calls == [[1, 2, 3, 4, 5, 6]]
+        st = b.stats()
+        assert st["batch_size"]["count"] == 1 and st["batch_size"]["buckets"]["8"] == 1
+        assert st["queue_delay_ms"]["count"] == 3
+
+        # a full batch flushes without waiting for the window
+        b = MicroBatcher(run, window_s=10, max_items=2)
+        assert await asyncio.wait_for(b.submit([7, 8]), 1) == [70.0, 80.0]
+
+    asyncio.run(scenario())
+
+
+def test_micro_batcher_propagates_failures_to_every_caller():
+    async def run(rows):
+        raise PricingSaturated(1)
+
+    async def scenario():
+        b = MicroBatcher(run, window_s=0.005, max_items=100)
+        res = await asyncio.gather(b.submit([1]), b.submit([2]), return_exceptions=True)
+        assert all(isinstance(r, PricingSaturated) for r in res)
+
+    asyncio.run(scenario())
+
+
+def test_load_training_reads_and_normalises_exports(tmp_path):
+    path = tmp_path / "won.csv"
+    pd.DataFrame({
+        "product_type": ["Casement Window", None, "conservatory"],
+        "material": ["upvc", "aluminium", "Aluminium"],
+        "glazing": ["Double Glazed", "triple", None],
+        "width_mm": [1200, 900, 3000],
+        "height_mm": [900, 2100, None],
+        "unit_price": [420.0, 1300.0, 9000.0],
+        "color_tier": ["Premium", None, None],
+    }).to_csv(path, index=False)
+    df = pricing.load_training(str(path))
+    assert len(df) == 2  # the row without a height is dropped
+    assert df["product_type"].tolist() == ["window", "window"]
+    assert df["material"].tolist() == ["uPVC", "Aluminium"]
+    assert df["glazing"].tolist() == ["double", "triple"]
+    assert df["color_tier"].tolist() == ["Premium", None]
+    assert df["qty"].tolist() == [1, 1] and df["area"].tolist() == [1.08, 1.89]
+
+
+def test_retrain_accepts_only_candidates_within_tolerance():
+    candidate, report = pricing.retrain("synthetic", holdout=0.2, tolerance=0.05, seed=43)
+    assert report["accepted"] and candidate is not None
+    assert report["rows"] == 5000 and report["holdout_rows"] == 1000
+    assert report["candidate_version"] == pricing.kernel_version(candidate[1])
+    assert report["active_version"] == pricing.model_version()
+
+    # demanding a 50% lower holdout error rejects an equally good fit
+    candidate, report = pricing.retrain("synthetic", holdout=0.2, tolerance=-0.5, seed=43)
+    assert candidate is None and not report["accepted"]
+
+    with pytest.raises(ValueError):
+        pricing.retrain("synthetic", holdout=0.99)
+
+
+def test_accepted_model_is_persisted_and_adopted(tmp_path, monkeypatch):
+    path = tmp_path / "pricing.pkl"
+    monkeypatch.setattr(pricing, "MODEL_ARTIFACT_PATH", str(path))
+    monkeypatch.setattr(pricing, "_active", None)
+    monkeypatch.setattr(pricing, "_stored_version", None)
+    original = pricing.ensure_loaded()  # trains into the empty path
+    assert artifact.read_meta(path)["version"] == original.version
+
+    candidate, _ = pricing.retrain("synthetic", seed=45)
+    entry = pricing.activate(*candidate, source="synthetic")
+    assert pricing.persist(entry, source="synthetic")
+    meta = artifact.read_meta(path)
+    assert meta["version"] == entry.version != original.version and meta["source"] == "synthetic"
+
+    # a restart serves the persisted model
+    monkeypatch.setattr(pricing, "_active", None)
+    assert pricing.ensure_loaded().version == entry.version
+
+    # a replica still on the old model adopts it at its next sync
+    pricing.activate(original.model, original.kernel, source="artifact")
+    monkeypatch.setattr(pricing, "_stored_version", original.version)
+    assert pricing.ensure_loaded().version == original.version  # not due yet
+    monkeypatch.setattr(pricing, "_synced_at", 0.0)
+    assert pricing.ensure_loaded().version == entry.version
+
+
+def test_process_workers_pick_up_swapped_kernel():
+    candidate, _ = pricing.retrain("synthetic", seed=44)
+    new_kernel = candidate[1]
+    feats = _training(n=20, seed=9)[kernel.columns].to_dict("records")
+    ex = PricingExecutor(backend="process", workers=1, max_pending=4)
+    try:
+        before = asyncio.run(ex.run(predict_features, feats))
+        ex.reload(new_kernel.to_state())
+        after = asyncio.run(ex.run(predict_features, feats))
+    finally:
+        ex.shutdown()
+    assert before == kernel.predict(feats).tolist()
+    assert after == new_kernel.predict(feats).tolist() != before